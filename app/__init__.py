@@ -1,23 +1,35 @@
 # -*- coding: utf-8 -*-
 """
 app package - מודולים לאפליקציית תכנון פיננסי לקהילה
+
+הייבוא עצל (PEP 562): `import app.core` לא טוען את streamlit או plotly,
+ורק גישה לפונקציות ה-UI טוענת את המודולים שתלויים בהם.
 """
 
-from .state import init_session_state, render_sidebar
-from .existing import compute_existing_projection, get_default_existing_loans
-from .new import compute_new_projection
-from .projection import compute_projections
-from .ui_tabs import render_existing_tab, render_new_tab, render_combined_tab
+import importlib
+
+_EXPORTS = {
+    'init_session_state': 'state',
+    'render_sidebar': 'state',
+    'compute_existing_projection': 'existing',
+    'compute_existing_projection_vectorized': 'existing',
+    'get_default_existing_loans': 'existing',
+    'compute_new_projection': 'new',
+    'compute_new_projection_vectorized': 'new',
+    'ScenarioParams': 'core',
+    'ProjectionResult': 'core',
+    'run': 'core',
+    'compute_projections': 'projection',
+    'render_existing_tab': 'ui_tabs',
+    'render_new_tab': 'ui_tabs',
+    'render_combined_tab': 'ui_tabs',
+}
+
+__all__ = list(_EXPORTS)
 
-__all__ = [
-    'init_session_state',
-    'render_sidebar',
-    'compute_existing_projection',
-    'get_default_existing_loans',
-    'compute_new_projection',
-    'compute_projections',
-    'render_existing_tab',
-    'render_new_tab',
-    'render_combined_tab',
-]
 
+def __getattr__(name):
+    if name in _EXPORTS:
+        module = importlib.import_module(f'.{_EXPORTS[name]}', __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
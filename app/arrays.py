@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+arrays.py - כלי עזר וקטוריים משותפים למנועי החישוב
+
+פונקציות קטנות מעל NumPy שמשמשות את המנועים הווקטוריים:
+- המרת טבלת פיזור גיל נישואין למערכים
+- סכומי חלון על סכום מצטבר (prefix sum)
+- הוספת ערכים לטווחים בעזרת מערך הפרשים (difference array)
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Optional, Tuple
+
+
+def distribution_arrays(
+    distribution_mode: str,
+    distribution_df: Optional[pd.DataFrame]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    המרת טבלת פיזור למערכי סטיות ואחוזים
+
+    זהה ללוגיקה של המנועים המקוריים: ללא פיזור → (0, 100%),
+    אחרת רק שורות עם אחוז חיובי, לפי סדר הטבלה.
+
+    Returns:
+        tuple: (סטיות בשנים כ-int, אחוזים כ-float)
+    """
+    if distribution_mode == "none" or distribution_df is None:
+        return np.array([0], dtype=np.int64), np.array([100.0])
+
+    pct = distribution_df['אחוז'].to_numpy(dtype=float)
+    mask = pct > 0
+    offsets = distribution_df['סטייה_שנים'].to_numpy()[mask].astype(float).astype(np.int64)
+    return offsets, pct[mask]
+
+
+def unique_offsets(offsets: np.ndarray, pct: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    השארת המופע האחרון לכל סטייה
+
+    מודל הקוהורטות שומר תתי-קוהורטות במילון לפי סטייה, כך שסטייה שמופיעה
+    פעמיים בטבלה דורסת את הקודמת.
+    """
+    _, last = np.unique(offsets[::-1], return_index=True)
+    keep = np.sort(len(offsets) - 1 - last)
+    return offsets[keep], pct[keep]
+
+
+def prefix_sum(values: np.ndarray) -> np.ndarray:
+    """סכום מצטבר עם אפס מוביל לאורך הציר האחרון (אורך n+1)"""
+    pad = np.zeros(values.shape[:-1] + (1,), dtype=float)
+    return np.concatenate([pad, np.cumsum(values, axis=-1, dtype=float)], axis=-1)
+
+
+def gather(prefix: np.ndarray, index: np.ndarray) -> np.ndarray:
+    """
+    שליפת ערכים מ-prefix (..., n+1) לפי אינדקסים (..., D, Y)
+
+    ממדי האצווה המובילים של prefix ושל index משודרים זה מול זה.
+    """
+    if index.ndim == 2:
+        # אינדקסים משותפים לכל האצווה - שליפה ישירה בלי לשכפל אותם
+        return prefix[..., index]
+    batch_shape = np.broadcast_shapes(prefix.shape[:-1], index.shape[:-2])
+    prefix = np.broadcast_to(prefix, batch_shape + prefix.shape[-1:])
+    index = np.broadcast_to(index, batch_shape + index.shape[-2:])
+    return np.take_along_axis(prefix[..., None, :], index, axis=-1)
+
+
+def range_add(
+    values: np.ndarray,
+    starts: np.ndarray,
+    stops: np.ndarray,
+    length: int
+) -> np.ndarray:
+    """
+    הוספת כל ערך לכל התאים בטווח [start, stop) בעזרת מערך הפרשים
+
+    values, starts ו-stops משודרים לצורה משותפת (..., K); כל אחד מ-K
+    הערכים נוסף לטווח שלו. העלות היא O(K + length) לכל שורת אצווה,
+    במקום O(K × length) בלולאה ישירה.
+
+    Returns:
+        מערך (..., length) עם סכום התרומות לכל תא
+    """
+    values, starts, stops = np.broadcast_arrays(
+        np.asarray(values, dtype=float), np.asarray(starts), np.asarray(stops)
+    )
+    batch_shape = values.shape[:-1]
+    rows = int(np.prod(batch_shape, dtype=np.int64))
+    width = length + 1
+
+    starts = np.clip(starts, 0, length).astype(np.int64).reshape(rows, -1)
+    stops = np.clip(stops, 0, length).astype(np.int64).reshape(rows, -1)
+    stops = np.maximum(stops, starts)
+    values = values.reshape(rows, -1)
+
+    row_base = (np.arange(rows) * width)[:, None]
+    diff = np.bincount(
+        np.concatenate([(row_base + starts).ravel(), (row_base + stops).ravel()]),
+        weights=np.concatenate([values.ravel(), -values.ravel()]),
+        minlength=rows * width
+    ).reshape(rows, width)
+
+    return np.cumsum(diff[:, :length], axis=-1).reshape(batch_shape + (length,))
+
+
+def truncate(values: np.ndarray) -> np.ndarray:
+    """קיצוץ לכיוון אפס כמו int() של פייתון"""
+    return np.trunc(values).astype(np.int64)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+cache.py - שמירת תוצאות תחזית לפי hash של תוכן התרחיש
+
+כל rerun של Streamlit (גם הזזת slider של שנים להצגה או מעבר טאב) היה מחשב
+את התחזיות מחדש. כאן התוצאה נשמרת לפי hash יציב של כל הקלטים, כולל תוכן
+הטבלאות, כך שתרחיש זהה לא מריץ את המנועים שוב.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import fields
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from .core import ProjectionResult, ScenarioParams, run
+
+
+# גרסת המנועים - שינוי בלוגיקת החישוב צריך להעלות אותה כדי לפסול hash ישנים
+ENGINE_VERSION = 1
+
+
+def _hash_value(digest, value) -> None:
+    """הוספת ערך בודד ל-hash בצורה קנונית"""
+    if isinstance(value, pd.DataFrame):
+        digest.update(b'df')
+        digest.update(json.dumps([str(c) for c in value.columns]).encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(value, index=False).to_numpy().tobytes())
+    elif isinstance(value, (np.integer, np.floating, np.bool_)):
+        digest.update(json.dumps(value.item()).encode('utf-8'))
+    else:
+        digest.update(json.dumps(value).encode('utf-8'))
+
+
+def scenario_hash(params: ScenarioParams) -> str:
+    """
+    hash יציב של כל קלטי התרחיש
+
+    שני תרחישים עם אותם ערכים ואותו תוכן טבלאות מקבלים אותו hash,
+    גם אם אלה אובייקטים שונים בזיכרון.
+    """
+    digest = hashlib.sha256(f'engine-v{ENGINE_VERSION}'.encode('utf-8'))
+    for f in fields(params):
+        digest.update(f.name.encode('utf-8'))
+        _hash_value(digest, getattr(params, f.name))
+    return digest.hexdigest()
+
+
+def content_hash(*values) -> str:
+    """hash יציב של ערכים וטבלאות כלשהם (למשל הקלטים של גרף)"""
+    digest = hashlib.sha256()
+    for value in values:
+        _hash_value(digest, value)
+    return digest.hexdigest()
+
+
+class ProjectionCache:
+    """
+    מטמון LRU חסום לתוצאות תחזית, עם מוני פגיעות והחטאות
+
+    בטוח לשימוש ממספר סשנים במקביל (Streamlit מריץ כל סשן ב-thread נפרד).
+    התוצאות משותפות בין הקוראים - אין לשנות את הטבלאות שמוחזרות.
+    """
+
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_compute(
+        self,
+        params: ScenarioParams,
+        compute: Callable[[ScenarioParams], Any] = run,
+        namespace: str = ''
+    ) -> Any:
+        """
+        החזרת תוצאה מהמטמון, או חישוב ושמירה אם אינה קיימת
+
+        Args:
+            params: פרמטרי התרחיש
+            compute: פונקציית החישוב (ברירת מחדל: core.run)
+            namespace: תוספת למפתח, לתוצאות שתלויות גם בהגדרות נוספות
+        """
+        return self.get_or_build(namespace + scenario_hash(params), lambda: compute(params))
+
+    def get_or_build(self, key: str, build: Callable[[], Any]) -> Any:
+        """כמו get_or_compute, למפתח שחושב מראש (לא תרחיש)"""
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+
+        result = build()
+
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return result
+
+    def lookup(self, params: ScenarioParams, namespace: str = '') -> Optional[Any]:
+        """תוצאה מהמטמון בלי לחשב (None בהחטאה)"""
+        key = namespace + scenario_hash(params)
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+        return None
+
+    def put(self, params: ScenarioParams, result: Any, namespace: str = '') -> None:
+        """הכנסת תוצאה שחושבה מחוץ למטמון (למשל במאגר תהליכים)"""
+        key = namespace + scenario_hash(params)
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """ריקון המטמון ואיפוס המונים"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        """מוני פגיעות/החטאות וגודל נוכחי"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
+
+
+# מטמון משותף לכל הסשנים בתהליך
+projection_cache = ProjectionCache()
+
+
+def run_cached(params: ScenarioParams) -> ProjectionResult:
+    """core.run עם המטמון המשותף"""
+    return projection_cache.get_or_compute(params)
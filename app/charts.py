@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+charts.py - בניית traces לגרפים עם מטען קטן לדפדפן
+
+כל גרף בטאבים נשלח לדפדפן בכל rerun. בתחזית שנתית של 50 שנה זה זניח, אבל
+באופק ארוך, בתזרים חודשי או ברצועות מונטה קרלו המטען והרינדור בצד הלקוח
+(במיוחד בנייד) הופכים לצוואר הבקבוק. כאן:
+- סדרה ארוכה מ-POINT_BUDGET נקודות מדוללת ב-LTTB (שומר על צורת הקו),
+  והמינימום והמקסימום נשמרים תמיד
+- קו עם יותר מ-WEBGL_MIN_POINTS נקודות מצויר ב-Scattergl (WebGL) במקום SVG
+- ערכים מעוגלים ונשלחים כמערכי numpy שלמים וקטנים (int16/int32), ש-plotly
+  מקודד בבינארי (bdata)
+- צבע לפי סימן (כחול/אדום) נקבע בסקאלת צבעים על הערכים עצמם, ולא ברשימת
+  מחרוזת צבע לכל נקודה
+- גרפים נשמרים במטמון לפי hash של הנתונים שלהם (cached_figures), כך ש-rerun
+  שלא שינה את הנתונים של טאב לא בונה את הגרפים שלו מחדש
+"""
+
+from typing import Any, Callable, Optional, Sequence, Tuple
+
+import numpy as np
+import plotly.graph_objects as go
+
+from .cache import ProjectionCache, content_hash
+
+
+POINT_BUDGET = 1500        # מקסימום נקודות לסדרה אחרי דילול
+WEBGL_MIN_POINTS = 400     # מכאן ומעלה - Scattergl
+MARKER_MAX_POINTS = 120    # מעבר לזה סמנים רק מעמיסים, ומוצג קו בלבד
+
+# מקרא אופקי מעל הגרף (כמו בכל הטאבים)
+HORIZONTAL_LEGEND = dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+
+
+# =============================================================================
+# דילול ודחיסה
+# =============================================================================
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, budget: int) -> np.ndarray:
+    """
+    אינדקסים שנבחרים ב-Largest-Triangle-Three-Buckets
+
+    הנקודה הראשונה והאחרונה נשמרות; מכל דלי באמצע נבחרת הנקודה שיוצרת את
+    המשולש הגדול ביותר עם הנקודה שנבחרה קודם וממוצע הדלי הבא.
+
+    Returns:
+        אינדקסים ממוינים, לכל היותר budget
+    """
+    n = len(x)
+    if budget >= n or budget < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = (np.arange(budget - 1) * (n - 2) / (budget - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+    chosen = np.empty(budget, dtype=np.int64)
+    chosen[0], chosen[-1] = 0, n - 1
+    previous = 0
+    for i in range(budget - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        chosen[i + 1] = previous
+    return chosen
+
+
+def downsample(x: Sequence, y: Sequence, budget: int = POINT_BUDGET) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    הסדרה כמו שהיא, או מדוללת ב-LTTB אם היא ארוכה מ-budget
+
+    המינימום והמקסימום הגלובליים נשמרים תמיד (היתרה המינימלית היא המדד
+    המרכזי, ו-LTTB לבדו לא מבטיח אותה).
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(x) <= budget:
+        return x, y
+    keep = np.union1d(lttb_indices(x, y, budget - 2), [np.argmin(y), np.argmax(y)])
+    return x[keep], y[keep]
+
+
+def compact(values: Sequence, decimals: int = 0) -> np.ndarray:
+    """
+    עיגול למספר הספרות שמוצגות בפועל, ומערך שלם קטן ככל האפשר כשהערכים שלמים
+
+    שנים נשלחות כ-int16 (2 בתים לנקודה) ושקלים כ-int32 (4 בתים), במקום
+    float64 או ~15 תווים לנקודה ב-JSON.
+    """
+    values = np.round(np.asarray(values, dtype=float), decimals)
+    if not len(values) or not np.isfinite(values).all() or (values != np.trunc(values)).any():
+        return values
+    for dtype in (np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= values.min() and values.max() <= info.max:
+            return values.astype(dtype)
+    return values
+
+
+def sign_marker(values: np.ndarray, positive: str, negative: str) -> dict:
+    """
+    צבע לפי סימן בסקאלה דו-צבעית (במקום רשימת מחרוזת צבע לכל נקודה)
+
+    נשלח רק הסימן של כל ערך (int8): שלילי צבוע negative וכל ערך אחר positive.
+    """
+    return dict(
+        color=np.where(np.asarray(values) < 0, -1, 1).astype(np.int8),
+        colorscale=[[0, negative], [0.5, negative], [0.5, positive], [1, positive]],
+        cmin=-1, cmax=1
+    )
+
+
+# =============================================================================
+# traces
+# =============================================================================
+
+def line(
+    x: Sequence,
+    y: Sequence,
+    name: Optional[str] = None,
+    color: Optional[str] = None,
+    width: float = 3,
+    markers: bool = False,
+    sign_colors: Optional[Tuple[str, str]] = None,
+    decimals: int = 0,
+    dash: Optional[str] = None,
+    budget: int = POINT_BUDGET,
+    **kwargs
+):
+    """
+    trace קו: מדולל, דחוס, ו-Scattergl לסדרה צפופה
+
+    Args:
+        x, y: הסדרה
+        name, color, width, dash: כמו ב-go.Scatter
+        markers: סמנים בנקודות (רק לסדרה קצרה)
+        sign_colors: (חיובי, שלילי) - צבע הסמנים לפי סימן הערך
+        decimals: ספרות אחרי הנקודה שנשלחות (0 לשקלים)
+        budget: מקסימום נקודות
+        **kwargs: שאר מאפייני ה-trace (fill, hovertemplate, stackgroup ...)
+    """
+    x, y = downsample(x, y, budget)
+    x, y = compact(x, 2), compact(y, decimals)
+    show_markers = markers and len(x) <= MARKER_MAX_POINTS
+
+    trace_kwargs = dict(
+        x=x, y=y, name=name,
+        mode='lines+markers' if show_markers else 'lines',
+        line=dict(color=color, width=width, dash=dash),
+        **kwargs
+    )
+    if show_markers:
+        marker = sign_marker(y, *sign_colors) if sign_colors else dict(color=color)
+        trace_kwargs['marker'] = dict(marker, size=6)
+
+    # stackgroup לא נתמך ב-WebGL
+    if len(x) >= WEBGL_MIN_POINTS and 'stackgroup' not in kwargs:
+        return go.Scattergl(**trace_kwargs)
+    return go.Scatter(**trace_kwargs)
+
+
+def points(x: Sequence, y: Sequence, name: Optional[str] = None, color: Optional[str] = None, size: int = 6, **kwargs):
+    """trace של סמנים בלבד (למשל מינימום בכל שנה)"""
+    x, y = compact(x, 2), compact(y)
+    trace = go.Scattergl if len(x) >= WEBGL_MIN_POINTS else go.Scatter
+    return trace(x=x, y=y, name=name, mode='markers', marker=dict(color=color, size=size), **kwargs)
+
+
+def bars(
+    x: Sequence,
+    y: Sequence,
+    name: Optional[str] = None,
+    color: Optional[str] = None,
+    sign_colors: Optional[Tuple[str, str]] = None,
+    decimals: int = 0,
+    **kwargs
+) -> go.Bar:
+    """
+    trace עמודות עם ערכים דחוסים
+
+    Args:
+        sign_colors: (חיובי, שלילי) - צבע כל עמודה לפי סימן הערך
+    """
+    x, y = compact(x, 2), compact(y, decimals)
+    marker = sign_marker(y, *sign_colors) if sign_colors else dict(color=color)
+    return go.Bar(x=x, y=y, name=name, marker=marker, **kwargs)
+
+
+# =============================================================================
+# מטמון גרפים
+# =============================================================================
+
+# משותף לכל הסשנים - אין לשנות גרף שהוחזר מהמטמון
+figure_cache = ProjectionCache(maxsize=256)
+
+
+def cached_figures(name: str, build: Callable[..., Any], *inputs) -> Any:
+    """
+    build(*inputs) דרך המטמון, לפי שם הבונה ו-hash של תוכן הקלטים
+
+    Args:
+        name: שם ייחודי לבונה (חלק מהמפתח)
+        build: פונקציה שבונה גרף או רשימת גרפים מהקלטים
+        *inputs: טבלאות וערכים פשוטים (כמו ב-scenario_hash)
+    """
+    return figure_cache.get_or_build(f'{name}:{content_hash(*inputs)}', lambda: build(*inputs))
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+checks.py - בדיקות שקילות בין מנועי החישוב
+
+המנועים הווקטוריים מסכמים את אותם סכומים בסדר שונה מהלולאות המקוריות,
+ולכן קיצוץ int() יכול להיות שונה ב-1 בשנה מסוימת. הבדיקות כאן משוות את
+שני המנועים עמודה-עמודה ומאפשרות הפרש עיגול קטן בלבד.
+"""
+
+import pandas as pd
+from typing import Any, Dict, Iterable
+
+from .existing import compute_existing_projection, compute_existing_projection_vectorized
+from .new import compute_new_projection, compute_new_projection_vectorized
+
+
+# הפרש מותר לעמודה שנתית (קיצוץ של שני סכומים → עד 2)
+YEARLY_TOLERANCE = 2
+# עמודות מצטברות: הפרש העיגול יכול להצטבר לאורך השנים
+CUMULATIVE_COLUMNS = ('יתרה_מצטברת',)
+# אחוז לווים מעוגל לספרה אחת אחרי הנקודה
+PERCENT_COLUMNS = {'אחוז_לווים': 0.1}
+
+# מקרי קצה למודל החדשות (שם → פרמטרים ל-compute_new_projection)
+NEW_ENGINE_EDGE_CASES: Dict[str, Dict[str, Any]] = {
+    # גיל חתונה אחרונה שלילי: אין החזר דמי מנוי לתת-הקוהורטה (ולא IndexError)
+    'negative_last_wedding_age': {
+        'wedding_age': 0,
+        'fee_refund_percentage': 90,
+        'distribution_mode': 'custom',
+        'distribution_df': pd.DataFrame({'סטייה_שנים': [-25, 0], 'אחוז': [50.0, 50.0]}),
+    },
+    # גיל חתונה כ-float (למשל "wedding_age": 21.0 בקובץ תרחיש) - כמו 21
+    'float_wedding_age': {
+        'wedding_age': 21.0,
+        'fee_refund_percentage': 90,
+    },
+}
+
+
+def compare_frames(
+    df_reference: pd.DataFrame,
+    df_candidate: pd.DataFrame,
+    cumulative_columns: Iterable[str] = CUMULATIVE_COLUMNS
+) -> Dict[str, float]:
+    """
+    השוואת שתי טבלאות תזרים עמודה-עמודה
+
+    Returns:
+        dict: עמודה → הפרש מוחלט מקסימלי
+
+    Raises:
+        AssertionError: אם העמודות או השנים שונות, או שהפרש חורג מהסבילות
+    """
+    if list(df_reference.columns) != list(df_candidate.columns):
+        raise AssertionError(
+            f"עמודות שונות: {list(df_reference.columns)} != {list(df_candidate.columns)}"
+        )
+    if len(df_reference) != len(df_candidate):
+        raise AssertionError(f"מספר שורות שונה: {len(df_reference)} != {len(df_candidate)}")
+
+    num_years = max(len(df_reference), 1)
+    diffs = {}
+    for col in df_reference.columns:
+        diff = (df_reference[col].astype(float) - df_candidate[col].astype(float)).abs()
+        max_diff = float(diff.max()) if len(diff) else 0.0
+        diffs[col] = max_diff
+
+        if col == 'שנה':
+            tolerance = 0
+        elif col in cumulative_columns:
+            tolerance = YEARLY_TOLERANCE * num_years
+        else:
+            tolerance = PERCENT_COLUMNS.get(col, YEARLY_TOLERANCE)
+
+        if max_diff > tolerance + 1e-9:
+            raise AssertionError(f"עמודה {col}: הפרש {max_diff} חורג מהסבילות {tolerance}")
+
+    return diffs
+
+
+def check_new_engine(df_yearly_params: pd.DataFrame, **kwargs) -> Dict[str, float]:
+    """
+    הרצת compute_new_projection ו-compute_new_projection_vectorized על אותם
+    קלטים והשוואת התוצאות
+
+    Args:
+        df_yearly_params: טבלת פרמטרים שנתיים
+        **kwargs: שאר הפרמטרים של compute_new_projection
+
+    Returns:
+        dict: עמודה → הפרש מוחלט מקסימלי
+    """
+    df_loop = compute_new_projection(df_yearly_params, **kwargs)
+    df_vectorized = compute_new_projection_vectorized(df_yearly_params, **kwargs)
+    return compare_frames(df_loop, df_vectorized)
+
+
+def check_new_engine_edge_cases(df_yearly_params: pd.DataFrame) -> Dict[str, Dict[str, float]]:
+    """
+    check_new_engine על כל NEW_ENGINE_EDGE_CASES
+
+    Returns:
+        dict: שם המקרה → הפרשים לפי עמודה
+    """
+    return {
+        name: check_new_engine(df_yearly_params, **kwargs)
+        for name, kwargs in NEW_ENGINE_EDGE_CASES.items()
+    }
+
+
+def check_existing_engine(df_existing_loans: pd.DataFrame, **kwargs) -> Dict[str, float]:
+    """
+    הרצת compute_existing_projection ו-compute_existing_projection_vectorized
+    על אותם קלטים והשוואת התוצאות
+
+    Args:
+        df_existing_loans: טבלת הלוואות קיימים
+        **kwargs: שאר הפרמטרים של compute_existing_projection
+
+    Returns:
+        dict: עמודה → הפרש מוחלט מקסימלי
+    """
+    df_loop = compute_existing_projection(df_existing_loans, **kwargs)
+    df_vectorized = compute_existing_projection_vectorized(df_existing_loans, **kwargs)
+    return compare_frames(df_loop, df_vectorized)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+cli.py - הרצת תרחישים מקבצים, בלי Streamlit
+
+    python -m app.cli scenarios/ --out results/ --format parquet --workers 4
+
+כל קובץ JSON או TOML בתיקייה הוא תרחיש אחד, עם אותם מפתחות כמו
+ב-session_state (ראו core.default_state). מפתח שלא מופיע מקבל ברירת מחדל.
+טבלאות ניתנות כרשימת שורות, למשל:
+
+    initial_balance = 5000000
+    end_year = 2200
+    default_family_fee = 450
+
+    [[df_existing_loans]]
+    שנת_לידה = 2005
+    שנת_הלוואה = 2026
+    מספר_ילדים = 120
+    דמי_מנוי_חודשי = 50
+
+לכל תרחיש נכתבים existing/new/combined בתיקייה משלו, ובנוסף טבלת סיכום
+(summary) לכל התרחישים. Parquet ו-Feather דורשים pyarrow.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from .core import ScenarioParams, run, summarize_balance
+
+
+SCENARIO_SUFFIXES = ('.json', '.toml')
+OUTPUT_FORMATS = ('parquet', 'feather')
+
+
+def load_scenario_file(path: Path) -> Dict[str, Any]:
+    """
+    קריאת קובץ תרחיש (JSON או TOML) למיפוי
+
+    Raises:
+        ValueError: אם סיומת הקובץ לא נתמכת
+    """
+    if path.suffix == '.json':
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    if path.suffix == '.toml':
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            import tomli as tomllib
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    raise ValueError(f"סוג קובץ לא נתמך: {path.name}")
+
+
+def find_scenarios(directory: Path) -> List[Path]:
+    """כל קבצי התרחישים בתיקייה, ממוינים לפי שם"""
+    return sorted(p for p in directory.iterdir() if p.is_file() and p.suffix in SCENARIO_SUFFIXES)
+
+
+def require_pyarrow(fmt: str) -> None:
+    """
+    בדיקה שה-pyarrow מותקן לפני שמתחילים להריץ
+
+    Raises:
+        RuntimeError: עם הוראת התקנה
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise RuntimeError(f"פורמט {fmt} דורש את החבילה pyarrow: pip install pyarrow") from None
+
+
+def write_frame(df: pd.DataFrame, path: Path, fmt: str) -> None:
+    """כתיבת טבלה בפורמט עמודות"""
+    if fmt == 'parquet':
+        df.to_parquet(path, index=False)
+    else:
+        df.reset_index(drop=True).to_feather(path)
+
+
+def run_scenario_file(path: Path, out_dir: Path, fmt: str) -> Dict[str, Any]:
+    """
+    הרצת תרחיש אחד וכתיבת התוצאות
+
+    Returns:
+        שורת סיכום: scenario, min_balance, first_negative_year,
+        final_balance, seconds, error
+    """
+    started = time.perf_counter()
+    row: Dict[str, Any] = {'scenario': path.stem}
+    try:
+        params = ScenarioParams.from_dict(load_scenario_file(path))
+        result = run(params)
+
+        scenario_dir = out_dir / path.stem
+        scenario_dir.mkdir(parents=True, exist_ok=True)
+        write_frame(result.df_existing, scenario_dir / f'existing.{fmt}', fmt)
+        write_frame(result.df_new, scenario_dir / f'new.{fmt}', fmt)
+        write_frame(result.df_combined, scenario_dir / f'combined.{fmt}', fmt)
+
+        df = result.df_combined
+        row.update(summarize_balance(df['שנה'].to_numpy(), df['יתרת_קופה'].to_numpy()))
+        row['error'] = None
+    except Exception as e:
+        row.update({'min_balance': None, 'first_negative_year': None, 'final_balance': None})
+        row['error'] = f'{type(e).__name__}: {e}'
+    row['seconds'] = round(time.perf_counter() - started, 3)
+    return row
+
+
+def run_batch(
+    paths: Sequence[Path],
+    out_dir: Path,
+    fmt: str = 'parquet',
+    max_workers: Optional[int] = None
+) -> pd.DataFrame:
+    """
+    הרצת כל התרחישים (במקביל) וכתיבת טבלת הסיכום
+
+    Args:
+        paths: קבצי תרחישים
+        out_dir: תיקיית פלט
+        fmt: parquet או feather
+        max_workers: מספר תהליכים (ברירת מחדל: מספר הליבות). 1 = ללא מאגר
+
+    Returns:
+        טבלת הסיכום, שורה לכל תרחיש לפי סדר הקבצים
+    """
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"פורמט לא נתמך: {fmt}")
+    require_pyarrow(fmt)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    workers = max_workers or os.cpu_count() or 1
+    if workers == 1 or len(paths) <= 1:
+        rows = [run_scenario_file(path, out_dir, fmt) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = list(pool.map(run_scenario_file, paths, [out_dir] * len(paths), [fmt] * len(paths)))
+
+    summary = pd.DataFrame(
+        rows,
+        columns=['scenario', 'min_balance', 'first_negative_year', 'final_balance', 'seconds', 'error']
+    )
+    for col in ['min_balance', 'first_negative_year', 'final_balance']:
+        summary[col] = summary[col].astype('Int64')
+    write_frame(summary, out_dir / f'summary.{fmt}', fmt)
+    return summary
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='python -m app.cli',
+        description='הרצת תרחישי קהילה מקבצי JSON/TOML וכתיבת התוצאות'
+    )
+    parser.add_argument('scenarios', type=Path, help='תיקייה עם קבצי תרחישים (או קובץ בודד)')
+    parser.add_argument('--out', type=Path, default=Path('results'), help='תיקיית פלט (ברירת מחדל: results)')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='parquet', help='פורמט הפלט')
+    parser.add_argument('--workers', type=int, default=None, help='מספר תהליכים (ברירת מחדל: מספר הליבות)')
+    args = parser.parse_args(argv)
+
+    paths = [args.scenarios] if args.scenarios.is_file() else find_scenarios(args.scenarios)
+    if not paths:
+        print(f"לא נמצאו קבצי תרחישים ב-{args.scenarios}", file=sys.stderr)
+        return 2
+
+    try:
+        summary = run_batch(paths, args.out, args.format, args.workers)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(summary.drop(columns=['error']).to_string(index=False))
+    failed = summary[summary['error'].notna()]
+    for _, row in failed.iterrows():
+        print(f"{row['scenario']}: {row['error']}", file=sys.stderr)
+    print(f"\n{len(summary) - len(failed)}/{len(summary)} תרחישים הושלמו → {args.out}")
+    return 1 if len(failed) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+compare.py - השוואת כמה תרחישים זה לצד זה
+
+התרחישים נאספים קודם מהמטמון בזיכרון ומהמאגר בדיסק (store.py). רק
+התרחישים שחסרים בשניהם מחושבים, במאגר תהליכים, ותרחישים עם תוכן זהה
+(למשל אותו תרחיש תחת שני שמות) מחושבים פעם אחת. התוצאות נכנסות למטמון,
+ולתרחיש שמור גם למאגר.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Mapping, Optional
+
+import pandas as pd
+
+from .cache import projection_cache, scenario_hash
+from .core import ProjectionResult, ScenarioParams, run, summarize_balance
+from .instrument import count, stage
+from .store import PROJECTION_KIND, ScenarioStore, default_store, projection_frames, projection_from_frames
+
+
+# העמודות שמוצגות בהשוואה
+COMPARE_COLUMNS = ['יתרת_קופה', 'כסף_יוצא', 'איזון']
+MAX_SCENARIOS = 8
+
+
+def compute_scenarios(
+    scenarios: Mapping[str, ScenarioParams],
+    max_workers: Optional[int] = None,
+    store: Optional[ScenarioStore] = None
+) -> Dict[str, ProjectionResult]:
+    """
+    תוצאות תחזית לכל התרחישים
+
+    Args:
+        scenarios: שם → פרמטרים
+        max_workers: מספר תהליכים לחישוב החסרים (ברירת מחדל: מספר הליבות).
+            1 = ללא מאגר
+        store: ברירת מחדל - default_store()
+
+    Returns:
+        שם → ProjectionResult, באותו סדר כמו scenarios
+    """
+    db = store or default_store()
+    found: Dict[str, ProjectionResult] = {}
+    missing: Dict[str, ScenarioParams] = {}   # hash → פרמטרים (בלי כפילויות)
+    hashes = {name: scenario_hash(params) for name, params in scenarios.items()}
+
+    with stage('compare.lookup'):
+        for name, params in scenarios.items():
+            key = hashes[name]
+            if key in found or key in missing:
+                continue
+            result = projection_cache.lookup(params)
+            if result is None:
+                hit = db.get_result(key, PROJECTION_KIND)
+                if hit is not None:
+                    result = projection_from_frames(hit[0])
+                    projection_cache.put(params, result)
+            if result is None:
+                missing[key] = params
+            else:
+                found[key] = result
+
+    if missing:
+        count('compare.computed', len(missing))
+        with stage('compare.compute'):
+            keys = list(missing)
+            workers = min(max_workers or os.cpu_count() or 1, len(keys))
+            if workers == 1:
+                computed = [run(missing[key]) for key in keys]
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    computed = list(pool.map(run, [missing[key] for key in keys]))
+
+        for key, result in zip(keys, computed):
+            found[key] = result
+            projection_cache.put(missing[key], result)
+            if db.has_params(key):
+                db.put_result(key, PROJECTION_KIND, projection_frames(result), {})
+
+    return {name: found[hashes[name]] for name in scenarios}
+
+
+def overlay_frame(results: Mapping[str, ProjectionResult], columns: List[str] = COMPARE_COLUMNS) -> pd.DataFrame:
+    """
+    טבלה ארוכה לגרף משותף: תרחיש, שנה ועמודות ההשוואה
+    """
+    return pd.concat(
+        [result.df_combined[['שנה'] + columns].assign(תרחיש=name) for name, result in results.items()],
+        ignore_index=True
+    )
+
+
+def delta_table(results: Mapping[str, ProjectionResult], baseline: str) -> pd.DataFrame:
+    """
+    מדדי סיכום לכל תרחיש, והפרש מול תרחיש הבסיס
+
+    Raises:
+        KeyError: אם baseline אינו בין התרחישים
+    """
+    rows = []
+    for name, result in results.items():
+        df = result.df_combined
+        summary = summarize_balance(df['שנה'].to_numpy(), df['יתרת_קופה'].to_numpy())
+        rows.append({
+            'תרחיש': name,
+            'יתרה_מינימלית': summary['min_balance'],
+            'שנה_שלילית_ראשונה': summary['first_negative_year'],
+            'יתרה_סופית': summary['final_balance'],
+            'סה"כ_כסף_יוצא': int(df['כסף_יוצא'].sum()),
+            'סה"כ_איזון': int(df['איזון'].sum()),
+        })
+    table = pd.DataFrame(rows).set_index('תרחיש')
+    table['שנה_שלילית_ראשונה'] = table['שנה_שלילית_ראשונה'].astype('Int64')
+
+    base = table.loc[baseline]
+    for col in ['יתרה_מינימלית', 'יתרה_סופית', 'סה"כ_כסף_יוצא', 'סה"כ_איזון']:
+        table[f'Δ_{col}'] = table[col] - base[col]
+    return table.reset_index()
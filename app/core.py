@@ -0,0 +1,516 @@
+# -*- coding: utf-8 -*-
+"""
+core.py - ליבת חישוב התחזיות ללא Streamlit
+
+אובייקט פרמטרים טיפוסי (ScenarioParams) ונקודת כניסה אחת (run) שמחזירה
+את שלוש טבלאות התזרים. המודול לא מייבא streamlit או plotly, כך שאפשר
+להריץ אותו מתהליכי אצווה, מבדיקות ומתהליכי worker.
+
+שמות השדות זהים למפתחות ב-session_state, כך ששכבת ה-Streamlit רק מתרגמת
+את מצב הסשן לאובייקט (ScenarioParams.from_state).
+"""
+
+import json
+from dataclasses import dataclass, field, fields, replace
+from typing import Any, Dict, Mapping, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .arrays import distribution_arrays, truncate, unique_offsets
+from .existing import (
+    compute_existing_projection_vectorized,
+    existing_cashflow_arrays,
+    existing_roster_arrays,
+    get_default_existing_loans,
+)
+from .instrument import stage
+from .new import compute_new_projection_vectorized, new_cashflow_arrays, yearly_param_arrays
+
+
+# =============================================================================
+# ברירות מחדל
+# =============================================================================
+
+# אופק התחזית ברירת המחדל (שנה ראשונה ואחרונה, כולל)
+DEFAULT_START_YEAR = 2026
+DEFAULT_END_YEAR = 2075
+
+
+def default_distribution_df() -> pd.DataFrame:
+    """
+    פיזור פעמון סטנדרטי: סטייה מגיל הבסיס → אחוז
+    פרוס על 10 שנים (-2 עד +8) עם 5% לא מתחתנים
+    """
+    return pd.DataFrame({
+        'סטייה_שנים': [-2, -1, 0, 1, 2, 3, 4, 5, 6, 7, 8],
+        'אחוז': [3, 8, 20, 20, 15, 12, 8, 5, 3, 1, 0]  # סה"כ 95%, 5% לא מתחתנים
+    })
+
+
+def default_yearly_params(
+    loan_amount: int = 100000,
+    repayment_months: int = 100,
+    loan_percentage: int = 100,
+    family_fee: int = 375,
+    start_year: int = DEFAULT_START_YEAR,
+    end_year: int = DEFAULT_END_YEAR
+) -> pd.DataFrame:
+    """טבלת פרמטרים שנתיים לחדשות עם צמיחה של 5% במצטרפים"""
+    years = list(range(start_year, end_year + 1))
+    growth_rate = 0.05
+    new_members_with_growth = [int(100 * ((1 + growth_rate) ** i)) for i in range(len(years))]
+    return pd.DataFrame({
+        'שנה': years,
+        'מצטרפים_חדשים': new_members_with_growth,
+        'גובה_הלוואה': [loan_amount] * len(years),
+        'תשלומים_חודשים': [repayment_months] * len(years),
+        'אחוז_לוקחי_הלוואה': [loan_percentage] * len(years),
+        'דמי_מנוי_משפחתי': [family_fee] * len(years)
+    })
+
+
+def fit_yearly_params(df_yearly_params: pd.DataFrame, start_year: int, end_year: int) -> pd.DataFrame:
+    """
+    התאמת הטבלה השנתית לאופק start_year..end_year
+
+    שורות מחוץ לאופק נחתכות. שנים שלפני השורה הראשונה או אחרי השורה
+    האחרונה בטבלה מקבלות עותק של השורה הקרובה (למשל הארכת האופק ל-2200
+    ממשיכה את ערכי 2075). שנים חסרות באמצע הטבלה נשארות חסרות - במנועים
+    הן שנים ללא פעילות.
+
+    Raises:
+        ValueError: אם end_year < start_year
+    """
+    if end_year < start_year:
+        raise ValueError(f"שנת הסיום ({end_year}) לפני שנת ההתחלה ({start_year})")
+
+    df = df_yearly_params.drop_duplicates('שנה', keep='first').sort_values('שנה')
+    if df.empty:
+        return default_yearly_params(start_year=start_year, end_year=end_year)
+
+    first, last = int(df['שנה'].iloc[0]), int(df['שנה'].iloc[-1])
+    inside = df[(df['שנה'] >= start_year) & (df['שנה'] <= end_year)]
+    before = np.arange(start_year, min(first, end_year + 1))
+    after = np.arange(max(last + 1, start_year), end_year + 1)
+    parts = [
+        df.iloc[[0] * len(before)].assign(שנה=before),
+        inside,
+        df.iloc[[-1] * len(after)].assign(שנה=after),
+    ]
+    return pd.concat([part for part in parts if len(part)], ignore_index=True).astype(df.dtypes.to_dict())
+
+
+def _covers(df_yearly_params: pd.DataFrame, start_year: int, end_year: int) -> bool:
+    """האם הטבלה השנתית מגיעה לשנה הראשונה והאחרונה של האופק"""
+    years = df_yearly_params['שנה']
+    return len(years) > 0 and years.min() <= start_year and years.max() >= end_year
+
+
+def default_state() -> Dict[str, Any]:
+    """
+    ערכי ברירת מחדל לכל מפתחות ה-session_state של התרחיש
+    מחולק ל-3 מקטעים: כללי, קיימים, חדשות
+    """
+    state = {
+        # =====================================================================
+        # פרמטרים גלובליים (כללי)
+        # =====================================================================
+        'initial_balance': 0,
+        'start_year': DEFAULT_START_YEAR,
+        'end_year': DEFAULT_END_YEAR,
+        'display_years': 30,
+
+        # =====================================================================
+        # פרמטרים לקיימים
+        # מודל פשוט: רשימת הלוואות לפי שנת הלוואה (2026-2046)
+        # כל ילד משלם דמי מנוי מ-2026 עד סוף ההחזר שלו
+        # =====================================================================
+        'existing_loan_amount': 100000,    # גובה הלוואה אחיד לקיימים
+        'existing_repayment_months': 80,   # מספר תשלומים אחיד לקיימים
+        # טבלת הלוואות קיימים (שנת הלוואה, מספר ילדים, דמי מנוי חודשי לילד)
+        'df_existing_loans': get_default_existing_loans(),
+
+        # =====================================================================
+        # פרמטרים למשפחות חדשות
+        # =====================================================================
+        'wedding_age': 20,
+        'avg_children_new_family': 8,
+        'months_between_children': 34,
+        'default_loan_amount': 100000,
+        'default_repayment_months': 100,
+        # מודל קוהורטות: 100% = כל המשפחות לוקחות הלוואה (ברירת מחדל)
+        # האחוז מכלל החברים משתנה אוטומטית לפי שנת ההצטרפות
+        'default_loan_percentage': 100,
+        'default_family_fee': 375,
+        'fee_refund_percentage': 90,
+
+        # =====================================================================
+        # פיזור גיל נישואין (פעמון)
+        # "none" = גיל קבוע, "bell" = פעמון סטנדרטי, "custom" = מותאם אישית
+        # =====================================================================
+        'distribution_mode': "none",
+        'distribution_df': default_distribution_df(),
+        'existing_distribution_mode': "custom",
+        'existing_distribution_df': default_distribution_df(),
+    }
+
+    # טבלת פרמטרים שנתיים לחדשות (שורה לכל שנה באופק)
+    state['df_yearly_params'] = default_yearly_params(
+        loan_amount=state['default_loan_amount'],
+        repayment_months=state['default_repayment_months'],
+        loan_percentage=state['default_loan_percentage'],
+        family_fee=state['default_family_fee'],
+        start_year=state['start_year'],
+        end_year=state['end_year']
+    )
+    return state
+
+
+# ערכי default_* בסיידבר דורסים עמודה שלמה בטבלה השנתית
+YEARLY_DEFAULT_COLUMNS = {
+    'default_loan_amount': 'גובה_הלוואה',
+    'default_repayment_months': 'תשלומים_חודשים',
+    'default_loan_percentage': 'אחוז_לוקחי_הלוואה',
+    'default_family_fee': 'דמי_מנוי_משפחתי',
+}
+
+
+# =============================================================================
+# פרמטרים ותוצאה
+# =============================================================================
+
+@dataclass
+class ScenarioParams:
+    """
+    כל הקלטים של תחזית אחת
+
+    שמות השדות זהים למפתחות ה-session_state. הערכים default_* משמשים
+    כברירת מחדל לעמודות בטבלה השנתית; המנוע עצמו קורא את הטבלה.
+    """
+    # כללי
+    initial_balance: int = 0
+    start_year: int = DEFAULT_START_YEAR
+    end_year: int = DEFAULT_END_YEAR
+
+    # קיימים
+    existing_loan_amount: int = 100000
+    existing_repayment_months: int = 80
+    df_existing_loans: pd.DataFrame = field(default_factory=get_default_existing_loans)
+    existing_distribution_mode: str = "custom"
+    existing_distribution_df: pd.DataFrame = field(default_factory=default_distribution_df)
+
+    # חדשות
+    wedding_age: int = 20
+    avg_children_new_family: int = 8
+    months_between_children: int = 34
+    default_loan_amount: int = 100000
+    default_repayment_months: int = 100
+    default_loan_percentage: int = 100
+    default_family_fee: int = 375
+    fee_refund_percentage: float = 90
+    distribution_mode: str = "none"
+    distribution_df: pd.DataFrame = field(default_factory=default_distribution_df)
+    df_yearly_params: pd.DataFrame = field(default_factory=default_yearly_params)
+
+    @classmethod
+    def from_state(cls, state: Mapping[str, Any]) -> "ScenarioParams":
+        """
+        בניית פרמטרים ממיפוי בסגנון session_state
+
+        מפתחות חסרים מקבלים ברירת מחדל; מפתחות שאינם שדות (כמו display_years)
+        מתעלמים מהם.
+        """
+        values = {f.name: state[f.name] for f in fields(cls) if f.name in state}
+        return cls(**values)
+
+    def to_state(self) -> Dict[str, Any]:
+        """המרה חזרה למיפוי בסגנון session_state"""
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "ScenarioParams":
+        """
+        בניית פרמטרים מקובץ תרחיש (JSON/TOML) עם מפתחות session_state
+
+        טבלאות ניתנות כרשימת שורות (dict לכל שורה) או כ-dict של עמודות.
+        אם אין df_yearly_params, הטבלה נבנית מערכי default_* כמו באתחול
+        הסשן. מפתחות סשן שאינם שדות (כמו display_years) מתעלמים מהם.
+
+        Raises:
+            ValueError: על מפתח לא מוכר
+        """
+        known = {f.name for f in fields(cls)} | set(default_state())
+        unknown = sorted(set(data) - known)
+        if unknown:
+            raise ValueError(f"מפתחות לא מוכרים בתרחיש: {unknown}")
+
+        values = {}
+        for f in fields(cls):
+            if f.name not in data:
+                continue
+            value = data[f.name]
+            if f.name.startswith('df_') or f.name.endswith('_df'):
+                value = pd.DataFrame.from_records(value) if isinstance(value, list) else pd.DataFrame(value)
+            values[f.name] = value
+
+        start_year = int(values.get('start_year', cls.start_year))
+        end_year = int(values.get('end_year', cls.end_year))
+        if 'df_yearly_params' not in values:
+            defaults = {key: values.get(key, getattr(cls, key)) for key in YEARLY_DEFAULT_COLUMNS}
+            values['df_yearly_params'] = default_yearly_params(
+                loan_amount=defaults['default_loan_amount'],
+                repayment_months=defaults['default_repayment_months'],
+                loan_percentage=defaults['default_loan_percentage'],
+                family_fee=defaults['default_family_fee'],
+                start_year=start_year,
+                end_year=end_year
+            )
+        elif not _covers(values['df_yearly_params'], start_year, end_year):
+            values['df_yearly_params'] = fit_yearly_params(values['df_yearly_params'], start_year, end_year)
+        return cls(**values)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """המרה למיפוי שאפשר לשמור כ-JSON (טבלאות כרשימת שורות)"""
+        data = {}
+        for f in fields(self):
+            value = getattr(self, f.name)
+            if isinstance(value, pd.DataFrame):
+                value = json.loads(value.to_json(orient='records', force_ascii=False))
+            elif isinstance(value, np.generic):
+                value = value.item()
+            data[f.name] = value
+        return data
+
+    def with_overrides(self, **overrides) -> "ScenarioParams":
+        """
+        עותק עם ערכים מוחלפים
+
+        כמו בסיידבר: שינוי של default_* (למשל default_family_fee) מעדכן גם את
+        העמודה המתאימה בכל שנות הטבלה השנתית, ושינוי start_year/end_year
+        מתאים את הטבלה לאופק החדש.
+        """
+        params = replace(self, **overrides)
+        if 'start_year' in overrides or 'end_year' in overrides:
+            params.df_yearly_params = fit_yearly_params(params.df_yearly_params, params.start_year, params.end_year)
+        columns = {
+            YEARLY_DEFAULT_COLUMNS[key]: value
+            for key, value in overrides.items() if key in YEARLY_DEFAULT_COLUMNS
+        }
+        if columns:
+            params.df_yearly_params = params.df_yearly_params.assign(**columns)
+        return params
+
+
+@dataclass
+class ProjectionResult:
+    """תוצאת תחזית: קיימים, חדשות ומאוחד"""
+    df_existing: pd.DataFrame
+    df_new: pd.DataFrame
+    df_combined: pd.DataFrame
+
+    def as_tuple(self):
+        """(df_existing, df_new, df_combined) - הצורה שהטאבים מקבלים"""
+        return self.df_existing, self.df_new, self.df_combined
+
+
+# =============================================================================
+# חישוב
+# =============================================================================
+
+def run(params: ScenarioParams) -> ProjectionResult:
+    """
+    חישוב תחזיות לכל החלקים
+
+    Args:
+        params: פרמטרי התרחיש
+
+    Returns:
+        ProjectionResult
+    """
+    # === קיימים (עם תמיכה בפיזור גיל נישואין) - מערכי הפרשים ===
+    with stage('engine.existing'):
+        df_existing = compute_existing_projection_vectorized(
+            df_existing_loans=params.df_existing_loans,
+            loan_amount=params.existing_loan_amount,
+            repayment_months=params.existing_repayment_months,
+            start_year=params.start_year,
+            end_year=params.end_year,
+            distribution_mode=params.existing_distribution_mode,
+            distribution_df=params.existing_distribution_df if params.existing_distribution_mode != "none" else None
+        )
+
+    # === חדשות (עם תמיכה בפיזור גיל נישואין) - מנוע וקטורי ===
+    with stage('engine.new'):
+        df_new = compute_new_projection_vectorized(
+            df_yearly_params=params.df_yearly_params,
+            wedding_age=params.wedding_age,
+            avg_children=params.avg_children_new_family,
+            months_between_children=params.months_between_children,
+            fee_refund_percentage=params.fee_refund_percentage,
+            start_year=params.start_year,
+            end_year=params.end_year,
+            distribution_mode=params.distribution_mode,
+            distribution_df=params.distribution_df if params.distribution_mode != "none" else None
+        )
+
+    # === מאוחד ===
+    with stage('merge'):
+        df_combined = _merge_projections(
+            df_existing=df_existing,
+            df_new=df_new,
+            initial_balance=params.initial_balance
+        )
+
+    return ProjectionResult(df_existing, df_new, df_combined)
+
+
+def existing_flow_arrays(params: ScenarioParams) -> Dict[str, np.ndarray]:
+    """מערכי התזרים השנתיים של הקיימים (existing_cashflow_arrays) לפי התרחיש"""
+    existing_mode = params.existing_distribution_mode
+    offsets, pct = distribution_arrays(
+        existing_mode, params.existing_distribution_df if existing_mode != "none" else None
+    )
+    return existing_cashflow_arrays(
+        **existing_roster_arrays(params.df_existing_loans),
+        offsets=offsets,
+        weights=pct / 100,
+        loan_amount=params.existing_loan_amount,
+        repayment_months=params.existing_repayment_months,
+        start_year=params.start_year,
+        end_year=params.end_year
+    )
+
+
+def scenario_yearly_arrays(params: ScenarioParams) -> Dict[str, np.ndarray]:
+    """yearly_param_arrays של הטבלה השנתית, על האופק של התרחיש"""
+    return yearly_param_arrays(params.df_yearly_params, params.start_year, params.end_year)
+
+
+def new_flow_arrays(params: ScenarioParams) -> Dict[str, np.ndarray]:
+    """
+    מערכי התזרים השנתיים של החדשות (new_cashflow_arrays) לפי התרחיש
+
+    בנוסף למפתחות של new_cashflow_arrays: years ו-repayment_months לכל שנה.
+    """
+    yearly = scenario_yearly_arrays(params)
+    new_mode = params.distribution_mode
+    offsets, pct = unique_offsets(*distribution_arrays(
+        new_mode, params.distribution_df if new_mode != "none" else None
+    ))
+    flows = new_cashflow_arrays(
+        joiners=yearly['joiners'],
+        loan_amount=yearly['loan_amount'],
+        repayment_months=yearly['repayment_months'],
+        loan_percentage=yearly['loan_percentage'],
+        family_fee=yearly['family_fee'],
+        processed=yearly['processed'],
+        offsets=offsets,
+        weights=pct / 100,
+        wedding_age=params.wedding_age,
+        avg_children=params.avg_children_new_family,
+        months_between_children=params.months_between_children,
+        fee_refund_percentage=params.fee_refund_percentage
+    )
+    flows['years'] = yearly['years']
+    flows['repayment_months'] = yearly['repayment_months']
+    return flows
+
+
+def existing_net_flows(params: ScenarioParams) -> np.ndarray:
+    """איזון שנתי של הקיימים בלבד (לא תלוי בפרמטרי החדשות)"""
+    existing = existing_flow_arrays(params)
+    return truncate(existing['repayments'] + existing['fees']) - truncate(existing['loans_amount'])
+
+
+def new_net_flows(params: ScenarioParams) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    איזון שנתי של החדשות בלבד
+
+    Returns:
+        tuple: (שנים, איזון שנתי כ-int)
+    """
+    new = new_flow_arrays(params)
+    return new['years'], truncate(new['repayments'] + new['fees']) - truncate(new['loans_amount'] + new['refunds'])
+
+
+def net_flows(params: ScenarioParams) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    איזון שנתי מאוחד (קיימים + חדשות) בלי לבנות טבלאות
+
+    אותם ערכים כמו עמודת 'איזון' ב-run(params).df_combined, אבל ישירות
+    מהמערכים - לשימוש בסריקות פרמטרים ובמחשבונים שמריצים הרבה תרחישים.
+
+    Returns:
+        tuple: (שנים, איזון שנתי כ-int)
+    """
+    years, new_net = new_net_flows(params)
+    return years, existing_net_flows(params) + new_net
+
+
+def summarize_balance(years: np.ndarray, balance: np.ndarray) -> Dict[str, Any]:
+    """
+    מדדי סיכום ליתרת קופה: מינימום, שנה שלילית ראשונה ויתרה סופית
+
+    Returns:
+        dict עם: min_balance, first_negative_year (None אם אין), final_balance
+    """
+    negative = np.flatnonzero(balance < 0)
+    return {
+        'min_balance': int(balance.min()),
+        'first_negative_year': int(years[negative[0]]) if len(negative) else None,
+        'final_balance': int(balance[-1]),
+    }
+
+
+def _merge_projections(
+    df_existing: pd.DataFrame,
+    df_new: pd.DataFrame,
+    initial_balance: int
+) -> pd.DataFrame:
+    """
+    מיזוג תזרימי קיימים וחדשות לתמונה כוללת
+
+    Args:
+        df_existing: תזרים קיימים
+        df_new: תזרים חדשות
+        initial_balance: יתרת קופה התחלתית
+
+    Returns:
+        DataFrame מאוחד עם יתרת קופה מצטברת
+    """
+    # Merge על פי שנה
+    df = pd.merge(
+        df_existing[['שנה', 'הלוואות_ניתנו', 'כסף_יוצא', 'החזרי_הלוואות', 'משלמי_דמי_מנוי', 'דמי_מנוי', 'כסף_נכנס', 'איזון']],
+        df_new[['שנה', 'משפחות_נרשמות', 'הלוואות_ניתנו', 'החזרי_דמי_מנוי', 'כסף_יוצא', 'החזרי_דמי_מנוי_סכום', 'החזרי_הלוואות', 'משלמי_דמי_מנוי', 'דמי_מנוי', 'כסף_נכנס', 'איזון']],
+        on='שנה',
+        how='outer',
+        suffixes=('_קיימות', '_חדשות')
+    ).fillna(0)
+
+    # חישוב סה"כ
+    df['הלוואות_ניתנו'] = df['הלוואות_ניתנו_קיימות'].astype(int) + df['הלוואות_ניתנו_חדשות'].astype(int)
+    df['כסף_יוצא'] = df['כסף_יוצא_קיימות'].astype(int) + df['כסף_יוצא_חדשות'].astype(int)
+    df['החזרי_הלוואות'] = df['החזרי_הלוואות_קיימות'].astype(int) + df['החזרי_הלוואות_חדשות'].astype(int)
+    df['משלמי_דמי_מנוי'] = df['משלמי_דמי_מנוי_קיימות'].astype(int) + df['משלמי_דמי_מנוי_חדשות'].astype(int)
+    df['דמי_מנוי'] = df['דמי_מנוי_קיימות'].astype(int) + df['דמי_מנוי_חדשות'].astype(int)
+    df['כסף_נכנס'] = df['כסף_נכנס_קיימות'].astype(int) + df['כסף_נכנס_חדשות'].astype(int)
+    df['איזון'] = df['איזון_קיימות'].astype(int) + df['איזון_חדשות'].astype(int)
+
+    # יתרת קופה מצטברת (מתחילה מ-initial_balance)
+    df['יתרת_קופה'] = initial_balance + df['איזון'].cumsum()
+
+    # המרה לסוגים נכונים
+    int_cols = ['שנה', 'הלוואות_ניתנו', 'כסף_יוצא', 'החזרי_הלוואות', 'משלמי_דמי_מנוי',
+                'דמי_מנוי', 'כסף_נכנס', 'איזון', 'יתרת_קופה',
+                'הלוואות_ניתנו_קיימות', 'כסף_יוצא_קיימות', 'החזרי_הלוואות_קיימות',
+                'משלמי_דמי_מנוי_קיימות', 'דמי_מנוי_קיימות', 'כסף_נכנס_קיימות', 'איזון_קיימות',
+                'משפחות_נרשמות', 'הלוואות_ניתנו_חדשות', 'החזרי_דמי_מנוי', 'כסף_יוצא_חדשות',
+                'החזרי_דמי_מנוי_סכום', 'החזרי_הלוואות_חדשות', 'משלמי_דמי_מנוי_חדשות',
+                'דמי_מנוי_חדשות', 'כסף_נכנס_חדשות', 'איזון_חדשות']
+
+    for col in int_cols:
+        if col in df.columns:
+            df[col] = df[col].astype(int)
+
+    return df
@@ -7,10 +7,45 @@ existing.py - לוגיקת חישוב לילדים קיימים
 - כל ילד מקבל הלוואה בשנת ההלוואה שלו
 - כל ילד משלם דמי מנוי מ-2026 עד סוף ההחזר של ההלוואה שלו
 - אין מענקים לקיימים
+
+שני מנועים:
+- compute_existing_projection - לולאה על קבוצות ילדים (מימוש הייחוס)
+- compute_existing_projection_vectorized - מערכי הפרשים, O(קבוצות + שנים)
 """
 
+import numpy as np
 import pandas as pd
-import streamlit as st
+from typing import Dict, Tuple
+
+from .arrays import distribution_arrays, range_add, truncate
+from .instrument import count
+
+
+class _FeePayerGroup:
+    """ילדים משורה אחת בטבלה ובסטייה אחת - משלמים ומקבלים הלוואה יחד"""
+    __slots__ = (
+        'fee_amount', 'count', 'actual_loan_year', 'pay_until_year',
+        'remaining_repayment_years', 'loan_already_given'
+    )
+
+    def __init__(self, fee_amount, count, actual_loan_year, pay_until_year,
+                 remaining_repayment_years, loan_already_given):
+        self.fee_amount = fee_amount
+        self.count = count
+        self.actual_loan_year = actual_loan_year
+        self.pay_until_year = pay_until_year
+        self.remaining_repayment_years = remaining_repayment_years
+        self.loan_already_given = loan_already_given
+
+
+class _ActiveLoan:
+    """הלוואות פעילות של שנת מתן אחת"""
+    __slots__ = ('count', 'years_left', 'yearly_payment')
+
+    def __init__(self, count, years_left, yearly_payment):
+        self.count = count
+        self.years_left = years_left
+        self.yearly_payment = yearly_payment
 
 
 def get_default_existing_loans() -> pd.DataFrame:
@@ -97,13 +132,12 @@ def compute_existing_projection(
         ]
     
     # מעקב אחר הלוואות פעילות
-    # {loan_year: {count, years_left, yearly_payment}}
+    # {loan_year: _ActiveLoan}
     active_loans = {}
     
-    # מעקב אחר משלמי דמי מנוי
-    # {child_id: {fee_amount, actual_loan_year, pay_until_year}}
-    fee_payers = {}
-    child_counter = 0
+    # מעקב אחר משלמי דמי מנוי - קבוצת ילדים לכל (שורה × סטייה)
+    # [_FeePayerGroup, ...]
+    fee_payers = []
     
     # הכנת רשימת הילדים הקיימים עם פיזור
     for _, row in df_existing_loans.iterrows():
@@ -129,40 +163,36 @@ def compute_existing_projection(
                     if remaining_years > 0:
                         # עדיין מחזירים הלוואה
                         pay_until_year = int(start_year + remaining_years)
-                        fee_payers[child_counter] = {
-                            'fee_amount': monthly_fee * children_in_deviation,
-                            'count': children_in_deviation,
-                            'actual_loan_year': actual_loan_year,  # לפני start_year
-                            'pay_until_year': pay_until_year,
-                            'remaining_repayment_years': remaining_years,
-                            'loan_already_given': True
-                        }
-                        child_counter += 1
+                        fee_payers.append(_FeePayerGroup(
+                            fee_amount=monthly_fee * children_in_deviation,
+                            count=children_in_deviation,
+                            actual_loan_year=actual_loan_year,  # לפני start_year
+                            pay_until_year=pay_until_year,
+                            remaining_repayment_years=remaining_years,
+                            loan_already_given=True
+                        ))
                 else:
                     # הלוואה תינתן בעתיד
                     pay_until_year = int(actual_loan_year + repayment_years)
-                    fee_payers[child_counter] = {
-                        'fee_amount': monthly_fee * children_in_deviation,
-                        'count': children_in_deviation,
-                        'actual_loan_year': actual_loan_year,
-                        'pay_until_year': pay_until_year,
-                        'remaining_repayment_years': repayment_years,
-                        'loan_already_given': False
-                    }
-                    child_counter += 1
+                    fee_payers.append(_FeePayerGroup(
+                        fee_amount=monthly_fee * children_in_deviation,
+                        count=children_in_deviation,
+                        actual_loan_year=actual_loan_year,
+                        pay_until_year=pay_until_year,
+                        remaining_repayment_years=repayment_years,
+                        loan_already_given=False
+                    ))
     
     # הוספת הלוואות שכבר ניתנו לפני start_year למעקב
-    for child_id, info in fee_payers.items():
-        if info.get('loan_already_given', False):
-            loan_year = info['actual_loan_year']
+    for info in fee_payers:
+        if info.loan_already_given:
+            loan_year = info.actual_loan_year
             if loan_year not in active_loans:
-                active_loans[loan_year] = {
-                    'count': info['count'],
-                    'years_left': info['remaining_repayment_years'],
-                    'yearly_payment': yearly_payment_per_loan
-                }
+                active_loans[loan_year] = _ActiveLoan(
+                    info.count, info.remaining_repayment_years, yearly_payment_per_loan
+                )
             else:
-                active_loans[loan_year]['count'] += info['count']
+                active_loans[loan_year].count += info.count
     
     results = []
     
@@ -172,32 +202,30 @@ def compute_existing_projection(
         loans_given_amount = 0
         
         # סופרים את כל הילדים שההלוואה שלהם בשנה הזו (ולא כבר ניתנה)
-        for child_id, info in fee_payers.items():
-            if info['actual_loan_year'] == year and not info.get('loan_already_given', False):
-                loans_given_count += info['count']
-                loans_given_amount += info['count'] * loan_amount
+        for info in fee_payers:
+            if info.actual_loan_year == year and not info.loan_already_given:
+                loans_given_count += info.count
+                loans_given_amount += info.count * loan_amount
                 
                 # הוספה למעקב הלוואות
                 if year not in active_loans:
-                    active_loans[year] = {
-                        'count': info['count'],
-                        'years_left': info['remaining_repayment_years'],
-                        'yearly_payment': yearly_payment_per_loan
-                    }
+                    active_loans[year] = _ActiveLoan(
+                        info.count, info.remaining_repayment_years, yearly_payment_per_loan
+                    )
                 else:
-                    active_loans[year]['count'] += info['count']
+                    active_loans[year].count += info.count
         
         # === החזרי הלוואות ===
         total_repayments = 0
         loans_to_remove = []
         
         for loan_year, loan_info in active_loans.items():
-            if loan_info['years_left'] > 0:
-                repayment = loan_info['yearly_payment'] * loan_info['count']
+            if loan_info.years_left > 0:
+                repayment = loan_info.yearly_payment * loan_info.count
                 total_repayments += repayment
-                loan_info['years_left'] -= 1
+                loan_info.years_left -= 1
                 
-                if loan_info['years_left'] <= 0:
+                if loan_info.years_left <= 0:
                     loans_to_remove.append(loan_year)
         
         for ly in loans_to_remove:
@@ -207,11 +235,11 @@ def compute_existing_projection(
         total_fees = 0
         paying_count = 0
         
-        for child_id, info in fee_payers.items():
+        for info in fee_payers:
             # משלמים מ-2026 עד pay_until_year (כולל)
-            if year >= start_year and year <= info['pay_until_year']:
-                total_fees += info['fee_amount']
-                paying_count += info['count']
+            if year >= start_year and year <= info.pay_until_year:
+                total_fees += info.fee_amount
+                paying_count += info.count
         
         # === סיכום ===
         money_in = int(total_repayments + total_fees)
@@ -235,3 +263,177 @@ def compute_existing_projection(
     
     return df_result
 
+
+# ======================================================
+# מנוע וקטורי (מערכי הפרשים)
+# ======================================================
+
+def existing_loan_groups(
+    loan_years: np.ndarray,
+    num_children: np.ndarray,
+    monthly_fees: np.ndarray,
+    offsets: np.ndarray,
+    weights: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    פירוק שורות טבלת הקיימים לקבוצות (שורה × סטייה)
+
+    Returns:
+        tuple: (שנת הלוואה בפועל (R*D,), מספר ילדים (..., R*D),
+                דמי מנוי חודשי לילד (R*D,))
+    """
+    weights = np.asarray(weights, dtype=float)
+    actual_loan_year = (np.asarray(loan_years)[:, None] + np.asarray(offsets)[None, :]).ravel()
+    counts = (np.asarray(num_children, dtype=float)[:, None] * weights[..., None, :])
+    counts = counts.reshape(counts.shape[:-2] + (-1,))                  # (..., R*D)
+    fee_per_group = np.repeat(np.asarray(monthly_fees, dtype=float), len(offsets))
+    return actual_loan_year, counts, fee_per_group
+
+
+def existing_cashflow_arrays(
+    loan_years: np.ndarray,
+    num_children: np.ndarray,
+    monthly_fees: np.ndarray,
+    offsets: np.ndarray,
+    weights: np.ndarray,
+    loan_amount: int,
+    repayment_months: int,
+    start_year: int = 2026,
+    end_year: int = 2075
+) -> Dict[str, np.ndarray]:
+    """
+    ליבת מודל הקיימים בעזרת מערכי הפרשים
+
+    כל קבוצה (שורה × סטייה) כותבת את חלון דמי המנוי שלה ואת חלון ההחזרים
+    שלה כשתי נקודות במערך הפרשים, והסכום המצטבר נותן את הסכומים השנתיים.
+    העלות היא O(קבוצות + שנים) במקום O(קבוצות × שנים).
+
+    Args:
+        loan_years: שנת הלוואה בסיסית לכל שורה (R,)
+        num_children: מספר ילדים לכל שורה (R,)
+        monthly_fees: דמי מנוי חודשי לכל שורה (R,)
+        offsets: סטיות בשנים (D,)
+        weights: אחוז/100 לכל סטייה (..., D) - ממדי אצווה מובילים משודרים
+        loan_amount: גובה הלוואה אחיד
+        repayment_months: מספר חודשי החזר
+        start_year: שנת התחלה
+        end_year: שנת סיום
+
+    Returns:
+        dict של מערכים (..., Y): loans_count, loans_amount, repayments,
+        fee_payers, fees
+    """
+    num_years = end_year - start_year + 1
+    repayment_years = repayment_months / 12
+    yearly_payment_per_loan = loan_amount / repayment_years
+
+    actual_loan_year, counts, fee_per_group = existing_loan_groups(
+        loan_years, num_children, monthly_fees, offsets, weights
+    )
+    count('existing.groups', counts.size)
+
+    # ילדים שההלוואה שלהם לפני start_year - רק יתרת ההחזר שנשארה
+    already_given = actual_loan_year < start_year
+    remaining_years = np.where(
+        already_given,
+        repayment_years - (start_year - actual_loan_year),
+        repayment_years
+    )
+    pay_until_year = np.trunc(np.where(
+        already_given,
+        start_year + remaining_years,
+        actual_loan_year + repayment_years
+    )).astype(np.int64)
+    active = (counts > 0) & ~(already_given & (remaining_years <= 0))
+    counts = np.where(active, counts, 0.0)
+
+    # === הלוואות ניתנות בשנת ההלוואה בפועל ===
+    given_index = np.where(already_given, num_years, actual_loan_year - start_year)
+    loans_count = range_add(counts, given_index, given_index + 1, num_years)
+
+    # === החזרים: ceil(שנים שנותרו) תשלומים מתחילת ההחזר ===
+    repayment_start = np.where(already_given, 0, actual_loan_year - start_year)
+    payments = np.maximum(np.ceil(remaining_years), 0).astype(np.int64)
+    repayments = range_add(
+        yearly_payment_per_loan * counts, repayment_start, repayment_start + payments, num_years
+    )
+
+    # === דמי מנוי: מ-start_year עד pay_until_year (כולל) ===
+    fee_stop = pay_until_year - start_year + 1
+    fee_payers = range_add(counts, 0, fee_stop, num_years)
+    fees = range_add(fee_per_group * counts, 0, fee_stop, num_years)
+
+    return {
+        'loans_count': loans_count,
+        'loans_amount': loans_count * loan_amount,
+        'repayments': repayments,
+        'fee_payers': fee_payers,
+        'fees': fees,
+    }
+
+
+def existing_roster_arrays(df_existing_loans: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """
+    המרת טבלת הקיימים למערכים, עם אותן המרות int/float כמו בלולאה
+
+    Returns:
+        dict עם: loan_years, num_children, monthly_fees
+    """
+    return {
+        'loan_years': df_existing_loans['שנת_הלוואה'].to_numpy(dtype=float).astype(np.int64),
+        'num_children': np.trunc(df_existing_loans['מספר_ילדים'].to_numpy(dtype=float)),
+        'monthly_fees': df_existing_loans['דמי_מנוי_חודשי'].to_numpy(dtype=float),
+    }
+
+
+def compute_existing_projection_vectorized(
+    df_existing_loans: pd.DataFrame,
+    loan_amount: int,
+    repayment_months: int,
+    start_year: int = 2026,
+    end_year: int = 2075,
+    distribution_mode: str = "none",
+    distribution_df = None
+) -> pd.DataFrame:
+    """
+    חישוב תזרים מזומנים לילדים קיימים - מנוע מערכי הפרשים
+
+    אותה חתימה ואותן עמודות כמו compute_existing_projection, אבל מתאים
+    גם לרשימת ילדים אמיתית עם אלפי שורות.
+    השקילות מול הלולאה נבדקת ב-app.checks.check_existing_engine.
+
+    Returns:
+        DataFrame עם תזרים שנתי לקיימים
+    """
+    offsets, pct = distribution_arrays(distribution_mode, distribution_df)
+
+    flows = existing_cashflow_arrays(
+        **existing_roster_arrays(df_existing_loans),
+        offsets=offsets,
+        weights=pct / 100,
+        loan_amount=loan_amount,
+        repayment_months=repayment_months,
+        start_year=start_year,
+        end_year=end_year
+    )
+    return existing_flows_to_frame(flows, start_year)
+
+
+def existing_flows_to_frame(flows: Dict[str, np.ndarray], start_year: int = 2026) -> pd.DataFrame:
+    """בניית טבלת התוצאות מהמערכים של existing_cashflow_arrays (תרחיש יחיד)"""
+    money_in = truncate(flows['repayments'] + flows['fees'])
+    money_out = truncate(flows['loans_amount'])
+
+    df_result = pd.DataFrame({
+        'שנה': np.arange(start_year, start_year + len(money_in)),
+        'הלוואות_ניתנו': flows['loans_count'],
+        'כסף_יוצא': money_out,
+        'החזרי_הלוואות': truncate(flows['repayments']),
+        'משלמי_דמי_מנוי': flows['fee_payers'],
+        'דמי_מנוי': truncate(flows['fees']),
+        'כסף_נכנס': money_in,
+        'איזון': money_in - money_out,
+    })
+    df_result['יתרה_מצטברת'] = df_result['איזון'].cumsum()
+
+    return df_result
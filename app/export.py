@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+export.py - ייצוא CSV ו-Excel לפי דרישה, עם מטמון
+
+בעבר כל rerun בנה שלושה CSV וחוברת Excel של חמישה גיליונות, גם כשאף אחד
+לא לחץ על הורדה. כאן הקבצים נבנים רק כשמבקשים אותם, ונשמרים במטמון לפי
+hash התרחיש ומספר השנים להצגה - תרחיש זהה מקבל את אותם bytes בלי לבנות
+מחדש.
+
+ה-Excel נכתב בחוברת write_only של openpyxl: שורות נכתבות ישירות לזרם
+ולא נשמרים אובייקטי תא בזיכרון.
+"""
+
+from io import BytesIO
+from typing import Callable, Dict
+
+import pandas as pd
+from openpyxl import Workbook
+
+from .cache import ProjectionCache, scenario_hash
+from .core import ScenarioParams
+from .instrument import stage
+
+
+# סוגי הייצוא: מפתח → (שם קובץ, סוג MIME)
+EXPORT_FILES = {
+    'existing_csv': ("קיימים.csv", "text/csv"),
+    'new_csv': ("חדשות.csv", "text/csv"),
+    'combined_csv': ("מאוחד.csv", "text/csv"),
+    'report_xlsx': ("דוח_קהילה.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+
+def csv_bytes(df: pd.DataFrame) -> bytes:
+    """CSV עם BOM כדי שאקסל יזהה עברית"""
+    return df.to_csv(index=False).encode('utf-8-sig')
+
+
+def excel_bytes(sheets: Dict[str, pd.DataFrame]) -> bytes:
+    """
+    חוברת Excel עם גיליון לכל טבלה
+
+    Args:
+        sheets: שם גיליון → טבלה (לפי סדר הגיליונות)
+    """
+    workbook = Workbook(write_only=True)
+    for name, df in sheets.items():
+        sheet = workbook.create_sheet(title=name)
+        sheet.append([str(col) for col in df.columns])
+        for row in df.astype(object).itertuples(index=False, name=None):
+            sheet.append(row)
+
+    output = BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+# מטמון משותף לכל הסשנים - bytes מוכנים להורדה
+export_cache = ProjectionCache(maxsize=16)
+
+
+def export_key(params: ScenarioParams, display_years: int) -> str:
+    """מפתח לבקשת ייצוא: התרחיש ומספר השנים שמוצגות (ולכן מיוצאות)"""
+    return f'{scenario_hash(params)}:{display_years}'
+
+
+def get_export(
+    params: ScenarioParams,
+    kind: str,
+    display_years: int,
+    build: Callable[[], bytes]
+) -> bytes:
+    """
+    bytes של קובץ ייצוא מהמטמון, או בנייה ושמירה אם אינו קיים
+
+    Args:
+        params: פרמטרי התרחיש
+        kind: אחד מ-EXPORT_FILES
+        display_years: מספר השנים בטבלאות המיוצאות
+        build: פונקציה שבונה את ה-bytes (נקראת רק בהחטאה)
+    """
+    if kind not in EXPORT_FILES:
+        raise ValueError(f"סוג ייצוא לא מוכר: {kind}")
+
+    def compute(_):
+        with stage(f'export.{kind}'):
+            return build()
+    return export_cache.get_or_compute(params, compute, namespace=f'{kind}:{display_years}:')
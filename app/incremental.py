@@ -0,0 +1,411 @@
+# -*- coding: utf-8 -*-
+"""
+incremental.py - חישוב מחדש חלקי כשעורכים שורה בטבלה
+
+עריכת תא אחד בטבלה השנתית (או שורה אחת בטבלת הקיימים) לא משנה את רוב
+הקוהורטות. כאן נשמרות תרומות לפי קוהורטה, ורק השורות שהקלטים שלהן השתנו
+מחושבות מחדש. הסכומים מתעדכנים בהפחתת התרומה הישנה והוספת החדשה.
+
+חדשות - שלוש מטריצות תרומה (קוהורטה × שנה) עם סכומי עמודות שמורים:
+- חברים: גודל הקוהורטה × חלק הקוהורטה שעדיין משלם דמי מנוי בשנה
+- לווים: גודל הקוהורטה × חלק הקוהורטה בתקופת החתונות בשנה
+- החזרי דמי מנוי: לפי שנת החתונה האחרונה של כל תת-קוהורטה
+ובנוסף מטריצת החזרי הלוואות לפי שנת מתן ההלוואה.
+
+עריכת מצטרפים בשנה k מחשבת מחדש רק את שורה k (ואת החזרי ההלוואות בשנים
+שבהן סך ההלוואות השתנה). עריכת חודשי החזר בשנה k מחשבת מחדש את עמודה k
+של מטריצת החברים. שינוי מבני (גיל נישואין, פיזור, שורות שנוספו/נמחקו)
+בונה הכל מחדש. באופק ארוך מ-INCREMENTAL_MAX_YEARS החדשות מחושבות מהבסיס
+הלינארי של המבנה (superposition.py): עריכת מצטרפים, גובה הלוואה, אחוז לוקחים
+או דמי מנוי היא מכפלות מטריצה-וקטור, ורק שינוי מבני בונה בסיס חדש.
+
+קיימים - תרומה לכל שורה בטבלה; שורה שנערכה מוחלפת (ישנה החוצה, חדשה פנימה).
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from .arrays import distribution_arrays, unique_offsets
+from .core import ProjectionResult, ScenarioParams, _merge_projections, scenario_yearly_arrays
+from .existing import existing_cashflow_arrays, existing_flows_to_frame, existing_roster_arrays
+from .instrument import count, stage
+from .new import new_flows_to_frame
+from .superposition import LinearBasis, linear_basis
+
+
+# אחרי כמה עדכונים חלקיים מסכמים את המטריצות מחדש (מונע הצטברות שגיאת עיגול)
+RESUM_EVERY = 256
+
+# בניית מטריצות התרומה של החדשות היא O(שנים² × סטיות). באופק ארוך מזה
+# משתמשים בבסיס הלינארי, שנבנה ב-O(שנים²) ונשמר במטמון משותף לפי מבנה
+INCREMENTAL_MAX_YEARS = 120
+
+# מפתחות התזרים של הקיימים (existing_cashflow_arrays)
+EXISTING_KEYS = ('loans_count', 'loans_amount', 'repayments', 'fee_payers', 'fees')
+
+
+@dataclass
+class IncrementalStats:
+    """מונים: בניות מלאות, עדכונים חלקיים ושורות שחושבו מחדש"""
+    full_rebuilds: int = 0
+    incremental_updates: int = 0
+    cohort_rows: int = 0
+    repayment_rows: int = 0
+    existing_rows: int = 0
+
+
+# =============================================================================
+# חדשות
+# =============================================================================
+
+class NewCohortContributions:
+    """
+    תרומות לפי קוהורטה לתזרים החדשות
+
+    התוצאה זהה (עד עיגול) ל-new_cashflow_arrays על אותם קלטים.
+    """
+
+    def __init__(self, params: ScenarioParams, stats: IncrementalStats):
+        self.stats = stats
+        self.key = self.structure_key(params)
+        self.yearly = scenario_yearly_arrays(params)
+        self._updates = 0
+
+        mode = params.distribution_mode
+        offsets, pct = unique_offsets(*distribution_arrays(
+            mode, params.distribution_df if mode != "none" else None
+        ))
+        self.weights = pct / 100
+        sub_wedding_age = params.wedding_age + offsets
+        borrowing_years = max(20, params.avg_children_new_family * params.months_between_children / 12)
+        self.loans_per_year_per_family = params.avg_children_new_family / borrowing_years
+        self.refund_rate = max(params.fee_refund_percentage, 0) / 100
+
+        borrowing_end = sub_wedding_age + borrowing_years
+        self.membership_base = borrowing_end                                  # (D,)
+        self.first_age = np.maximum(sub_wedding_age, 0)                       # (D,)
+        self.last_age = np.ceil(borrowing_end).astype(np.int64) - 1           # (D,)
+        self.last_wedding_age = np.trunc(borrowing_end).astype(np.int64)      # (D,)
+
+        num_years = len(self.yearly['years'])
+        self.t = np.arange(num_years)
+        self.members = np.zeros((num_years, num_years))
+        self.borrowers = np.zeros((num_years, num_years))
+        self.refund_rows = np.zeros((num_years, num_years))
+        self.repayment_rows = np.zeros((num_years, num_years))
+        self.loans_amount = np.zeros(num_years)
+
+        self._set_member_ages()
+        all_years = self.t
+        self.members[:] = self._member_rows(all_years)
+        self.borrowers[:] = self._borrower_rows(all_years)
+        self.refund_rows[:] = self._refund_rows(all_years)
+        self.repayment_total = np.zeros(num_years)
+        self._resum()
+        self._update_loans(all_years)
+
+    @staticmethod
+    def structure_key(params: ScenarioParams) -> Tuple:
+        """כל מה שמשנה את צורת המטריצות - שינוי בו מחייב בנייה מחדש"""
+        yearly = params.df_yearly_params
+        return (
+            params.wedding_age, params.avg_children_new_family, params.months_between_children,
+            params.fee_refund_percentage, params.distribution_mode,
+            params.distribution_df.to_json() if params.distribution_mode != "none" else None,
+            tuple(yearly['שנה'].tolist()), params.start_year, params.end_year,
+        )
+
+    # --------------------------------------------------
+    # שורות ועמודות
+    # --------------------------------------------------
+    def _cohort_sizes(self, cohorts: np.ndarray) -> np.ndarray:
+        joiners = self.yearly['joiners'][cohorts]
+        return np.where(self.yearly['processed'][cohorts] & (joiners > 0), joiners, 0.0)
+
+    def _set_member_ages(self) -> None:
+        """מספר שנות חברות לכל תת-קוהורטה לפי חודשי ההחזר של כל שנה (D, Y)"""
+        repayment_years = self.yearly['repayment_months'] / 12
+        self.member_ages = np.maximum(
+            np.ceil(self.membership_base[:, None] + repayment_years[None, :]), 0
+        ).astype(np.int64)
+
+    def _member_rows(self, cohorts: np.ndarray) -> np.ndarray:
+        age = self.t[None, :] - cohorts[:, None]                              # (K, Y)
+        inside = (age[:, None, :] >= 0) & (age[:, None, :] < self.member_ages[None, :, :])
+        return self._cohort_sizes(cohorts)[:, None] * np.tensordot(self.weights, inside, axes=(0, 1))
+
+    def _member_columns(self, years: np.ndarray) -> np.ndarray:
+        age = years[None, :] - self.t[:, None]                                # (J, K)
+        inside = (age[:, None, :] >= 0) & (age[:, None, :] < self.member_ages[None, :, years])
+        return self._cohort_sizes(self.t)[:, None] * np.tensordot(self.weights, inside, axes=(0, 1))
+
+    def _borrower_rows(self, cohorts: np.ndarray) -> np.ndarray:
+        age = (self.t[None, :] - cohorts[:, None])[:, None, :]                # (K, 1, Y)
+        inside = (age >= self.first_age[None, :, None]) & (age <= self.last_age[None, :, None])
+        return self._cohort_sizes(cohorts)[:, None] * np.tensordot(self.weights, inside, axes=(0, 1))
+
+    def _refund_rows(self, cohorts: np.ndarray) -> np.ndarray:
+        rows = np.zeros((len(cohorts), len(self.t)))
+        if self.refund_rate <= 0:
+            return rows
+        fees_prefix = np.concatenate([[0.0], np.cumsum(np.where(self.yearly['processed'], self.yearly['family_fee'], 0.0))])
+        sizes = self._cohort_sizes(cohorts)
+        for d, last in enumerate(self.last_wedding_age):
+            year = cohorts + last
+            valid = (year >= 0) & (year < len(self.t))
+            paid = fees_prefix[year[valid] + 1] - fees_prefix[cohorts[valid]]
+            rows[np.flatnonzero(valid), year[valid]] += self.weights[d] * sizes[valid] * 12 * paid
+        return rows
+
+    def _repayment_rows(self, loan_years: np.ndarray) -> np.ndarray:
+        """החזרים לפי שנת מתן: ceil(R/12) תשלומים על פני השנים המעובדות"""
+        steps = np.flatnonzero(self.yearly['processed'])
+        step_of_year = np.cumsum(self.yearly['processed']) - 1
+        rows = np.zeros((len(loan_years), len(self.t)))
+        for i, year in enumerate(loan_years):
+            repayment_years = self.yearly['repayment_months'][year] / 12
+            if not self.yearly['processed'][year] or repayment_years <= 0:
+                continue
+            first = step_of_year[year]
+            paid_steps = steps[first:first + max(int(np.ceil(repayment_years)), 0)]
+            rows[i, paid_steps] = self.loans_amount[year] / repayment_years
+        return rows
+
+    # --------------------------------------------------
+    # סכומים
+    # --------------------------------------------------
+    def _resum(self) -> None:
+        self.members_total = self.members.sum(axis=0)
+        self.borrowers_total = self.borrowers.sum(axis=0)
+        self.refunds_total = self.refund_rows.sum(axis=0)
+
+    def _update_loans(self, years: np.ndarray) -> None:
+        """
+        חישוב סך ההלוואות לכל שנה, והחלפת שורות ההחזר של שנות מתן שהסכום
+        שלהן השתנה (או שמופיעות ב-years)
+        """
+        yearly = self.yearly
+        loans_count = np.where(
+            yearly['processed'],
+            self.borrowers_total * self.loans_per_year_per_family * (yearly['loan_percentage'] / 100),
+            0.0
+        )
+        loans_amount = loans_count * yearly['loan_amount']
+        changed = np.union1d(np.flatnonzero(loans_amount != self.loans_amount), years)
+        self.loans_count = loans_count
+        self.loans_amount = loans_amount
+
+        new_rows = self._repayment_rows(changed)
+        self.repayment_total = self.repayment_total - self.repayment_rows[changed].sum(axis=0) + new_rows.sum(axis=0)
+        self.repayment_rows[changed] = new_rows
+        self.stats.repayment_rows += len(changed)
+
+    def update(self, params: ScenarioParams) -> None:
+        """עדכון לפי טבלה שנתית חדשה עם אותו מבנה"""
+        new_yearly = scenario_yearly_arrays(params)
+        old_yearly = self.yearly
+
+        def changed(name: str) -> np.ndarray:
+            return np.flatnonzero(new_yearly[name] != old_yearly[name])
+
+        changed_joiners = changed('joiners')
+        changed_months = changed('repayment_months')
+        changed_fees = changed('family_fee')
+        self.yearly = new_yearly
+        if len(changed_months):
+            self._set_member_ages()
+
+        # === חברים ולווים: רק שורות הקוהורטות שהמצטרפים שלהן השתנו ===
+        if len(changed_joiners):
+            new_members = self._member_rows(changed_joiners)
+            new_borrowers = self._borrower_rows(changed_joiners)
+            self.members_total = self.members_total - self.members[changed_joiners].sum(axis=0) + new_members.sum(axis=0)
+            self.borrowers_total = self.borrowers_total - self.borrowers[changed_joiners].sum(axis=0) + new_borrowers.sum(axis=0)
+            self.members[changed_joiners] = new_members
+            self.borrowers[changed_joiners] = new_borrowers
+
+        # === חודשי החזר משנים את חלון החברות של אותה שנה - עמודה אחת ===
+        if len(changed_months):
+            self.members[:, changed_months] = self._member_columns(changed_months)
+            self.members_total = self.members_total.copy()
+            self.members_total[changed_months] = self.members[:, changed_months].sum(axis=0)
+
+        # === החזרי דמי מנוי: קוהורטות שחלון התשלום שלהן כולל שנה שהשתנתה ===
+        refund_cohorts = changed_joiners
+        if len(changed_fees) and self.refund_rate > 0:
+            span = int(self.last_wedding_age.max(initial=0))
+            covering = (changed_fees[:, None] - np.arange(span + 1)[None, :]).ravel()
+            refund_cohorts = np.union1d(refund_cohorts, covering[covering >= 0])
+        if len(refund_cohorts):
+            new_refunds = self._refund_rows(refund_cohorts)
+            self.refunds_total = self.refunds_total - self.refund_rows[refund_cohorts].sum(axis=0) + new_refunds.sum(axis=0)
+            self.refund_rows[refund_cohorts] = new_refunds
+        self.stats.cohort_rows += len(np.union1d(changed_joiners, refund_cohorts))
+
+        # === הלוואות והחזרים: רק שנות מתן שהסכום או מספר התשלומים שלהן השתנו ===
+        self._update_loans(changed_months)
+
+        self._updates += 1
+        if self._updates % RESUM_EVERY == 0:
+            self._resum()
+            self.repayment_total = self.repayment_rows.sum(axis=0)
+
+    def flows(self) -> Dict[str, np.ndarray]:
+        """מערכי התזרים בפורמט של new_cashflow_arrays"""
+        yearly = self.yearly
+        processed = yearly['processed']
+        fee_payers = np.where(processed, self.members_total, 0.0)
+        fees = fee_payers * yearly['family_fee'] * 12
+        return {
+            'fee_payers': fee_payers,
+            'fees': fees,
+            'refunds': np.where(processed, self.refunds_total * self.refund_rate, 0.0),
+            'loans_count': self.loans_count,
+            'loans_amount': self.loans_amount,
+            'repayments': self.repayment_total,
+            'cumulative_families': np.cumsum(self._cohort_sizes(self.t)),
+        }
+
+
+# =============================================================================
+# קיימים
+# =============================================================================
+
+class ExistingRowContributions:
+    """
+    תרומות לפי שורה בטבלת הקיימים
+
+    המודל לינארי בשורות: התזרים הוא סכום התזרימים של כל שורה בנפרד.
+    """
+
+    def __init__(self, params: ScenarioParams, stats: IncrementalStats):
+        self.stats = stats
+        self.key = self.structure_key(params)
+        mode = params.existing_distribution_mode
+        self.offsets, pct = distribution_arrays(
+            mode, params.existing_distribution_df if mode != "none" else None
+        )
+        self.weights = pct / 100
+        self.loan_amount = params.existing_loan_amount
+        self.repayment_months = params.existing_repayment_months
+        self.start_year = params.start_year
+        self.end_year = params.end_year
+        self.roster = existing_roster_arrays(params.df_existing_loans)
+        self.totals = self._contribution(self.roster)
+        self._updates = 0
+
+    @staticmethod
+    def structure_key(params: ScenarioParams) -> Tuple:
+        mode = params.existing_distribution_mode
+        return (
+            params.existing_loan_amount, params.existing_repayment_months, mode,
+            params.start_year, params.end_year,
+            params.existing_distribution_df.to_json() if mode != "none" else None,
+            len(params.df_existing_loans),
+        )
+
+    def _contribution(self, roster: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        return existing_cashflow_arrays(
+            **roster,
+            offsets=self.offsets,
+            weights=self.weights,
+            loan_amount=self.loan_amount,
+            repayment_months=self.repayment_months,
+            start_year=self.start_year,
+            end_year=self.end_year
+        )
+
+    def update(self, params: ScenarioParams) -> None:
+        """החלפת התרומה של שורות שנערכו"""
+        roster = existing_roster_arrays(params.df_existing_loans)
+        changed = np.zeros(len(roster['loan_years']), dtype=bool)
+        for name, values in roster.items():
+            changed |= values != self.roster[name]
+        rows = np.flatnonzero(changed)
+        if len(rows) == 0:
+            return
+
+        old = self._contribution({name: values[rows] for name, values in self.roster.items()})
+        new = self._contribution({name: values[rows] for name, values in roster.items()})
+        self.totals = {key: self.totals[key] - old[key] + new[key] for key in EXISTING_KEYS}
+        self.roster = roster
+        self.stats.existing_rows += len(rows)
+
+        # סכום מחדש מדי פעם, כדי ששגיאות עיגול של החיסור/חיבור לא יצטברו
+        self._updates += 1
+        if self._updates % RESUM_EVERY == 0:
+            self.totals = self._contribution(self.roster)
+
+    def flows(self) -> Dict[str, np.ndarray]:
+        return self.totals
+
+
+# =============================================================================
+# מנוע מאוחד
+# =============================================================================
+
+class IncrementalProjection:
+    """
+    מחשב תחזיות שזוכר את התרחיש הקודם ומעדכן רק את מה שהשתנה
+
+    run(params) מחזיר ProjectionResult כמו core.run. מופע אחד לכל סשן
+    (לא בטוח לשימוש מכמה threads במקביל).
+    """
+
+    def __init__(self):
+        self.stats = IncrementalStats()
+        self._new: Optional[NewCohortContributions] = None
+        self._basis: Optional[LinearBasis] = None
+        self._existing: Optional[ExistingRowContributions] = None
+
+    def _sync_new(self, params: ScenarioParams) -> bool:
+        if params.end_year - params.start_year + 1 > INCREMENTAL_MAX_YEARS:
+            basis = linear_basis(params)
+            rebuilt = basis is not self._basis
+            self._new, self._basis = None, basis
+            return rebuilt
+        self._basis = None
+        if self._new is None or self._new.key != NewCohortContributions.structure_key(params):
+            self._new = NewCohortContributions(params, self.stats)
+            return True
+        self._new.update(params)
+        return False
+
+    def _sync_existing(self, params: ScenarioParams) -> bool:
+        if self._existing is None or self._existing.key != ExistingRowContributions.structure_key(params):
+            self._existing = ExistingRowContributions(params, self.stats)
+            return True
+        self._existing.update(params)
+        return False
+
+    def run(self, params: ScenarioParams) -> ProjectionResult:
+        """
+        חישוב תחזיות לתרחיש, תוך שימוש חוזר בתרומות מהקריאה הקודמת
+
+        Returns:
+            ProjectionResult
+        """
+        before = (self.stats.cohort_rows, self.stats.repayment_rows, self.stats.existing_rows)
+        with stage('engine.new'):
+            rebuilt_new = self._sync_new(params)
+        with stage('engine.existing'):
+            rebuilt_existing = self._sync_existing(params)
+        if rebuilt_new or rebuilt_existing:
+            self.stats.full_rebuilds += 1
+        if not (rebuilt_new and rebuilt_existing):
+            self.stats.incremental_updates += 1
+        count('incremental.rebuilds', int(rebuilt_new) + int(rebuilt_existing))
+        count('incremental.cohort_rows', self.stats.cohort_rows - before[0])
+        count('incremental.repayment_rows', self.stats.repayment_rows - before[1])
+        count('incremental.existing_rows', self.stats.existing_rows - before[2])
+
+        with stage('frames'):
+            df_existing = existing_flows_to_frame(self._existing.flows(), params.start_year)
+            if self._new is None:
+                df_new = new_flows_to_frame(scenario_yearly_arrays(params), self._basis.scenario_flows(params))
+            else:
+                df_new = new_flows_to_frame(self._new.yearly, self._new.flows())
+        with stage('merge'):
+            df_combined = _merge_projections(df_existing, df_new, params.initial_balance)
+        return ProjectionResult(df_existing, df_new, df_combined)
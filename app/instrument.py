@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+instrument.py - מדידת זמן לפי שלב ומוני עבודה
+
+כשה-rerun איטי צריך לדעת לאן הולך הזמן: מנועים, מיזוג, גרפים או ייצוא.
+    with stage('merge'):
+        ...
+    count('new.cohort_cells', num_years * num_deviations)
+
+המדידה פעילה רק בתוך recording() - אחרת stage מחזיר אובייקט no-op משותף
+ו-count רק קורא ContextVar, כך שהעלות זניחה. בסוף כל recording נכתבת
+שורת JSON ללוג מתגלגל מקומי (logs/perf.log, או KEHILA_PERF_LOG).
+"""
+
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+
+LOG_PATH = Path(os.environ.get('KEHILA_PERF_LOG', Path(__file__).resolve().parent.parent / 'logs' / 'perf.log'))
+LOG_MAX_BYTES = 1_000_000
+LOG_BACKUPS = 3
+
+_current: ContextVar[Optional["Recorder"]] = ContextVar('kehila_recorder', default=None)
+_disabled = nullcontext()
+_logger: Optional[logging.Logger] = None
+
+
+class Recorder:
+    """צובר זמנים לפי שלב (סכום וקריאות) ומונים"""
+
+    def __init__(self, label: str = ''):
+        self.label = label
+        self.started = time.perf_counter()
+        self.total_seconds = 0.0
+        self.stages: Dict[str, List[float]] = {}   # שם → [שניות, קריאות]
+        self.counters: Dict[str, int] = {}
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        entry = self.stages.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+    def add_count(self, name: str, n: int) -> None:
+        self.counters[name] = self.counters.get(name, 0) + int(n)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'label': self.label,
+            'total_ms': round(self.total_seconds * 1000, 2),
+            'stages': {name: {'ms': round(s * 1000, 2), 'calls': calls} for name, (s, calls) in self.stages.items()},
+            'counters': dict(self.counters),
+        }
+
+
+class _Stage:
+    __slots__ = ('recorder', 'name', 'started')
+
+    def __init__(self, recorder: Recorder, name: str):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.add_stage(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def stage(name: str):
+    """context manager שמוסיף את זמן הבלוק לשלב name (no-op כשאין הקלטה)"""
+    recorder = _current.get()
+    if recorder is None:
+        return _disabled
+    return _Stage(recorder, name)
+
+
+def count(name: str, n: int = 1) -> None:
+    """הוספה למונה name (no-op כשאין הקלטה)"""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.add_count(name, n)
+
+
+def active() -> bool:
+    """האם יש הקלטה פעילה"""
+    return _current.get() is not None
+
+
+def _perf_logger() -> logging.Logger:
+    global _logger
+    if _logger is None:
+        logger = logging.getLogger('kehila.perf')
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        try:
+            LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            logger.addHandler(handler)
+        except OSError:
+            logger.addHandler(logging.NullHandler())
+        _logger = logger
+    return _logger
+
+
+def _finish(recorder: Recorder, log: bool) -> None:
+    recorder.total_seconds = time.perf_counter() - recorder.started
+    if log:
+        _perf_logger().info(json.dumps(recorder.as_dict(), ensure_ascii=False))
+
+
+def begin_recording(label: str = '', enabled: bool = True) -> Optional[Recorder]:
+    """
+    התחלת מדידה לסקריפט שלא עטוף בבלוק אחד (kehila.py)
+
+    מחליפה כל מדידה שנשארה פתוחה - rerun שנקטע ב-st.rerun או st.stop
+    לא מגיע ל-end_recording, וה-thread של הסשן ממשיך לשמש את ה-rerun הבא.
+
+    Returns:
+        Recorder, או None כש-enabled=False (ואז המדידה כבויה)
+    """
+    recorder = Recorder(label) if enabled else None
+    _current.set(recorder)
+    return recorder
+
+
+def end_recording(recorder: Recorder, log: bool = True) -> None:
+    """סיום מדידה שהתחילה ב-begin_recording, וכתיבה ללוג המתגלגל"""
+    if _current.get() is recorder:
+        _current.set(None)
+    _finish(recorder, log)
+
+
+@contextmanager
+def recording(label: str = '', log: bool = True) -> Iterator[Recorder]:
+    """
+    הפעלת מדידה לבלוק; בסוף נכתבת שורה ללוג המתגלגל
+
+    Yields:
+        Recorder - אפשר לקרוא אותו גם בזמן הבלוק
+    """
+    recorder = Recorder(label)
+    token = _current.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current.reset(token)
+        _finish(recorder, log)
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+microsim.py - מיקרו-סימולציה של משפחות חדשות (רשומה לכל משפחה ולכל ילד)
+
+מודל הקוהורטות מחשב תת-קוהורטות כשברי משפחות (new_families × אחוז), ולכן
+אין בו תשובה לשאלות ברמת משק בית - כמה משפחות מחזיקות שתי הלוואות פעילות
+באותה שנה, או מה ההחזר מדמי המנוי שמגיע למשפחה מסוימת. כאן כל משפחה וכל
+ילד הם רשומה, באותם כללים של מודל הקוהורטות:
+- כל שנה מצטרפות בדיוק מצטרפים_חדשים משפחות; הסטייה בגיל הנישואין של כל
+  משפחה מוגרלת שיטתית (systematic sampling) לפי טבלת הפיזור, כך שמספר
+  המשפחות בכל סטייה קרוב ככל האפשר ל-new_families × אחוז. משפחות מעבר
+  לסך האחוזים הן "לא מתחתנות" - נספרות במצטברות ולא משלמות
+- לכל משפחה avg_children ילדים (חלק שבור - בהגרלה), והחתונות שלהם פרוסות
+  במרווחים שווים על תקופת החתונות, עם פאזה אקראית למשפחה
+- ילד לוקח הלוואה בשנת החתונה בהסתברות אחוז_לוקחי_הלוואה של אותה שנה;
+  ההחזר, תקופת החברות והחזר דמי המנוי - כמו בלולאה
+
+הרשומות נשמרות בעמודות (DataFrame), והחישוב רץ על נתחים של chunk_size
+משפחות - מטריצות (משפחות × שנים) רק לנתח אחד, כך שהזיכרון חסום גם למאות
+אלפי משפחות. הסכומים השנתיים מתיישבים מול compute_new_projection
+(reconcile) עד רעש הדגימה ועיגול המשפחות.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from .arrays import distribution_arrays, range_add, unique_offsets
+from .cache import ProjectionCache
+from .core import ScenarioParams, scenario_yearly_arrays
+from .instrument import count, stage
+from .new import new_flows_to_frame
+
+
+@dataclass(frozen=True)
+class MicrosimSettings:
+    """הגדרות המיקרו-סימולציה"""
+    seed: int = 0
+    chunk_size: int = 8192         # משפחות לנתח (חוסם את גודל המטריצות)
+
+
+@dataclass
+class MicrosimResult:
+    """
+    תוצאת מיקרו-סימולציה
+
+    df_yearly - אותן עמודות כמו compute_new_projection, ועוד מספר המשפחות
+    עם הלוואה פעילה אחת לפחות ועם שתיים לפחות בכל שנה.
+    df_families / df_children - רשומה לכל משפחה ולכל ילד.
+    """
+    df_yearly: pd.DataFrame
+    df_families: pd.DataFrame
+    df_children: pd.DataFrame
+    elapsed_seconds: float
+
+
+# =============================================================================
+# אוכלוסייה
+# =============================================================================
+
+def _draw_families(yearly: Dict[str, np.ndarray], weights: np.ndarray,
+                   avg_children: float, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    """
+    רשומות המשפחות לכל האופק (בלי ילדים)
+
+    Returns:
+        dict של עמודות: join_index (אינדקס שנת ההצטרפות), slot (אינדקס
+        הסטייה, או -1 ללא מתחתנת), children, phase
+    """
+    joiners = np.where(yearly['processed'] & (yearly['joiners'] > 0), yearly['joiners'], 0).astype(np.int64)
+    num_families = int(joiners.sum())
+    join_index = np.repeat(np.arange(len(joiners)), joiners)
+
+    # דגימה שיטתית בתוך כל שנה: מיקום (i + u) / n על ההתפלגות המצטברת
+    first = np.repeat(np.cumsum(joiners) - joiners, joiners)
+    rank = np.arange(num_families) - first
+    shift = np.repeat(rng.random(len(joiners)), joiners)
+    position = (rank + shift) / np.repeat(np.maximum(joiners, 1), joiners)
+
+    total = weights.sum()
+    cumulative = np.cumsum(weights / max(total, 1.0))
+    if total >= 1 - 1e-9:
+        cumulative[-1] = 1.0
+    slot = np.searchsorted(cumulative, position, side='right')
+    slot = np.where(slot < len(weights), slot, -1)
+
+    whole = int(np.floor(avg_children))
+    children = whole + (rng.random(num_families) < avg_children - whole)
+
+    return {
+        'join_index': join_index,
+        'slot': slot,
+        'children': children.astype(np.int64),
+        'phase': rng.random(num_families),
+    }
+
+
+# =============================================================================
+# סימולציה
+# =============================================================================
+
+def run_microsim(params: ScenarioParams, settings: MicrosimSettings = MicrosimSettings()) -> MicrosimResult:
+    """
+    הרצת המיקרו-סימולציה לתרחיש
+
+    Args:
+        params: פרמטרי התרחיש (רק החלק של החדשות משמש)
+        settings: seed וגודל נתח
+
+    Returns:
+        MicrosimResult
+    """
+    started = time.perf_counter()
+    rng = np.random.default_rng(settings.seed)
+
+    yearly = scenario_yearly_arrays(params)
+    years = yearly['years']
+    num_years = len(years)
+    processed = yearly['processed']
+    steps = np.flatnonzero(processed)
+    step_rank = np.cumsum(processed) - 1               # שנה קלנדרית → אינדקס בין המעובדות
+
+    mode = params.distribution_mode
+    offsets, pct = unique_offsets(*distribution_arrays(
+        mode, params.distribution_df if mode != "none" else None
+    ))
+    borrowing_years = max(20, params.avg_children_new_family * params.months_between_children / 12)
+    repayment_years = yearly['repayment_months'] / 12
+    yearly_fee = np.where(processed, yearly['family_fee'] * 12, 0.0)
+    refund_rate = max(params.fee_refund_percentage, 0) / 100
+
+    families = _draw_families(yearly, pct / 100, params.avg_children_new_family, rng)
+    num_families = len(families['join_index'])
+    count('microsim.families', num_families)
+
+    # === צוברים שנתיים ===
+    totals = {name: np.zeros(num_years) for name in (
+        'fee_payers', 'refunds', 'loans_count', 'loans_amount', 'active_one', 'active_two'
+    )}
+    repayments_by_step = np.zeros(len(steps))
+
+    # === עמודות פר משפחה ופר ילד ===
+    fees_paid = np.zeros(num_families)
+    refund_amount = np.zeros(num_families)
+    refund_year = np.zeros(num_families, dtype=np.int64)
+    loans_taken = np.zeros(num_families, dtype=np.int64)
+    amount_borrowed = np.zeros(num_families)
+    max_active = np.zeros(num_families, dtype=np.int64)
+    child_columns = []
+
+    t = np.arange(num_years)
+    chunk_size = max(int(settings.chunk_size), 1)
+    for a in range(0, num_families, chunk_size):
+        b = min(a + chunk_size, num_families)
+        join = families['join_index'][a:b]
+        slot = families['slot'][a:b]
+        marries = slot >= 0
+        wedding_age = np.where(marries, params.wedding_age + offsets[np.maximum(slot, 0)], 0)
+        size = b - a
+
+        # --------------------------------------------------
+        # חברות ודמי מנוי: 0 <= age < wedding_age + borrowing + repayment
+        # --------------------------------------------------
+        age = t[None, :] - join[:, None]                                          # (F, Y)
+        member = marries[:, None] & processed & (age >= 0) \
+            & (age < wedding_age[:, None] + borrowing_years + repayment_years[None, :])
+        paid = np.cumsum(member * yearly_fee, axis=1)
+        totals['fee_payers'] += member.sum(axis=0)
+        fees_paid[a:b] = paid[:, -1]
+
+        # --------------------------------------------------
+        # החזר דמי מנוי בשנת חתונת הילד האחרון (שנה מעובדת בתוך האופק)
+        # --------------------------------------------------
+        refund_index = join + np.trunc(wedding_age + borrowing_years).astype(np.int64)
+        due = marries & (refund_index >= join) & (refund_index < num_years)
+        due[due] = processed[refund_index[due]]
+        if refund_rate > 0 and due.any():
+            rows = np.flatnonzero(due)
+            refund_amount[a + rows] = refund_rate * paid[rows, refund_index[rows]]
+            totals['refunds'] += np.bincount(refund_index[rows], weights=refund_amount[a + rows], minlength=num_years)
+        refund_year[a:b] = np.where(due, years[np.minimum(refund_index, num_years - 1)], 0)
+
+        # --------------------------------------------------
+        # ילדים: חתונות במרווחים שווים על תקופת החתונות
+        # --------------------------------------------------
+        children = families['children'][a:b]
+        family = np.repeat(np.arange(size), children)
+        order = np.arange(len(family)) - np.repeat(np.cumsum(children) - children, children)
+        phase = families['phase'][a:b][family]
+        child_age = wedding_age[family] + np.floor((order + phase) * borrowing_years / children[family]).astype(np.int64)
+        wedding_index = join[family] + child_age
+        in_window = marries[family] & (child_age >= 0) & (wedding_index < num_years)
+        in_window[in_window] = processed[wedding_index[in_window]]
+        draw = rng.random(len(family))
+        index = np.minimum(wedding_index, num_years - 1)
+        borrowed = in_window & (draw < yearly['loan_percentage'][index] / 100)
+
+        # --------------------------------------------------
+        # הלוואות והחזרים: ceil(R/12) תשלומים על פני השנים המעובדות
+        # --------------------------------------------------
+        loan_index = wedding_index[borrowed]
+        amount = yearly['loan_amount'][loan_index]
+        years_to_repay = repayment_years[loan_index]
+        payments = np.maximum(np.ceil(years_to_repay), 0).astype(np.int64)
+        first_step = step_rank[loan_index]
+        totals['loans_count'] += np.bincount(loan_index, minlength=num_years)
+        totals['loans_amount'] += np.bincount(loan_index, weights=amount, minlength=num_years)
+        repayments_by_step += range_add(
+            np.divide(amount, years_to_repay, out=np.zeros_like(amount), where=years_to_repay > 0),
+            first_step, first_step + payments, len(steps)
+        )
+
+        # הלוואה פעילה מהשנה שבה ניתנה ועד השנה של התשלום האחרון
+        last_step = first_step + payments - 1
+        active_until = np.full(len(loan_index), num_years)
+        inside = last_step < len(steps)
+        active_until[inside] = steps[last_step[inside]] + 1
+        active_until = np.where(payments > 0, active_until, loan_index)
+        owner = family[borrowed]
+        width = num_years + 1
+        active = np.cumsum(np.bincount(
+            np.concatenate([owner * width + loan_index, owner * width + active_until]),
+            weights=np.concatenate([np.ones(len(owner)), -np.ones(len(owner))]),
+            minlength=size * width
+        ).reshape(size, width)[:, :num_years], axis=1).round().astype(np.int64)
+        totals['active_one'] += (active >= 1).sum(axis=0)
+        totals['active_two'] += (active >= 2).sum(axis=0)
+        max_active[a:b] = active.max(axis=1)
+        loans_taken[a:b] = np.bincount(owner, minlength=size)
+        amount_borrowed[a:b] = np.bincount(owner, weights=amount, minlength=size)
+
+        child_columns.append((
+            a + family,
+            np.where(in_window, years[index], 0),
+            borrowed,
+            np.where(borrowed, yearly['loan_amount'][index], 0.0),
+        ))
+
+    # === טבלה שנתית ===
+    fee_payers = totals['fee_payers']
+    repayments = np.zeros(num_years)
+    repayments[steps] = repayments_by_step
+    joiners = np.where(processed & (yearly['joiners'] > 0), yearly['joiners'], 0.0)
+    flows = {
+        'fee_payers': fee_payers,
+        'fees': fee_payers * yearly['family_fee'] * 12,
+        'refunds': np.where(processed, totals['refunds'], 0.0),
+        'loans_count': totals['loans_count'],
+        'loans_amount': totals['loans_amount'],
+        'repayments': repayments,
+        'cumulative_families': np.cumsum(joiners),
+    }
+    df_yearly = new_flows_to_frame(yearly, flows)
+    df_yearly['משפחות_עם_הלוואה_פעילה'] = totals['active_one'][processed].astype(np.int64)
+    df_yearly['משפחות_עם_2_הלוואות_ומעלה'] = totals['active_two'][processed].astype(np.int64)
+
+    # === טבלאות רשומות ===
+    slot = families['slot']
+    df_families = pd.DataFrame({
+        'מזהה_משפחה': np.arange(num_families),
+        'שנת_הצטרפות': years[families['join_index']],
+        'סטייה_שנים': np.where(slot >= 0, offsets[np.maximum(slot, 0)], 0),
+        'מתחתנת': slot >= 0,
+        'ילדים': families['children'],
+        'הלוואות': loans_taken,
+        'סכום_הלוואות': amount_borrowed,
+        'מקסימום_הלוואות_פעילות': max_active,
+        'דמי_מנוי_ששולמו': fees_paid,
+        'שנת_החזר_דמי_מנוי': refund_year,
+        'החזר_דמי_מנוי': refund_amount,
+    })
+    columns = [np.concatenate(parts) for parts in zip(*child_columns)] if child_columns \
+        else [np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool), np.zeros(0)]
+    df_children = pd.DataFrame(dict(zip(
+        ('מזהה_משפחה', 'שנת_חתונה', 'לקח_הלוואה', 'סכום_הלוואה'), columns
+    )))
+
+    return MicrosimResult(
+        df_yearly=df_yearly,
+        df_families=df_families,
+        df_children=df_children,
+        elapsed_seconds=time.perf_counter() - started
+    )
+
+
+# עמודות הזרימה שמושוות מול מודל הקוהורטות
+RECONCILE_COLUMNS = (
+    'משלמי_דמי_מנוי', 'דמי_מנוי', 'הלוואות_ניתנו', 'הלוואות_סכום',
+    'החזרי_הלוואות', 'החזרי_דמי_מנוי_סכום', 'איזון',
+)
+
+
+def reconcile(result: MicrosimResult, df_cohort: pd.DataFrame) -> pd.DataFrame:
+    """
+    השוואת סכומי המיקרו-סימולציה לטבלת מודל הקוהורטות
+
+    Args:
+        result: תוצאת run_microsim
+        df_cohort: compute_new_projection (או המנוע הווקטורי) לאותו תרחיש
+
+    Returns:
+        DataFrame לכל עמודה: סכום בכל מודל, סטייה יחסית בסכום, וסטייה
+        שנתית מקסימלית ביחס לשיא העמודה
+    """
+    rows = []
+    for column in RECONCILE_COLUMNS:
+        cohort = df_cohort[column].to_numpy(dtype=float)
+        micro = result.df_yearly[column].to_numpy(dtype=float)
+        scale = np.abs(cohort).max() if len(cohort) else 0.0
+        rows.append({
+            'עמודה': column,
+            'קוהורטות': cohort.sum(),
+            'מיקרו': micro.sum(),
+            'סטייה_בסכום': (micro.sum() - cohort.sum()) / abs(cohort.sum()) if cohort.sum() else 0.0,
+            'סטייה_שנתית_מקסימלית': np.abs(micro - cohort).max() / scale if scale else 0.0,
+        })
+    return pd.DataFrame(rows)
+
+
+# תוצאות גדולות (רשומה לכל ילד) - מטמון קטן בזיכרון בלבד
+microsim_cache = ProjectionCache(maxsize=2)
+
+
+def run_microsim_cached(params: ScenarioParams, settings: MicrosimSettings = MicrosimSettings()) -> MicrosimResult:
+    """run_microsim דרך המטמון, לפי hash התרחיש וה-seed"""
+    def compute(p):
+        with stage('microsim'):
+            return run_microsim(p, settings)
+    return microsim_cache.get_or_compute(params, compute, namespace=f'microsim:{settings.seed}')
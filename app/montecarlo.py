@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+montecarlo.py - מצב סטוכסטי (מונטה קרלו) לתחזית הקופה
+
+שני המנועים דטרמיניסטיים. כאן מגרילים אלפי מסלולים סביב הפרמטרים הקיימים
+ומחשבים אותם באצוות וקטוריות (ממד אצווה מוביל במנועים):
+- מצטרפים חדשים: התפלגות פואסון סביב מצטרפים_חדשים בכל שנה
+- אחוז לוקחי הלוואה: זעזוע נורמלי לכל מסלול (בנקודות אחוז), חסום ל-0..100
+- פיזור גיל נישואין: דיריכלה סביב טבלת הפיזור, עם אותו אחוז לא-מתחתנים
+- גיל נישואין עצמו: הזזה שלמה (בשנים, נורמלית מעוגלת) לכל מסלול, כשאין
+  טבלת פיזור (מצב "none") - אחרת אין לדיריכלה מה לפזר
+
+התוצאה: רצועות P5/P50/P95 ליתרת הקופה והסתברות ליתרה שלילית בכל שנה.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+
+from .arrays import distribution_arrays, truncate, unique_offsets
+from .cache import ProjectionCache
+from .core import ScenarioParams, scenario_yearly_arrays
+from .existing import existing_cashflow_arrays, existing_roster_arrays
+from .instrument import stage
+from .store import stored
+from .new import new_cashflow_arrays
+
+
+@dataclass(frozen=True)
+class MonteCarloSettings:
+    """הגדרות הסימולציה"""
+    paths: int = 10000
+    batch_size: int = 2000
+    seed: int = 0
+    loan_uptake_sd: float = 10.0               # סטיית תקן בנקודות אחוז
+    distribution_concentration: float = 200.0  # גבוה = פחות רעש בפיזור
+    wedding_age_sd: float = 1.0                # סטיית תקן בשנים, כשאין טבלת פיזור
+    percentiles: Tuple[int, int, int] = (5, 50, 95)
+
+
+@dataclass
+class MonteCarloResult:
+    """תוצאת סימולציה: רצועות לפי שנה וסיכום"""
+    df_bands: pd.DataFrame
+    probability_ever_negative: float
+    paths: int
+    elapsed_seconds: float
+
+
+def _draw_weights(rng: np.random.Generator, pct: np.ndarray, size: int, concentration: float) -> np.ndarray:
+    """הגרלת משקלות פיזור סביב pct (אחוזים), תוך שמירה על סך המתחתנים"""
+    total = pct.sum() / 100
+    if len(pct) <= 1:
+        return np.full((size, len(pct)), total)
+    return rng.dirichlet(concentration * pct / pct.sum(), size=size) * total
+
+
+def _shift_span(sd: float) -> int:
+    """הזזת גיל החתונה חסומה ל-±3 סטיות תקן"""
+    return int(np.ceil(3 * sd))
+
+
+def _draw_wedding_shift(rng: np.random.Generator, size: int, sd: float) -> np.ndarray:
+    """הזזת גיל חתונה שלמה לכל מסלול (size,)"""
+    span = _shift_span(sd)
+    return np.clip(np.rint(rng.normal(0, sd, size=size)), -span, span).astype(np.int64)
+
+
+def _existing_basis(params: ScenarioParams, settings: MonteCarloSettings):
+    """
+    תזרים הקיימים לכל סטייה בנפרד, עם משקל 1
+
+    בלי טבלת פיזור הבסיס פרוש על כל הזזות גיל החתונה האפשריות
+    (-span..span), ומשקל המסלול נופל על ההזזה שהוגרלה לו.
+
+    Returns:
+        tuple: (אחוזי הפיזור, dict עם money_in ו-money_out בצורה (D, Y))
+    """
+    existing_mode = params.existing_distribution_mode
+    offsets, pct = distribution_arrays(
+        existing_mode, params.existing_distribution_df if existing_mode != "none" else None
+    )
+    if len(pct) <= 1:
+        span = _shift_span(settings.wedding_age_sd)
+        offsets = offsets[:1] + np.arange(-span, span + 1)
+    flows = existing_cashflow_arrays(
+        **existing_roster_arrays(params.df_existing_loans),
+        offsets=offsets,
+        weights=np.eye(len(offsets)),
+        loan_amount=params.existing_loan_amount,
+        repayment_months=params.existing_repayment_months,
+        start_year=params.start_year,
+        end_year=params.end_year
+    )
+    return pct, {
+        'money_in': flows['repayments'] + flows['fees'],
+        'money_out': flows['loans_amount'],
+    }
+
+
+def _simulate_batch(params: ScenarioParams, settings: MonteCarloSettings,
+                    rng: np.random.Generator, size: int, existing_basis) -> np.ndarray:
+    """מסלולי יתרת קופה לאצווה אחת (size, Y)"""
+    yearly = scenario_yearly_arrays(params)
+    num_years = len(yearly['years'])
+
+    # === חדשות ===
+    new_mode = params.distribution_mode
+    offsets, pct = unique_offsets(*distribution_arrays(
+        new_mode, params.distribution_df if new_mode != "none" else None
+    ))
+    joiners = rng.poisson(np.maximum(yearly['joiners'], 0), size=(size, num_years)).astype(float)
+    uptake_shock = rng.normal(0, settings.loan_uptake_sd, size=(size, 1))
+    loan_percentage = np.clip(yearly['loan_percentage'] + uptake_shock, 0, 100)
+    wedding_shift = _draw_wedding_shift(rng, size, settings.wedding_age_sd)
+    wedding_age = int(params.wedding_age)
+    if len(pct) <= 1:
+        wedding_age = np.maximum(wedding_age + wedding_shift, 0)
+
+    flows = new_cashflow_arrays(
+        joiners=joiners,
+        loan_amount=yearly['loan_amount'],
+        repayment_months=yearly['repayment_months'],
+        loan_percentage=loan_percentage,
+        family_fee=yearly['family_fee'],
+        processed=yearly['processed'],
+        offsets=offsets,
+        weights=_draw_weights(rng, pct, size, settings.distribution_concentration),
+        wedding_age=wedding_age,
+        avg_children=params.avg_children_new_family,
+        months_between_children=params.months_between_children,
+        fee_refund_percentage=params.fee_refund_percentage
+    )
+    new_net = truncate(flows['repayments'] + flows['fees']) \
+        - truncate(flows['loans_amount'] + flows['refunds'])
+
+    # === קיימים ===
+    # המודל לינארי במשקלות הפיזור, ולכן מספיק בסיס אחד לכל סטייה
+    ex_pct, ex_basis = existing_basis
+    if len(ex_pct) <= 1:
+        span = _shift_span(settings.wedding_age_sd)
+        ex_weights = (wedding_shift[:, None] == np.arange(-span, span + 1)) * (ex_pct.sum() / 100)
+    else:
+        ex_weights = _draw_weights(rng, ex_pct, size, settings.distribution_concentration)
+    existing_net = truncate(ex_weights @ ex_basis['money_in']) - truncate(ex_weights @ ex_basis['money_out'])
+
+    return params.initial_balance + np.cumsum(existing_net + new_net, axis=-1)
+
+
+def run_monte_carlo(params: ScenarioParams, settings: MonteCarloSettings = MonteCarloSettings()) -> MonteCarloResult:
+    """
+    הרצת סימולציית מונטה קרלו באצוות
+
+    Args:
+        params: פרמטרי התרחיש (הערכים הדטרמיניסטיים הם מרכז ההגרלה)
+        settings: מספר מסלולים, גודל אצווה, seed ורמות רעש
+
+    Returns:
+        MonteCarloResult עם טבלת רצועות לפי שנה
+    """
+    started = time.perf_counter()
+    rng = np.random.default_rng(settings.seed)
+    existing_basis = _existing_basis(params, settings)
+
+    batches = []
+    remaining = settings.paths
+    while remaining > 0:
+        size = min(settings.batch_size, remaining)
+        batches.append(_simulate_batch(params, settings, rng, size, existing_basis))
+        remaining -= size
+    balances = np.concatenate(batches, axis=0)
+
+    low, mid, high = np.percentile(balances, settings.percentiles, axis=0)
+    df_bands = pd.DataFrame({
+        'שנה': scenario_yearly_arrays(params)['years'],
+        f'יתרת_קופה_P{settings.percentiles[0]}': low,
+        f'יתרת_קופה_P{settings.percentiles[1]}': mid,
+        f'יתרת_קופה_P{settings.percentiles[2]}': high,
+        'הסתברות_יתרה_שלילית': (balances < 0).mean(axis=0),
+    })
+
+    return MonteCarloResult(
+        df_bands=df_bands,
+        probability_ever_negative=float((balances < 0).any(axis=1).mean()),
+        paths=settings.paths,
+        elapsed_seconds=time.perf_counter() - started
+    )
+
+
+# מטמון קטן - תוצאת סימולציה תלויה גם בהגדרות
+monte_carlo_cache = ProjectionCache(maxsize=8)
+
+
+def run_monte_carlo_cached(params: ScenarioParams, settings: MonteCarloSettings = MonteCarloSettings()) -> MonteCarloResult:
+    """
+    run_monte_carlo דרך המטמון, לפי hash התרחיש וההגדרות
+
+    לתרחיש שמור (store.py) התוצאה נשמרת גם בדיסק, ופתיחה חוזרת לא מריצה
+    את הסימולציה שוב.
+    """
+    def compute(p):
+        with stage('monte_carlo'):
+            return run_monte_carlo(p, settings)
+    compute = stored(f'monte_carlo:{settings!r}', compute, _encode_result, _decode_result)
+    return monte_carlo_cache.get_or_compute(params, compute, namespace=repr(settings))
+
+
+def _encode_result(result: MonteCarloResult):
+    return {'bands': result.df_bands}, {
+        'probability_ever_negative': result.probability_ever_negative,
+        'paths': result.paths,
+        'elapsed_seconds': result.elapsed_seconds,
+    }
+
+
+def _decode_result(frames, meta) -> MonteCarloResult:
+    return MonteCarloResult(df_bands=frames['bands'], **meta)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+monthly.py - תזרים ברזולוציה חודשית ויתרה מינימלית בתוך השנה
+
+המנועים השנתיים נותנים כל הלוואה בתחילת השנה וגובים ceil(חודשים/12)
+תשלומים שנתיים מלאים, כך ששנת ההחזר האחרונה גובה שנה שלמה גם כשנשארו
+רק כמה חודשים. כאן כל שנה מחולקת ל-12 חודשים:
+- הלוואות, דמי מנוי והחזרי דמי מנוי של כל שנה מתפזרים שווה על חודשיה
+- כל הלוואה מוחזרת בדיוק ב-repayment_months תשלומים חודשיים, מהחודש
+  שאחרי מתן ההלוואה
+- הלוואות קיימים שניתנו לפני שנת ההתחלה ממשיכות להחזיר את יתרת התשלומים
+
+ההחזרים נבנים במערך הפרשים על ציר החודשים (range_add), כך שהעלות
+תלויה במספר הקבוצות ובמספר החודשים ולא במכפלה שלהם.
+"""
+
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from .arrays import distribution_arrays, range_add
+from .cache import ProjectionCache
+from .core import ScenarioParams, existing_flow_arrays, new_flow_arrays
+from .existing import existing_loan_groups, existing_roster_arrays
+from .instrument import stage
+
+
+def monthly_repayments(
+    amounts: np.ndarray,
+    loan_months: np.ndarray,
+    repayment_months: np.ndarray,
+    num_months: int
+) -> np.ndarray:
+    """
+    החזרים חודשיים מדויקים להלוואות שניתנו בחודשים loan_months
+
+    Args:
+        amounts: סכום ההלוואות בכל חודש מתן (K,)
+        loan_months: אינדקס חודש המתן ביחס לחודש הראשון בתחזית (K,) - יכול
+            להיות שלילי להלוואות שניתנו לפני תחילת התחזית
+        repayment_months: מספר תשלומים חודשיים לכל הלוואה (K,) או סקלר
+        num_months: אורך ציר החודשים
+
+    Returns:
+        מערך (num_months,) של סכומי ההחזר בכל חודש
+    """
+    payments = np.maximum(np.rint(np.asarray(repayment_months, dtype=float)), 1).astype(np.int64)
+    start = np.asarray(loan_months, dtype=np.int64) + 1
+    return range_add(np.asarray(amounts, dtype=float) / payments, start, start + payments, num_months)
+
+
+def _spread_months(yearly: np.ndarray) -> np.ndarray:
+    """פיזור סכום שנתי (Y,) שווה על 12 חודשים → (Y*12,)"""
+    return np.repeat(np.asarray(yearly, dtype=float) / 12, 12)
+
+
+def monthly_cashflow_arrays(params: ScenarioParams) -> Dict[str, np.ndarray]:
+    """
+    תזרים חודשי מאוחד (קיימים + חדשות)
+
+    Returns:
+        dict של מערכים (Y*12,): loans_amount, repayments, fees, refunds,
+        ועוד years (Y,)
+    """
+    new = new_flow_arrays(params)
+    existing = existing_flow_arrays(params)
+    years = new['years']
+    start_year = int(years[0])
+    num_months = len(years) * 12
+    month_in_year = np.tile(np.arange(12), len(years))
+    year_index = np.repeat(np.arange(len(years)), 12)
+
+    # === חדשות: הלוואות השנה מתפזרות על חודשיה, כל אחת עם תשלומי השנה שלה ===
+    new_loans = _spread_months(new['loans_amount'])
+    new_repayments = monthly_repayments(
+        new_loans,
+        np.arange(num_months),
+        new['repayment_months'][year_index],
+        num_months
+    )
+
+    # === קיימים: לפי קבוצות (שורה × סטייה), כולל הלוואות לפני שנת ההתחלה ===
+    existing_mode = params.existing_distribution_mode
+    offsets, pct = distribution_arrays(
+        existing_mode, params.existing_distribution_df if existing_mode != "none" else None
+    )
+    actual_loan_year, counts, _ = existing_loan_groups(
+        **existing_roster_arrays(params.df_existing_loans), offsets=offsets, weights=pct / 100
+    )
+    group_amounts = np.repeat(counts * params.existing_loan_amount / 12, 12)
+    group_months = np.repeat((actual_loan_year - start_year) * 12, 12) + np.tile(np.arange(12), len(counts))
+    in_horizon = (group_months >= 0) & (group_months < num_months)
+    existing_loans = np.bincount(
+        group_months[in_horizon], weights=group_amounts[in_horizon], minlength=num_months
+    )
+    existing_repayments = monthly_repayments(
+        group_amounts, group_months, params.existing_repayment_months, num_months
+    )
+
+    return {
+        'years': years,
+        'year': np.asarray(years)[year_index],
+        'month': month_in_year + 1,
+        'loans_amount': new_loans + existing_loans,
+        'repayments': new_repayments + existing_repayments,
+        'fees': _spread_months(new['fees']) + _spread_months(existing['fees']),
+        'refunds': _spread_months(new['refunds']),
+    }
+
+
+def compute_monthly_projection(params: ScenarioParams) -> pd.DataFrame:
+    """
+    טבלת תזרים חודשית עם יתרת קופה מצטברת
+
+    Returns:
+        DataFrame עם שורה לכל חודש: שנה, חודש, כסף_יוצא, החזרי_הלוואות,
+        דמי_מנוי, החזרי_דמי_מנוי_סכום, כסף_נכנס, איזון, יתרת_קופה
+    """
+    flows = monthly_cashflow_arrays(params)
+    money_in = flows['repayments'] + flows['fees']
+    money_out = flows['loans_amount'] + flows['refunds']
+    balance = params.initial_balance + np.cumsum(money_in - money_out)
+
+    return pd.DataFrame({
+        'שנה': flows['year'],
+        'חודש': flows['month'],
+        'כסף_יוצא': np.rint(money_out).astype(np.int64),
+        'החזרי_הלוואות': np.rint(flows['repayments']).astype(np.int64),
+        'דמי_מנוי': np.rint(flows['fees']).astype(np.int64),
+        'החזרי_דמי_מנוי_סכום': np.rint(flows['refunds']).astype(np.int64),
+        'כסף_נכנס': np.rint(money_in).astype(np.int64),
+        'איזון': np.rint(money_in - money_out).astype(np.int64),
+        'יתרת_קופה': np.rint(balance).astype(np.int64),
+    })
+
+
+def summarize_monthly(df_monthly: pd.DataFrame) -> pd.DataFrame:
+    """
+    סיכום שנתי של הטבלה החודשית: יתרה בסוף השנה והיתרה המינימלית בתוכה
+
+    Returns:
+        DataFrame עם: שנה, יתרת_קופה (סוף שנה), יתרה_מינימלית_חודשית,
+        חודש_מינימום
+    """
+    balance = df_monthly['יתרת_קופה'].to_numpy().reshape(-1, 12)
+    return pd.DataFrame({
+        'שנה': df_monthly['שנה'].to_numpy()[::12],
+        'יתרת_קופה': balance[:, -1],
+        'יתרה_מינימלית_חודשית': balance.min(axis=1),
+        'חודש_מינימום': balance.argmin(axis=1) + 1,
+    })
+
+
+# מטמון קטן - הטבלה החודשית מחושבת רק כשהמצב החודשי פעיל
+monthly_cache = ProjectionCache(maxsize=8)
+
+
+def compute_monthly_projection_cached(params: ScenarioParams) -> pd.DataFrame:
+    """compute_monthly_projection דרך המטמון, לפי hash התרחיש"""
+    def compute(p):
+        with stage('monthly'):
+            return compute_monthly_projection(p)
+    return monthly_cache.get_or_compute(params, compute, namespace='monthly:')
@@ -19,10 +19,39 @@ new.py - לוגיקת חישוב למשפחות חדשות
 - שנים 41-48: ממשיכים לשלם דמי חברות עד סוף החזר ההלוואה האחרונה
 
 תקופת חברות כוללת = wedding_age + borrowing_years + repayment_years ≈ 48 שנה
+
+שני מנועים:
+- compute_new_projection - לולאה על קוהורטות (מימוש הייחוס)
+- compute_new_projection_vectorized - אותו מודל במערכים (NumPy), לשימוש שוטף
 """
 
+import numpy as np
 import pandas as pd
-from typing import Optional
+from typing import Dict, Optional
+
+from .arrays import distribution_arrays, gather, prefix_sum, range_add, truncate, unique_offsets
+from .instrument import active, count
+
+
+class _SubCohort:
+    """תת-קוהורטה בלולאה (רשומה עם __slots__ - אלפי מופעים באופק ארוך)"""
+    __slots__ = ('size', 'wedding_age', 'loans', 'cumulative_fees', 'refund_given')
+
+    def __init__(self, size: float, wedding_age: int):
+        self.size = size
+        self.wedding_age = wedding_age
+        self.loans = []               # _OpenLoan לפי שנת מתן
+        self.cumulative_fees = 0      # מעקב אחר דמי מנוי מצטברים
+        self.refund_given = False     # האם כבר ניתן החזר
+
+
+class _OpenLoan:
+    """הלוואות שנה אחת של תת-קוהורטה שעדיין בהחזר"""
+    __slots__ = ('years_left', 'yearly_payment')
+
+    def __init__(self, years_left: float, yearly_payment: float):
+        self.years_left = years_left
+        self.yearly_payment = yearly_payment
 
 
 def compute_new_projection(
@@ -96,17 +125,10 @@ def compute_new_projection(
     # ======================================================
     # מבנה נתונים לקוהורטות עם תת-קוהורטות
     # ======================================================
-    # cohorts[join_year] = {
-    #     'total_size': מספר משפחות שהצטרפו,
-    #     'sub_cohorts': {
-    #         deviation: {
-    #             'size': מספר משפחות בתת-קוהורטה,
-    #             'wedding_age': גיל חתונה ספציפי,
-    #             'loans_given': {year: {'count': מספר הלוואות, ...}}
-    #         }
-    #     }
-    # }
-    cohorts = {}
+    # cohorts = [[_SubCohort, ...], ...] - רשימת תת-קוהורטות לכל שנת הצטרפות,
+    # לפי סדר ההצטרפות; ההלוואות הפתוחות של כל תת-קוהורטה ברשימה לפי שנת מתן
+    cohorts = []
+    cumulative_families = 0
     
     # ======================================================
     # לולאה ראשית על השנים
@@ -132,41 +154,33 @@ def compute_new_projection(
         # הוספת קוהורטה חדשה עם תת-קוהורטות
         # --------------------------------------------------
         if new_families > 0:
+            # סטייה שחוזרת בטבלה דורסת את הקודמת ושומרת על מקומה
             sub_cohorts = {}
             for deviation, pct in sub_cohort_distribution:
                 sub_size = new_families * (pct / 100)
                 if sub_size > 0:
-                    sub_cohorts[deviation] = {
-                        'size': sub_size,
-                        'wedding_age': wedding_age + deviation,
-                        'loans_given': {},
-                        'cumulative_fees': 0,  # מעקב אחר דמי מנוי מצטברים
-                        'refund_given': False  # האם כבר ניתן החזר
-                    }
+                    sub_cohorts[deviation] = _SubCohort(sub_size, wedding_age + deviation)
             
-            cohorts[year] = {
-                'total_size': new_families,
-                'sub_cohorts': sub_cohorts
-            }
+            cohorts.append((year, list(sub_cohorts.values())))
+            cumulative_families += new_families
         
         # --------------------------------------------------
         # חישוב משלמי דמי חברות (מכל הקוהורטות והתת-קוהורטות)
         # --------------------------------------------------
         # כל המשפחות משלמות דמי חברות, גם אלה שלא מתחתנים
         fee_payers = 0
-        for join_year, cohort_info in cohorts.items():
+        for join_year, sub_cohorts in cohorts:
             age = year - join_year
             
             # לכל תת-קוהורטה יש תקופת חברות משלה
-            for deviation, sub_info in cohort_info['sub_cohorts'].items():
-                sub_wedding_age = sub_info['wedding_age']
+            for sub in sub_cohorts:
                 # תקופת חברות = גיל חתונה + שנות הלוואות + שנות החזר
-                sub_membership_years = sub_wedding_age + borrowing_years + repayment_years
+                sub_membership_years = sub.wedding_age + borrowing_years + repayment_years
                 
                 if 0 <= age < sub_membership_years:
-                    fee_payers += sub_info['size']
+                    fee_payers += sub.size
                     # עדכון דמי מנוי מצטברים
-                    sub_info['cumulative_fees'] += sub_info['size'] * family_fee * 12
+                    sub.cumulative_fees += sub.size * family_fee * 12
         
         total_fees = fee_payers * family_fee * 12
         
@@ -175,19 +189,18 @@ def compute_new_projection(
         # --------------------------------------------------
         total_fee_refunds = 0
         if fee_refund_percentage > 0:
-            for join_year, cohort_info in cohorts.items():
+            for join_year, sub_cohorts in cohorts:
                 age = year - join_year
                 
-                for deviation, sub_info in cohort_info['sub_cohorts'].items():
-                    sub_wedding_age = sub_info['wedding_age']
+                for sub in sub_cohorts:
                     # שנת חתונת הילד האחרון = גיל חתונה + שנות הלוואות
-                    last_wedding_age = sub_wedding_age + borrowing_years
+                    last_wedding_age = sub.wedding_age + borrowing_years
                     
                     # בדיקה אם זו שנת חתונת הילד האחרון ועדיין לא ניתן החזר
-                    if age == int(last_wedding_age) and not sub_info['refund_given']:
-                        refund_amount = sub_info['cumulative_fees'] * (fee_refund_percentage / 100)
+                    if age == int(last_wedding_age) and not sub.refund_given:
+                        refund_amount = sub.cumulative_fees * (fee_refund_percentage / 100)
                         total_fee_refunds += refund_amount
-                        sub_info['refund_given'] = True
+                        sub.refund_given = True
         
         # --------------------------------------------------
         # חישוב הלוואות חדשות (לפי תת-קוהורטה)
@@ -195,19 +208,17 @@ def compute_new_projection(
         total_loans_count = 0
         total_loans_amount = 0
         
-        for join_year, cohort_info in cohorts.items():
+        for join_year, sub_cohorts in cohorts:
             age = year - join_year
             
-            for deviation, sub_info in cohort_info['sub_cohorts'].items():
-                sub_wedding_age = sub_info['wedding_age']
-                
+            for sub in sub_cohorts:
                 # בדיקה אם התת-קוהורטה בתקופת ההלוואות
-                borrowing_start = sub_wedding_age
-                borrowing_end = sub_wedding_age + borrowing_years
+                borrowing_start = sub.wedding_age
+                borrowing_end = sub.wedding_age + borrowing_years
                 
                 if borrowing_start <= age < borrowing_end:
                     # חישוב מספר הלוואות מתת-קוהורטה זו השנה
-                    base_loans = sub_info['size'] * loans_per_year_per_family
+                    base_loans = sub.size * loans_per_year_per_family
                     
                     # הכפלה באחוז לוקחי הלוואה
                     actual_loans = base_loans * (loan_percentage / 100)
@@ -218,37 +229,29 @@ def compute_new_projection(
                     
                     # שמירה במעקב הלוואות של התת-קוהורטה
                     if actual_loans > 0:
-                        sub_info['loans_given'][year] = {
-                            'count': actual_loans,
-                            'amount': actual_amount,
-                            'years_left': repayment_years,
-                            'yearly_payment': actual_amount / repayment_years
-                        }
+                        sub.loans.append(_OpenLoan(repayment_years, actual_amount / repayment_years))
         
         # --------------------------------------------------
         # חישוב החזרי הלוואות (מכל התת-קוהורטות)
         # --------------------------------------------------
         total_repayments = 0
         
-        for join_year, cohort_info in cohorts.items():
-            for deviation, sub_info in cohort_info['sub_cohorts'].items():
-                loans_to_remove = []
+        for join_year, sub_cohorts in cohorts:
+            for sub in sub_cohorts:
+                if not sub.loans:
+                    continue
                 
-                for loan_year, loan_info in sub_info['loans_given'].items():
-                    if loan_info['years_left'] > 0:
-                        total_repayments += loan_info['yearly_payment']
-                        loan_info['years_left'] -= 1
-                        
-                        if loan_info['years_left'] <= 0:
-                            loans_to_remove.append(loan_year)
+                for loan in sub.loans:
+                    if loan.years_left > 0:
+                        total_repayments += loan.yearly_payment
+                        loan.years_left -= 1
                 
-                for ly in loans_to_remove:
-                    del sub_info['loans_given'][ly]
+                # הלוואות שהוחזרו במלואן יוצאות מהמעקב
+                sub.loans = [loan for loan in sub.loans if loan.years_left > 0]
         
         # --------------------------------------------------
         # חישוב סיכומים לתצוגה
         # --------------------------------------------------
-        cumulative_families = sum(c['total_size'] for c in cohorts.values())
         borrower_percentage = (total_loans_count / fee_payers * 100) if fee_payers > 0 else 0
         
         # --------------------------------------------------
@@ -285,3 +288,264 @@ def compute_new_projection(
     df_result['יתרה_מצטברת'] = df_result['איזון'].cumsum()
     
     return df_result
+
+
+# ======================================================
+# מנוע וקטורי (NumPy)
+# ======================================================
+
+def yearly_param_arrays(
+    df_yearly_params: pd.DataFrame,
+    start_year: int = 2026,
+    end_year: int = 2075
+) -> Dict[str, np.ndarray]:
+    """
+    המרת טבלת הפרמטרים השנתיים למערכים לפי שנה קלנדרית
+
+    שנה שאין לה שורה בטבלה מסומנת כלא-מעובדת (processed=False),
+    בדיוק כמו ה-continue בלולאה המקורית. ערכים מומרים כמו בלולאה:
+    int() למצטרפים, לגובה הלוואה ולחודשי החזר, float לשאר.
+
+    Returns:
+        dict עם: years, processed, joiners, loan_amount, repayment_months,
+        loan_percentage, family_fee
+    """
+    years = np.arange(start_year, end_year + 1)
+    df = df_yearly_params.drop_duplicates('שנה', keep='first').set_index('שנה')
+    processed = np.isin(years, df.index.to_numpy())
+    df = df.reindex(years)
+
+    def column(name: str, as_int: bool) -> np.ndarray:
+        values = df[name].to_numpy(dtype=float)
+        values = np.where(processed, values, 0.0)
+        return np.trunc(values) if as_int else values
+
+    return {
+        'years': years,
+        'processed': processed,
+        'joiners': column('מצטרפים_חדשים', True),
+        'loan_amount': column('גובה_הלוואה', True),
+        'repayment_months': column('תשלומים_חודשים', True),
+        'loan_percentage': column('אחוז_לוקחי_הלוואה', False),
+        'family_fee': column('דמי_מנוי_משפחתי', False),
+    }
+
+
+def new_cashflow_arrays(
+    joiners: np.ndarray,
+    loan_amount: np.ndarray,
+    repayment_months: np.ndarray,
+    loan_percentage: np.ndarray,
+    family_fee: np.ndarray,
+    processed: np.ndarray,
+    offsets: np.ndarray,
+    weights: np.ndarray,
+    wedding_age=21,
+    avg_children=8,
+    months_between_children=30,
+    fee_refund_percentage=0
+) -> Dict[str, np.ndarray]:
+    """
+    ליבת מודל הקוהורטות בצורה וקטורית
+
+    במקום לעבור על כל קוהורטה ותת-קוהורטה בכל שנה, כל רכיב מחושב
+    כסכום חלון על הסכום המצטבר של המצטרפים לפי שנת הצטרפות:
+    - משלמי דמי מנוי: קוהורטות בגיל 0 עד סוף תקופת החברות
+    - הלוואות: קוהורטות בגיל wedding_age+סטייה עד סוף תקופת החתונות
+      (קונבולוציה של המצטרפים עם פיזור גיל הנישואין)
+    - החזרים: מערך הפרשים על פני השנים המעובדות
+    - החזרי דמי מנוי: שליפה לפי גיל החתונה האחרונה של כל תת-קוהורטה
+
+    הקלטים השנתיים בצורה (..., Y); weights (אחוז/100) בצורה (..., D);
+    wedding_age, avg_children, months_between_children ו-fee_refund_percentage
+    הם סקלרים או מערכים בצורת האצווה (...). ממדי אצווה מובילים
+    משודרים, כך שאפשר להריץ אלפי תרחישים בקריאה אחת.
+
+    Returns:
+        dict של מערכים (..., Y): fee_payers, fees, refunds, loans_count,
+        loans_amount, repayments, cumulative_families
+    """
+    processed = np.asarray(processed, dtype=bool)
+    num_years = processed.shape[-1]
+    t = np.arange(num_years)
+    if active():
+        # תתי-קוהורטות שהלולאה הייתה מבקרת: בכל שנה כל הקוהורטות שהצטרפו עד אליה
+        batch = int(np.prod(np.broadcast_shapes(np.shape(joiners)[:-1], np.shape(weights)[:-1]), dtype=np.int64))
+        count('new.sub_cohort_visits', batch * num_years * (num_years + 1) // 2 * len(offsets))
+        count('new.loan_years', batch * int(processed.sum()))
+
+    # מצטרפים רק בשנים מעובדות ורק אם יש משפחות (כמו if new_families > 0)
+    joiners = np.asarray(joiners, dtype=float)
+    cohort_sizes = np.where(processed & (joiners > 0), joiners, 0.0)
+    cohorts_prefix = prefix_sum(cohort_sizes)
+
+    wedding_age = np.asarray(wedding_age).astype(np.int64)
+    sub_wedding_age = wedding_age[..., None] + np.asarray(offsets)  # (..., D)
+    weights = np.asarray(weights, dtype=float)
+
+    years_between_children = np.asarray(months_between_children) / 12
+    borrowing_years = np.maximum(20, np.asarray(avg_children) * years_between_children)
+    loans_per_year_per_family = np.asarray(avg_children) / borrowing_years
+
+    repayment_years = np.asarray(repayment_months, dtype=float) / 12
+
+    # --------------------------------------------------
+    # משלמי דמי חברות: גיל 0 <= age < wedding_age + borrowing + repayment
+    # --------------------------------------------------
+    membership_end = (sub_wedding_age + borrowing_years[..., None])[..., :, None] \
+        + repayment_years[..., None, :]                              # (..., D, Y)
+    member_ages = np.maximum(np.ceil(membership_end), 0).astype(np.int64)
+    upper = np.broadcast_to(t + 1, member_ages.shape)
+    lower = np.clip(t + 1 - member_ages, 0, upper)
+    in_membership = gather(cohorts_prefix, upper) - gather(cohorts_prefix, lower)
+    fee_payers = np.where(processed, np.sum(weights[..., :, None] * in_membership, axis=-2), 0.0)
+    fees = fee_payers * family_fee * 12
+
+    # --------------------------------------------------
+    # הלוואות: wedding_age <= age < wedding_age + borrowing_years
+    # --------------------------------------------------
+    borrowing_end = sub_wedding_age + borrowing_years[..., None]       # (..., D)
+    first_age = np.maximum(sub_wedding_age, 0)[..., None]
+    last_age = (np.ceil(borrowing_end).astype(np.int64) - 1)[..., None]
+    upper = np.clip(t - first_age + 1, 0, num_years)
+    lower = np.minimum(np.clip(t - last_age, 0, num_years), upper)
+    in_borrowing = gather(cohorts_prefix, upper) - gather(cohorts_prefix, lower)
+    base_loans = np.sum(weights[..., :, None] * in_borrowing, axis=-2)
+    loans_count = np.where(
+        processed,
+        base_loans * loans_per_year_per_family[..., None] * (np.asarray(loan_percentage) / 100),
+        0.0
+    )
+    loans_amount = loans_count * loan_amount
+
+    # --------------------------------------------------
+    # החזרי הלוואות: ceil(repayment_years) תשלומים שנתיים, החל משנת המתן
+    # (הספירה לפי שנים מעובדות, כמו years_left בלולאה)
+    # --------------------------------------------------
+    steps = np.flatnonzero(processed)
+    batch_shape = np.broadcast_shapes(loans_amount.shape[:-1], repayment_years.shape[:-1])
+    step_amount = np.broadcast_to(loans_amount, batch_shape + (num_years,))[..., steps]
+    step_years = np.broadcast_to(repayment_years, batch_shape + (num_years,))[..., steps]
+    yearly_payment = np.divide(
+        step_amount, step_years, out=np.zeros_like(step_amount), where=step_years > 0
+    )
+    step_index = np.arange(len(steps))
+    payments = np.maximum(np.ceil(step_years), 0).astype(np.int64)
+    repayments = np.zeros(batch_shape + (num_years,))
+    repayments[..., steps] = range_add(yearly_payment, step_index, step_index + payments, len(steps))
+
+    # --------------------------------------------------
+    # החזר דמי מנוי בחתונת הילד האחרון
+    # --------------------------------------------------
+    fee_refund_percentage = np.asarray(fee_refund_percentage, dtype=float)
+    refunds = np.zeros_like(fees)
+    if np.any(fee_refund_percentage > 0):
+        fees_prefix = prefix_sum(np.where(processed, family_fee, 0.0))
+        last_wedding_age = np.trunc(borrowing_end).astype(np.int64)[..., None]   # (..., D, 1)
+        join_index = t - last_wedding_age                                          # (..., D, Y)
+        # גיל שלילי לא מתקיים בלולאה (age >= 0), ולכן אין החזר לתת-קוהורטה כזו
+        valid = (join_index >= 0) & (last_wedding_age >= 0)
+        join_index = np.clip(join_index, 0, num_years - 1)
+        size_at_join = gather(cohorts_prefix, join_index + 1) - gather(cohorts_prefix, join_index)
+        paid_fees = gather(fees_prefix, np.broadcast_to(t + 1, join_index.shape)) \
+            - gather(fees_prefix, join_index)
+        cumulative_fees = weights[..., :, None] * size_at_join * 12 * paid_fees
+        refunds = np.where(
+            processed,
+            np.sum(np.where(valid, cumulative_fees, 0.0), axis=-2)
+            * (np.maximum(fee_refund_percentage, 0)[..., None] / 100),
+            0.0
+        )
+
+    return {
+        'fee_payers': fee_payers,
+        'fees': fees,
+        'refunds': refunds,
+        'loans_count': loans_count,
+        'loans_amount': loans_amount,
+        'repayments': repayments,
+        'cumulative_families': np.cumsum(cohort_sizes, axis=-1),
+    }
+
+
+def compute_new_projection_vectorized(
+    df_yearly_params: pd.DataFrame,
+    wedding_age: int = 21,
+    avg_children: int = 8,
+    months_between_children: int = 30,
+    fee_refund_percentage: float = 0,
+    start_year: int = 2026,
+    end_year: int = 2075,
+    distribution_mode: str = "none",
+    distribution_df: Optional[pd.DataFrame] = None
+) -> pd.DataFrame:
+    """
+    חישוב תזרים מזומנים למשפחות חדשות - מנוע וקטורי
+
+    אותה חתימה ואותן עמודות כמו compute_new_projection, אבל העלות היא
+    O(שנים × תתי-קוהורטות) פעולות NumPy במקום לולאה על כל קוהורטה בכל שנה.
+    השקילות מול הלולאה נבדקת ב-app.checks.check_new_engine.
+
+    Returns:
+        DataFrame עם תזרים שנתי מפורט
+    """
+    params = yearly_param_arrays(df_yearly_params, start_year, end_year)
+    offsets, pct = unique_offsets(*distribution_arrays(distribution_mode, distribution_df))
+
+    flows = new_cashflow_arrays(
+        joiners=params['joiners'],
+        loan_amount=params['loan_amount'],
+        repayment_months=params['repayment_months'],
+        loan_percentage=params['loan_percentage'],
+        family_fee=params['family_fee'],
+        processed=params['processed'],
+        offsets=offsets,
+        weights=pct / 100,
+        wedding_age=wedding_age,
+        avg_children=avg_children,
+        months_between_children=months_between_children,
+        fee_refund_percentage=fee_refund_percentage
+    )
+    return new_flows_to_frame(params, flows)
+
+
+def new_flows_to_frame(params: Dict[str, np.ndarray], flows: Dict[str, np.ndarray]) -> pd.DataFrame:
+    """
+    בניית טבלת התוצאות מהמערכים של new_cashflow_arrays (תרחיש יחיד)
+
+    עיגול ה-int() מתבצע בדיוק באותם מקומות כמו בלולאה המקורית.
+    """
+    rows = params['processed']
+    fee_payers = flows['fee_payers'][rows]
+    loans_count = flows['loans_count'][rows]
+    loans_amount = flows['loans_amount'][rows]
+    refunds = flows['refunds'][rows]
+    repayments = flows['repayments'][rows]
+    fees = flows['fees'][rows]
+
+    borrower_percentage = np.divide(
+        loans_count, fee_payers, out=np.zeros_like(loans_count), where=fee_payers > 0
+    ) * 100
+
+    money_out = truncate(loans_amount + refunds)
+    money_in = truncate(repayments + fees)
+
+    df_result = pd.DataFrame({
+        'שנה': params['years'][rows],
+        'משפחות_נרשמות': params['joiners'][rows].astype(np.int64),
+        'משפחות_מצטברות': flows['cumulative_families'][rows].astype(np.int64),
+        'משלמי_דמי_מנוי': truncate(fee_payers),
+        'הלוואות_ניתנו': truncate(loans_count),
+        'אחוז_לווים': np.round(borrower_percentage, 1),
+        'החזרי_דמי_מנוי': truncate(refunds),
+        'כסף_יוצא': money_out,
+        'הלוואות_סכום': truncate(loans_amount),
+        'החזרי_דמי_מנוי_סכום': truncate(refunds),
+        'החזרי_הלוואות': truncate(repayments),
+        'דמי_מנוי': truncate(fees),
+        'כסף_נכנס': money_in,
+        'איזון': money_in - money_out,
+    })
+    df_result['יתרה_מצטברת'] = df_result['איזון'].cumsum()
+
+    return df_result
@@ -2,101 +2,44 @@
 """
 projection.py - חישוב תחזיות מאוחד
 
-מאחד את תזרימי הקיימים והחדשות לתמונה כוללת
+מאחד את תזרימי הקיימים והחדשות לתמונה כוללת.
+החישוב עצמו נמצא ב-core.py; כאן רק מתרגמים את session_state לפרמטרים.
+תרחיש שכבר חושב מוחזר מהמטמון (cache.py) בלי להריץ את המנועים, ותרחיש
+חדש מחושב במנוע החלקי של הסשן (incremental.py) - עריכת שורה אחת בטבלה
+מחשבת מחדש רק את הקוהורטות שהשתנו. תרחיש שמור (store.py) נטען מהדיסק.
 """
 
-import pandas as pd
 import streamlit as st
-from .existing import compute_existing_projection
-from .new import compute_new_projection
+from .cache import projection_cache
+from .core import ScenarioParams
+from .incremental import IncrementalProjection
+from .instrument import count, stage
+from .store import stored_projection
+
+
+def _incremental_engine() -> IncrementalProjection:
+    """מנוע חלקי אחד לכל סשן - זוכר את התרחיש האחרון שחושב"""
+    if '_incremental_engine' not in st.session_state:
+        st.session_state._incremental_engine = IncrementalProjection()
+    return st.session_state._incremental_engine
 
 
 def compute_projections():
     """
     חישוב תחזיות לכל החלקים - נקרא פעם אחת לכל rerun
-    
+
     Returns:
         tuple: (df_existing, df_new, df_combined)
     """
-    # === קיימים (עם תמיכה בפיזור גיל נישואין) ===
-    df_existing = compute_existing_projection(
-        df_existing_loans=st.session_state.df_existing_loans,
-        loan_amount=st.session_state.existing_loan_amount,
-        repayment_months=st.session_state.existing_repayment_months,
-        distribution_mode=st.session_state.existing_distribution_mode,
-        distribution_df=st.session_state.existing_distribution_df if st.session_state.existing_distribution_mode != "none" else None
-    )
-    
-    # === חדשות (עם תמיכה בפיזור גיל נישואין) ===
-    df_new = compute_new_projection(
-        df_yearly_params=st.session_state.df_yearly_params,
-        wedding_age=st.session_state.wedding_age,
-        avg_children=st.session_state.avg_children_new_family,
-        months_between_children=st.session_state.months_between_children,
-        fee_refund_percentage=st.session_state.fee_refund_percentage,
-        distribution_mode=st.session_state.distribution_mode,
-        distribution_df=st.session_state.distribution_df if st.session_state.distribution_mode != "none" else None
-    )
-    
-    # === מאוחד ===
-    df_combined = _merge_projections(
-        df_existing=df_existing,
-        df_new=df_new,
-        initial_balance=st.session_state.initial_balance
-    )
-    
-    return df_existing, df_new, df_combined
-
+    with stage('projection'):
+        params = ScenarioParams.from_state(st.session_state)
+        compute = stored_projection(_computed(_incremental_engine().run))
+        return projection_cache.get_or_compute(params, compute).as_tuple()
 
-def _merge_projections(
-    df_existing: pd.DataFrame,
-    df_new: pd.DataFrame,
-    initial_balance: int
-) -> pd.DataFrame:
-    """
-    מיזוג תזרימי קיימים וחדשות לתמונה כוללת
-    
-    Args:
-        df_existing: תזרים קיימים
-        df_new: תזרים חדשות
-        initial_balance: יתרת קופה התחלתית
-    
-    Returns:
-        DataFrame מאוחד עם יתרת קופה מצטברת
-    """
-    # Merge על פי שנה
-    df = pd.merge(
-        df_existing[['שנה', 'הלוואות_ניתנו', 'כסף_יוצא', 'החזרי_הלוואות', 'משלמי_דמי_מנוי', 'דמי_מנוי', 'כסף_נכנס', 'איזון']],
-        df_new[['שנה', 'משפחות_נרשמות', 'הלוואות_ניתנו', 'החזרי_דמי_מנוי', 'כסף_יוצא', 'החזרי_דמי_מנוי_סכום', 'החזרי_הלוואות', 'משלמי_דמי_מנוי', 'דמי_מנוי', 'כסף_נכנס', 'איזון']],
-        on='שנה',
-        how='outer',
-        suffixes=('_קיימות', '_חדשות')
-    ).fillna(0)
-    
-    # חישוב סה"כ
-    df['הלוואות_ניתנו'] = df['הלוואות_ניתנו_קיימות'].astype(int) + df['הלוואות_ניתנו_חדשות'].astype(int)
-    df['כסף_יוצא'] = df['כסף_יוצא_קיימות'].astype(int) + df['כסף_יוצא_חדשות'].astype(int)
-    df['החזרי_הלוואות'] = df['החזרי_הלוואות_קיימות'].astype(int) + df['החזרי_הלוואות_חדשות'].astype(int)
-    df['משלמי_דמי_מנוי'] = df['משלמי_דמי_מנוי_קיימות'].astype(int) + df['משלמי_דמי_מנוי_חדשות'].astype(int)
-    df['דמי_מנוי'] = df['דמי_מנוי_קיימות'].astype(int) + df['דמי_מנוי_חדשות'].astype(int)
-    df['כסף_נכנס'] = df['כסף_נכנס_קיימות'].astype(int) + df['כסף_נכנס_חדשות'].astype(int)
-    df['איזון'] = df['איזון_קיימות'].astype(int) + df['איזון_חדשות'].astype(int)
-    
-    # יתרת קופה מצטברת (מתחילה מ-initial_balance)
-    df['יתרת_קופה'] = initial_balance + df['איזון'].cumsum()
-    
-    # המרה לסוגים נכונים
-    int_cols = ['שנה', 'הלוואות_ניתנו', 'כסף_יוצא', 'החזרי_הלוואות', 'משלמי_דמי_מנוי', 
-                'דמי_מנוי', 'כסף_נכנס', 'איזון', 'יתרת_קופה',
-                'הלוואות_ניתנו_קיימות', 'כסף_יוצא_קיימות', 'החזרי_הלוואות_קיימות',
-                'משלמי_דמי_מנוי_קיימות', 'דמי_מנוי_קיימות', 'כסף_נכנס_קיימות', 'איזון_קיימות',
-                'משפחות_נרשמות', 'הלוואות_ניתנו_חדשות', 'החזרי_דמי_מנוי', 'כסף_יוצא_חדשות',
-                'החזרי_דמי_מנוי_סכום', 'החזרי_הלוואות_חדשות', 'משלמי_דמי_מנוי_חדשות',
-                'דמי_מנוי_חדשות', 'כסף_נכנס_חדשות', 'איזון_חדשות']
-    
-    for col in int_cols:
-        if col in df.columns:
-            df[col] = df[col].astype(int)
-    
-    return df
 
+def _computed(compute):
+    """עטיפה שסופרת החטאות מטמון (חישוב בפועל)"""
+    def wrapped(params):
+        count('projection.computed')
+        return compute(params)
+    return wrapped
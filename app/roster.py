@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+roster.py - ייבוא רשימת חברים אמיתית (CSV/XLSX) לטבלת הקיימים
+
+get_default_existing_loans היא 21 שורות קבועות לפי שנת לידה. כאן קובץ
+רשימה - שורה לכל ילד, עם תאריך או שנת לידה, דמי מנוי חודשיים ושנת הלוואה
+(אם כבר ניתנה או נקבעה) - מצטמצם לטבלת הקלט של המנוע: שורה לכל
+(שנת הלוואה, דמי מנוי) עם מספר הילדים.
+
+- הקובץ נקרא בנתחים של ROSTER_CHUNK_ROWS שורות (read_csv עם chunksize,
+  או openpyxl במצב read_only), וכל נתח מצטמצם ב-groupby וקטורי, כך שגם
+  עשרות אלפי ילדים לא נטענים לזיכרון בבת אחת
+- לכל קובץ מחושב SHA-256 של התוכן; אותו קובץ (גם אם הועלה שוב או בשם אחר)
+  לא מצטמצם פעמיים - התוצאה נשמרת במטמון לפי טביעת האצבע
+"""
+
+import hashlib
+import itertools
+import time
+from contextlib import closing
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, Union
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from .cache import ProjectionCache
+from .instrument import count, stage
+
+
+# גיל קבלת ההלוואה כשאין שנת הלוואה בקובץ (כמו בטבלת ברירת המחדל: 2005 → 2026)
+LOAN_AGE = 21
+
+# שורות לנתח קריאה
+ROSTER_CHUNK_ROWS = 50000
+
+# גרסת הצמצום - שינוי בכללים צריך להעלות אותה
+ROSTER_VERSION = 1
+
+# שמות עמודות מוכרים בקובץ (אחרי strip, אותיות קטנות ו-_ במקום רווח)
+ROSTER_COLUMNS = {
+    'birth_date': ('תאריך_לידה', 'birth_date', 'date_of_birth'),
+    'birth_year': ('שנת_לידה', 'birth_year'),
+    'monthly_fee': ('דמי_מנוי_חודשי', 'דמי_מנוי', 'monthly_fee', 'fee'),
+    'loan_year': ('שנת_הלוואה', 'loan_year'),
+}
+
+
+@dataclass
+class RosterImport:
+    """תוצאת ייבוא: טבלת הקלט של המנוע ונתוני הקריאה"""
+    df_loans: pd.DataFrame         # שנת_לידה, שנת_הלוואה, מספר_ילדים, דמי_מנוי_חודשי
+    fingerprint: str
+    rows_read: int
+    rows_skipped: int              # שורות בלי שנת לידה/הלוואה או דמי מנוי תקינים
+    elapsed_seconds: float
+
+    @property
+    def children(self) -> int:
+        return int(self.df_loans['מספר_ילדים'].sum())
+
+
+Source = Union[str, Path, BinaryIO]
+
+
+# =============================================================================
+# קריאה בנתחים
+# =============================================================================
+
+def file_fingerprint(source: Source) -> str:
+    """SHA-256 של תוכן הקובץ, בקריאה בבלוקים"""
+    digest = hashlib.sha256()
+    if isinstance(source, (str, Path)):
+        with open(source, 'rb') as handle:
+            for block in iter(lambda: handle.read(1 << 20), b''):
+                digest.update(block)
+    else:
+        source.seek(0)
+        for block in iter(lambda: source.read(1 << 20), b''):
+            digest.update(block)
+        source.seek(0)
+    return digest.hexdigest()
+
+
+def _normalize(name) -> str:
+    return str(name).strip().lower().replace(' ', '_')
+
+
+def _column_map(header) -> Dict[str, str]:
+    """עמודות הקובץ → שמות פנימיים (רק המוכרות)"""
+    known = {alias: field for field, aliases in ROSTER_COLUMNS.items() for alias in aliases}
+    mapping = {}
+    for column in header:
+        field = known.get(_normalize(column))
+        if field is not None and field not in mapping.values():
+            mapping[column] = field
+    fields = set(mapping.values())
+    if not fields & {'birth_date', 'birth_year', 'loan_year'}:
+        raise ValueError("בקובץ חסרה עמודת תאריך לידה, שנת לידה או שנת הלוואה")
+    if 'monthly_fee' not in fields:
+        raise ValueError("בקובץ חסרה עמודת דמי מנוי חודשיים")
+    return mapping
+
+
+def _csv_chunks(source: Source, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    # סגירת ה-reader (גם ביציאה באמצע) משחררת את הקובץ בלי לסגור אותו -
+    # UploadedFile של streamlit צריך להישאר פתוח ל-rerun הבא
+    with pd.read_csv(source, chunksize=chunk_rows, dtype=str, encoding='utf-8-sig', skipinitialspace=True) as reader:
+        yield from reader
+
+
+def _xlsx_chunks(source: Source, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        while True:
+            batch = list(itertools.islice(rows, chunk_rows))
+            if not batch:
+                break
+            yield pd.DataFrame(batch, columns=[str(name) for name in header])
+    finally:
+        workbook.close()
+
+
+def _years(values: pd.Series) -> np.ndarray:
+    """שנה מתאריך (ISO או יום/חודש/שנה), מאובייקט תאריך או משנה מספרית; NaN אם לא תקין"""
+    numeric = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+    years = np.where((numeric >= 1900) & (numeric <= 2200), np.trunc(numeric), np.nan)
+    rest = np.isnan(years) & values.notna().to_numpy()
+    if rest.any():
+        text = values[rest]
+        dates = pd.to_datetime(text, errors='coerce', format='ISO8601')
+        missing = dates.isna()
+        if missing.any():
+            dates[missing] = pd.to_datetime(text[missing], errors='coerce', format='%d/%m/%Y')
+        years[rest] = dates.dt.year.to_numpy(dtype=float)
+    return years
+
+
+def _aggregate_chunk(chunk: pd.DataFrame, mapping: Dict[str, str]) -> pd.Series:
+    """
+    נתח שורות → מספר ילדים לפי (שנת הלוואה, דמי מנוי)
+
+    Returns:
+        Series עם MultiIndex (loan_year, fee)
+    """
+    chunk = chunk[list(mapping)].rename(columns=mapping)
+
+    birth_year = np.full(len(chunk), np.nan)
+    if 'birth_date' in chunk:
+        birth_year = _years(chunk['birth_date'])
+    if 'birth_year' in chunk:
+        birth_year = np.where(np.isnan(birth_year), _years(chunk['birth_year']), birth_year)
+
+    loan_year = birth_year + LOAN_AGE
+    if 'loan_year' in chunk:
+        explicit = _years(chunk['loan_year'])
+        loan_year = np.where(np.isnan(explicit), loan_year, explicit)
+
+    fee = pd.to_numeric(chunk['monthly_fee'], errors='coerce').to_numpy(dtype=float)
+    valid = ~np.isnan(loan_year) & ~np.isnan(fee) & (fee >= 0)
+    count('roster.rows_skipped', int((~valid).sum()))
+
+    frame = pd.DataFrame({'loan_year': loan_year[valid].astype(np.int64), 'fee': fee[valid]})
+    return frame.groupby(['loan_year', 'fee'], sort=False).size()
+
+
+def aggregate_roster(source: Source, name: str, chunk_rows: int = ROSTER_CHUNK_ROWS) -> RosterImport:
+    """
+    צמצום קובץ רשימה לטבלת הקיימים של המנוע
+
+    Args:
+        source: נתיב או קובץ פתוח (למשל UploadedFile של streamlit)
+        name: שם הקובץ - הסיומת קובעת CSV או XLSX
+        chunk_rows: שורות לנתח
+
+    Returns:
+        RosterImport
+
+    Raises:
+        ValueError: סוג קובץ לא נתמך, עמודות חובה חסרות או אין שורות תקינות
+    """
+    started = time.perf_counter()
+    if not isinstance(source, (str, Path)):
+        source.seek(0)
+    suffix = Path(name).suffix.lower()
+    if suffix == '.csv':
+        chunks = _csv_chunks(source, chunk_rows)
+    elif suffix in ('.xlsx', '.xlsm'):
+        chunks = _xlsx_chunks(source, chunk_rows)
+    else:
+        raise ValueError(f"סוג קובץ לא נתמך: {suffix or name}")
+
+    partial = []
+    rows_read = 0
+    mapping = None
+    with stage('roster.aggregate'), closing(chunks):
+        for chunk in chunks:
+            if mapping is None:
+                mapping = _column_map(chunk.columns)
+            rows_read += len(chunk)
+            partial.append(_aggregate_chunk(chunk, mapping))
+            # צמצום ביניים, כדי שרשימת התוצאות החלקיות לא תגדל עם הקובץ
+            if len(partial) > 16:
+                partial = [pd.concat(partial).groupby(level=[0, 1]).sum()]
+
+    counts = pd.concat(partial).groupby(level=[0, 1]).sum() if partial else pd.Series(dtype=float)
+    if counts.empty:
+        raise ValueError("לא נמצאו בקובץ שורות תקינות")
+
+    df_loans = pd.DataFrame({
+        'שנת_לידה': counts.index.get_level_values(0) - LOAN_AGE,
+        'שנת_הלוואה': counts.index.get_level_values(0),
+        'מספר_ילדים': counts.to_numpy(dtype=np.int64),
+        'דמי_מנוי_חודשי': counts.index.get_level_values(1),
+    }).sort_values(['שנת_הלוואה', 'דמי_מנוי_חודשי'], ignore_index=True)
+    count('roster.children', int(df_loans['מספר_ילדים'].sum()))
+
+    return RosterImport(
+        df_loans=df_loans,
+        fingerprint='',
+        rows_read=rows_read,
+        rows_skipped=rows_read - int(df_loans['מספר_ילדים'].sum()),
+        elapsed_seconds=time.perf_counter() - started
+    )
+
+
+# צמצומים לפי טביעת אצבע של הקובץ - משותף לכל הסשנים
+roster_cache = ProjectionCache(maxsize=8)
+
+
+def import_roster(source: Source, name: str) -> RosterImport:
+    """
+    aggregate_roster דרך המטמון: קובץ עם אותו תוכן מצטמצם פעם אחת
+
+    Args:
+        source: נתיב או קובץ פתוח
+        name: שם הקובץ (לסיומת)
+    """
+    fingerprint = file_fingerprint(source)
+    suffix = Path(name).suffix.lower()
+
+    def build() -> RosterImport:
+        return replace(aggregate_roster(source, name), fingerprint=fingerprint)
+    return roster_cache.get_or_build(f'roster:v{ROSTER_VERSION}:{suffix}:{fingerprint}', build)
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+sensitivity.py - ניתוח רגישות (טורנדו): איזה פרמטר משפיע הכי הרבה
+
+כל פרמטר מוזז ±X% בנפרד (השאר נשארים כמו בתרחיש), ונמדדת ההשפעה על
+היתרה המינימלית ועל היתרה הסופית. הזזה של default_* פועלת כמו בסיידבר
+(with_overrides) - הערך החדש נכתב לכל שנות הטבלה השנתית.
+
+כל הפרמטרים הנבדקים שייכים לחדשות, ולכן תזרים הקיימים מחושב פעם אחת.
+כל 2×N ההרצות המוזזות (ועוד הבסיס) מחושבות בקריאה אחת ל-new_cashflow_arrays,
+עם ממד אצווה מוביל.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .arrays import distribution_arrays, truncate, unique_offsets
+from .cache import ProjectionCache
+from .core import ScenarioParams, existing_net_flows, scenario_yearly_arrays, summarize_balance
+from .instrument import stage
+from .new import new_cashflow_arrays
+
+
+# פרמטרים לניתוח: שם → (תווית, שלם?, מינימום, מקסימום)
+SENSITIVITY_PARAMS = {
+    'wedding_age': ("גיל חתונה", True, 0, None),
+    'avg_children_new_family': ("ילדים ממוצע למשפחה", True, 1, None),
+    'months_between_children': ("מרווח בין ילדים (חודשים)", True, 1, None),
+    'default_loan_amount': ("גובה הלוואה", True, 0, None),
+    'default_family_fee': ("דמי מנוי משפחתי", True, 0, None),
+    'fee_refund_percentage': ("אחוז החזר דמי מנוי", False, 0, 100),
+}
+
+# פרמטרים שהם עמודה בטבלה השנתית: שם → מפתח ב-yearly_param_arrays
+_YEARLY_KEYS = {
+    'default_loan_amount': 'loan_amount',
+    'default_family_fee': 'family_fee',
+}
+
+
+@dataclass
+class SensitivityResult:
+    """תוצאת ניתוח רגישות"""
+    table: pd.DataFrame         # שורה לכל פרמטר, ממוינת לפי השפעה על היתרה המינימלית ואז הסופית
+    base_min_balance: int
+    base_final_balance: int
+    pct: float
+    elapsed_seconds: float
+
+
+def perturbed_values(params: ScenarioParams, name: str, pct: float) -> Tuple[float, float]:
+    """
+    הערכים הנמוך והגבוה של פרמטר אחרי הזזה של ±pct אחוזים
+
+    פרמטר שלם מעוגל, ומוזז לפחות ב-1 לכל כיוון (אחרת ±10% מגיל 20
+    וממספר ילדים 8 לא היו משנים כלום). הערכים נחסמים לטווח התקין.
+    """
+    _, integer, low_bound, high_bound = SENSITIVITY_PARAMS[name]
+    base = getattr(params, name)
+    low, high = base * (1 - pct / 100), base * (1 + pct / 100)
+    if integer:
+        low, high = min(round(low), base - 1), max(round(high), base + 1)
+    low = max(low, low_bound)
+    high = min(high, high_bound) if high_bound is not None else high
+    return low, high
+
+
+def _batch_inputs(
+    params: ScenarioParams,
+    names: Sequence[str],
+    pct: float
+) -> Tuple[Dict[str, np.ndarray], pd.DataFrame]:
+    """
+    קלטי האצווה: שורה 0 היא הבסיס, ואחריה נמוך/גבוה לכל פרמטר
+
+    Returns:
+        tuple: (מערכים בצורת האצווה לכל פרמטר, טבלת הערכים שנבדקו)
+    """
+    yearly = scenario_yearly_arrays(params)
+    batch = 1 + 2 * len(names)
+    inputs = {name: np.full(batch, float(getattr(params, name))) for name in SENSITIVITY_PARAMS
+              if name not in _YEARLY_KEYS}
+    for name, key in _YEARLY_KEYS.items():
+        inputs[name] = np.tile(yearly[key], (batch, 1))
+
+    rows = []
+    for i, name in enumerate(names):
+        low, high = perturbed_values(params, name, pct)
+        for row, value in ((1 + 2 * i, low), (2 + 2 * i, high)):
+            if name in _YEARLY_KEYS:
+                # כמו with_overrides: הערך נכתב לכל השנים המעובדות
+                column = np.trunc(float(value)) if name == 'default_loan_amount' else float(value)
+                inputs[name][row] = np.where(yearly['processed'], column, 0.0)
+            else:
+                inputs[name][row] = value
+        rows.append({'parameter': name, 'label': SENSITIVITY_PARAMS[name][0],
+                     'base_value': getattr(params, name), 'low_value': low, 'high_value': high})
+    return inputs, pd.DataFrame(rows)
+
+
+def run_sensitivity(
+    params: ScenarioParams,
+    pct: float = 10.0,
+    names: Sequence[str] = tuple(SENSITIVITY_PARAMS)
+) -> SensitivityResult:
+    """
+    ניתוח רגישות לכל הפרמטרים בקריאת מנוע אחת
+
+    Args:
+        params: תרחיש הבסיס
+        pct: גודל ההזזה באחוזים מערך הבסיס
+        names: הפרמטרים לבדיקה (מתוך SENSITIVITY_PARAMS)
+
+    Returns:
+        SensitivityResult; בטבלה: parameter, label, base_value, low_value,
+        high_value, min_balance_low/high, final_balance_low/high,
+        min_balance_swing, final_balance_swing
+
+    Raises:
+        ValueError: על פרמטר לא נתמך
+    """
+    unknown = [name for name in names if name not in SENSITIVITY_PARAMS]
+    if unknown:
+        raise ValueError(f"פרמטרים לא נתמכים לניתוח רגישות: {unknown}")
+
+    started = time.perf_counter()
+    inputs, table = _batch_inputs(params, names, pct)
+    yearly = scenario_yearly_arrays(params)
+    new_mode = params.distribution_mode
+    offsets, dist_pct = unique_offsets(*distribution_arrays(
+        new_mode, params.distribution_df if new_mode != "none" else None
+    ))
+
+    flows = new_cashflow_arrays(
+        joiners=yearly['joiners'],
+        loan_amount=inputs['default_loan_amount'],
+        repayment_months=yearly['repayment_months'],
+        loan_percentage=yearly['loan_percentage'],
+        family_fee=inputs['default_family_fee'],
+        processed=yearly['processed'],
+        offsets=offsets,
+        weights=dist_pct / 100,
+        wedding_age=inputs['wedding_age'].astype(np.int64),
+        avg_children=inputs['avg_children_new_family'],
+        months_between_children=inputs['months_between_children'],
+        fee_refund_percentage=inputs['fee_refund_percentage']
+    )
+    new_net = truncate(flows['repayments'] + flows['fees']) - truncate(flows['loans_amount'] + flows['refunds'])
+    balances = params.initial_balance + np.cumsum(existing_net_flows(params) + new_net, axis=-1)
+    metrics = [summarize_balance(yearly['years'], balance) for balance in balances]
+
+    for metric in ('min_balance', 'final_balance'):
+        table[f'{metric}_low'] = [metrics[1 + 2 * i][metric] for i in range(len(names))]
+        table[f'{metric}_high'] = [metrics[2 + 2 * i][metric] for i in range(len(names))]
+        table[f'{metric}_swing'] = (table[f'{metric}_high'] - table[f'{metric}_low']).abs()
+    table = table.sort_values(['min_balance_swing', 'final_balance_swing'], ascending=False, ignore_index=True)
+
+    return SensitivityResult(
+        table=table,
+        base_min_balance=metrics[0]['min_balance'],
+        base_final_balance=metrics[0]['final_balance'],
+        pct=pct,
+        elapsed_seconds=time.perf_counter() - started
+    )
+
+
+# מטמון קטן - כל rerun של הטאב היה מריץ את האצווה מחדש
+sensitivity_cache = ProjectionCache(maxsize=16)
+
+
+def run_sensitivity_cached(params: ScenarioParams, pct: float = 10.0) -> SensitivityResult:
+    """run_sensitivity דרך המטמון, לפי hash התרחיש וגודל ההזזה"""
+    def compute(p):
+        with stage('sensitivity'):
+            return run_sensitivity(p, pct)
+    return sensitivity_cache.get_or_compute(params, compute, namespace=f'{pct}:')
@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+"""
+sobol.py - ניתוח רגישות גלובלי (מדדי Sobol בשיטת Saltelli)
+
+ניתוח הטורנדו (sensitivity.py) מזיז פרמטר אחד בכל פעם ולא רואה אינטראקציות,
+למשל בין פיזור גיל הנישואין לאורך ההחזר. כאן כל הפרמטרים מוגרלים יחד
+בטווחים שלהם, והשונות של היתרה המינימלית ושל היתרה הסופית מפורקת:
+- S1 (סדר ראשון): חלק השונות שנובע מהפרמטר לבדו
+- ST (כולל): כולל כל האינטראקציות שהפרמטר משתתף בהן
+ST גדול בהרבה מ-S1 מעיד על אינטראקציה חזקה.
+
+דגימה (Saltelli): שתי מטריצות A ו-B של N×k מה-seed, ולכל פרמטר i מטריצה
+AB_i = A עם עמודה i מ-B. סה"כ N×(k+2) הרצות מודל. כל הרצה היא פונקציה
+דטרמיניסטית של שורת הדגימה שלה, כך שהתוצאה זהה לכל חלוקה לנתחים ולכל מספר
+תהליכים. S1 לפי Saltelli 2010, ST לפי Jansen, ורווח סמך 95% ב-bootstrap.
+
+הנתחים מחושבים במאגר תהליכים, וכל נתח הוא קריאה אחת ל-new_cashflow_arrays
+עם ממד אצווה. תזרים הקיימים לינארי בגובה ההלוואה ובמשקלות הפיזור, ולכן
+לכל מספר חודשי החזר מחושב בסיס אחד (סטייה × שנה) שממנו מרכיבים כל דגימה.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .arrays import distribution_arrays, truncate, unique_offsets
+from .cache import ProjectionCache
+from .core import ScenarioParams, scenario_yearly_arrays
+from .existing import existing_cashflow_arrays, existing_roster_arrays
+from .instrument import count, stage
+from .new import new_cashflow_arrays
+
+
+# פרמטרים: שם → (תווית, סוג טווח)
+# relative: ערך התרחיש ±width, shift: ערך התרחיש ±2 שנים,
+# scale: מכפיל 1±width לעמודה בטבלה השנתית, spread: 0..1 (ראו _mix_weights)
+SOBOL_FACTORS = {
+    'wedding_age': ("גיל חתונה", 'shift'),
+    'avg_children_new_family': ("ילדים ממוצע למשפחה", 'relative'),
+    'months_between_children': ("מרווח בין ילדים", 'relative'),
+    'fee_refund_percentage': ("אחוז החזר דמי מנוי", 'relative'),
+    'new_wedding_spread': ("פיזור גיל נישואין - חדשות", 'spread'),
+    'new_joiners': ("מצטרפים חדשים (מכפיל)", 'scale'),
+    'new_loan_amount': ("גובה הלוואה - חדשות (מכפיל)", 'scale'),
+    'new_repayment_months': ("חודשי החזר - חדשות (מכפיל)", 'scale'),
+    'new_loan_percentage': ("אחוז לוקחי הלוואה (מכפיל)", 'scale'),
+    'new_family_fee': ("דמי מנוי משפחתי (מכפיל)", 'scale'),
+    'existing_loan_amount': ("גובה הלוואה - קיימים", 'relative'),
+    'existing_repayment_months': ("חודשי החזר - קיימים", 'relative'),
+    'existing_wedding_spread': ("פיזור גיל נישואין - קיימים", 'spread'),
+}
+
+# פרמטרים שמעוגלים למספר שלם
+_INTEGER_FACTORS = {'wedding_age', 'existing_repayment_months'}
+
+# עמודות בטבלה השנתית: פרמטר → (עמודה, מפתח ב-yearly_param_arrays, שלם?)
+_YEARLY_FACTORS = {
+    'new_joiners': ('מצטרפים_חדשים', 'joiners', True),
+    'new_loan_amount': ('גובה_הלוואה', 'loan_amount', True),
+    'new_repayment_months': ('תשלומים_חודשים', 'repayment_months', True),
+    'new_loan_percentage': ('אחוז_לוקחי_הלוואה', 'loan_percentage', False),
+    'new_family_fee': ('דמי_מנוי_משפחתי', 'family_fee', False),
+}
+
+OUTPUTS = ('min_balance', 'final_balance')
+WEDDING_AGE_SHIFT = 2
+
+
+@dataclass
+class SobolResult:
+    """תוצאת ניתוח Sobol"""
+    indices: pd.DataFrame       # parameter, label, output, S1, S1_conf, ST, ST_conf
+    samples: int                # N
+    evaluations: int            # N × (k + 2)
+    seed: int
+    elapsed_seconds: float
+
+
+# =============================================================================
+# טווחים ודגימה
+# =============================================================================
+
+def factor_bounds(params: ScenarioParams, names: Sequence[str], width: float = 0.25) -> np.ndarray:
+    """
+    טווח [נמוך, גבוה] לכל פרמטר סביב ערכי התרחיש
+
+    Returns:
+        מערך (k, 2)
+
+    Raises:
+        ValueError: על פרמטר לא מוכר
+    """
+    unknown = [name for name in names if name not in SOBOL_FACTORS]
+    if unknown:
+        raise ValueError(f"פרמטרים לא מוכרים לניתוח Sobol: {unknown}")
+
+    bounds = []
+    for name in names:
+        kind = SOBOL_FACTORS[name][1]
+        if kind == 'shift':
+            base = getattr(params, name)
+            low, high = base - WEDDING_AGE_SHIFT, base + WEDDING_AGE_SHIFT
+        elif kind == 'relative':
+            base = getattr(params, name)
+            low, high = base * (1 - width), base * (1 + width)
+        elif kind == 'scale':
+            low, high = 1 - width, 1 + width
+        else:
+            low, high = 0.0, 1.0
+        if name == 'fee_refund_percentage':
+            low, high = max(low, 0.0), min(high, 100.0)
+        bounds.append((low, high))
+    return np.array(bounds, dtype=float)
+
+
+def saltelli_matrix(num_samples: int, bounds: np.ndarray, seed: int) -> np.ndarray:
+    """
+    מטריצת ההרצות בסדר [A; B; AB_1; ...; AB_k], בערכי הפרמטרים
+
+    Returns:
+        מערך (N × (k+2), k)
+    """
+    k = len(bounds)
+    rng = np.random.default_rng(seed)
+    a = rng.random((num_samples, k))
+    b = rng.random((num_samples, k))
+    blocks = [a, b]
+    for i in range(k):
+        ab = a.copy()
+        ab[:, i] = b[:, i]
+        blocks.append(ab)
+    unit = np.concatenate(blocks, axis=0)
+    return bounds[:, 0] + unit * (bounds[:, 1] - bounds[:, 0])
+
+
+def _columns(samples: np.ndarray, names: Sequence[str], params: ScenarioParams) -> Dict[str, np.ndarray]:
+    """ערך לכל פרמטר ולכל הרצה (פרמטר שלא נדגם מקבל את ערך התרחיש)"""
+    values = {}
+    for name, (_, kind) in SOBOL_FACTORS.items():
+        if name in names:
+            column = samples[:, list(names).index(name)]
+        elif kind in ('scale', 'spread'):
+            column = np.full(len(samples), 1.0 if kind == 'scale' else np.nan)
+        else:
+            column = np.full(len(samples), float(getattr(params, name)))
+        values[name] = np.round(column) if name in _INTEGER_FACTORS else column
+    return values
+
+
+def _mix_weights(
+    offsets: np.ndarray,
+    pct: np.ndarray,
+    spread: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    משקלות פיזור כתערובת: (1-spread) × כולם בסטייה 0 + spread × טבלת הפיזור
+
+    spread=0 הוא גיל קבוע, spread=1 הוא טבלת הפיזור של התרחיש.
+    spread=NaN (הפרמטר לא נדגם) משאיר את פיזור התרחיש כמו שהוא.
+
+    Returns:
+        tuple: (סטיות (D,), משקלות (n, D))
+    """
+    union = np.union1d(offsets, [0])
+    table = np.zeros(len(union))
+    np.add.at(table, np.searchsorted(union, offsets), pct / 100)
+    point = (union == 0).astype(float)
+    spread = spread[:, None]
+    return union, np.where(np.isnan(spread), table, (1 - np.nan_to_num(spread)) * point + np.nan_to_num(spread) * table)
+
+
+def _scenario_distribution(
+    mode: str,
+    df: Optional[pd.DataFrame],
+    spread_sampled: bool,
+    unique: bool
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    טבלת הפיזור שממנה מתערבבים: כשהפיזור נדגם - תמיד הטבלה, גם במצב none
+
+    Args:
+        unique: מודל החדשות משאיר את המופע האחרון של סטייה כפולה (unique_offsets),
+            ובמודל הקיימים סטיות כפולות מצטברות
+    """
+    if spread_sampled:
+        mode = 'custom'
+    offsets, pct = distribution_arrays(mode, df if mode != "none" else None)
+    return unique_offsets(offsets, pct) if unique else (offsets, pct)
+
+
+# =============================================================================
+# הערכת המודל
+# =============================================================================
+
+def evaluate_samples(params: ScenarioParams, names: Sequence[str], samples: np.ndarray) -> np.ndarray:
+    """
+    היתרה המינימלית והסופית לכל שורת דגימה
+
+    Args:
+        params: תרחיש הבסיס (כל מה שלא נדגם)
+        names: שמות העמודות ב-samples
+        samples: ערכי פרמטרים (n, k)
+
+    Returns:
+        מערך (n, 2): min_balance, final_balance
+    """
+    values = _columns(samples, names, params)
+    yearly = scenario_yearly_arrays(params)
+    processed = yearly['processed']
+
+    # === חדשות: קריאה אחת לכל הנתח ===
+    columns = {}
+    for name, (_, key, integer) in _YEARLY_FACTORS.items():
+        column = yearly[key] * values[name][:, None]
+        column = np.trunc(column) if integer else column
+        if name == 'new_loan_percentage':
+            column = np.minimum(column, 100.0)
+        columns[key] = np.where(processed, column, 0.0)
+
+    offsets, pct = _scenario_distribution(
+        params.distribution_mode, params.distribution_df, 'new_wedding_spread' in names, unique=True
+    )
+    offsets, weights = _mix_weights(offsets, pct, values['new_wedding_spread'])
+    flows = new_cashflow_arrays(
+        joiners=columns['joiners'],
+        loan_amount=columns['loan_amount'],
+        repayment_months=columns['repayment_months'],
+        loan_percentage=columns['loan_percentage'],
+        family_fee=columns['family_fee'],
+        processed=processed,
+        offsets=offsets,
+        weights=weights,
+        wedding_age=values['wedding_age'].astype(np.int64),
+        avg_children=values['avg_children_new_family'],
+        months_between_children=values['months_between_children'],
+        fee_refund_percentage=values['fee_refund_percentage']
+    )
+    new_net = truncate(flows['repayments'] + flows['fees']) - truncate(flows['loans_amount'] + flows['refunds'])
+
+    # === קיימים: בסיס לכל מספר חודשי החזר ===
+    ex_offsets, ex_pct = _scenario_distribution(
+        params.existing_distribution_mode, params.existing_distribution_df, 'existing_wedding_spread' in names,
+        unique=False
+    )
+    ex_offsets, ex_weights = _mix_weights(ex_offsets, ex_pct, values['existing_wedding_spread'])
+    roster = existing_roster_arrays(params.df_existing_loans)
+    loan_amount = values['existing_loan_amount'][:, None]
+    existing_net = np.zeros_like(new_net)
+    for months in np.unique(values['existing_repayment_months']):
+        rows = values['existing_repayment_months'] == months
+        basis = existing_cashflow_arrays(
+            **roster, offsets=ex_offsets, weights=np.eye(len(ex_offsets)),
+            loan_amount=1, repayment_months=int(months),
+            start_year=params.start_year, end_year=params.end_year
+        )
+        w = ex_weights[rows]
+        money_in = loan_amount[rows] * (w @ basis['repayments']) + w @ basis['fees']
+        money_out = loan_amount[rows] * (w @ basis['loans_amount'])
+        existing_net[rows] = truncate(money_in) - truncate(money_out)
+
+    balance = params.initial_balance + np.cumsum(existing_net + new_net, axis=-1)
+    return np.stack([balance.min(axis=-1), balance[:, -1]], axis=-1).astype(float)
+
+
+def scenario_for_sample(params: ScenarioParams, names: Sequence[str], sample: Sequence[float]) -> ScenarioParams:
+    """
+    התרחיש המלא ששורת דגימה אחת מייצגת (לבדיקה מול core.run)
+
+    התוצאה של core.run עליו זהה ל-evaluate_samples עד עיגולי שקלים בודדים
+    (סדר החיבור בבסיס הקיימים שונה).
+    """
+    values = {name: column[0] for name, column in _columns(np.asarray([sample], dtype=float), names, params).items()}
+    df = params.df_yearly_params.copy()
+    for name, (column, _, integer) in _YEARLY_FACTORS.items():
+        scaled = df[column].astype(float) * values[name]
+        scaled = np.trunc(scaled) if integer else scaled
+        df[column] = np.minimum(scaled, 100.0) if name == 'new_loan_percentage' else scaled
+
+    overrides = {
+        'wedding_age': int(values['wedding_age']),
+        'avg_children_new_family': values['avg_children_new_family'],
+        'months_between_children': values['months_between_children'],
+        'fee_refund_percentage': values['fee_refund_percentage'],
+        'existing_loan_amount': values['existing_loan_amount'],
+        'existing_repayment_months': int(values['existing_repayment_months']),
+        'df_yearly_params': df,
+    }
+    for prefix, mode_key, df_key in (('new', 'distribution_mode', 'distribution_df'),
+                                     ('existing', 'existing_distribution_mode', 'existing_distribution_df')):
+        spread = values[f'{prefix}_wedding_spread']
+        if np.isnan(spread):
+            continue
+        offsets, pct = _scenario_distribution(
+            getattr(params, mode_key), getattr(params, df_key), True, unique=prefix == 'new'
+        )
+        offsets, weights = _mix_weights(offsets, pct, np.array([spread]))
+        overrides[mode_key] = 'custom'
+        overrides[df_key] = pd.DataFrame({'סטייה_שנים': offsets, 'אחוז': weights[0] * 100})
+    return ScenarioParams(**{**params.to_state(), **overrides})
+
+
+# =============================================================================
+# מדדים
+# =============================================================================
+
+def sobol_indices(outputs: np.ndarray, num_params: int, bootstrap: int = 200, seed: int = 0) -> Dict[str, np.ndarray]:
+    """
+    S1 ו-ST מתוצאות בסדר [A; B; AB_1; ...; AB_k]
+
+    Args:
+        outputs: מערך (N × (k+2),) של פלט מודל אחד
+
+    Returns:
+        dict עם S1, S1_conf, ST, ST_conf - מערכים (k,). פלט בלי שונות
+        (אף פרמטר לא משפיע עליו) מקבל 0.
+    """
+    n = len(outputs) // (num_params + 2)
+    f_a = outputs[:n]
+    f_b = outputs[n:2 * n]
+    f_ab = outputs[2 * n:].reshape(num_params, n)
+
+    def estimate(index: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        a, b, ab = f_a[..., index], f_b[..., index], f_ab[:, index]
+        variance = np.var(np.concatenate([a, b], axis=-1), axis=-1)
+        safe = np.where(variance > 0, variance, 1.0)
+        first = np.mean(b * (ab - a), axis=-1) / safe
+        total = 0.5 * np.mean((a - ab) ** 2, axis=-1) / safe
+        return np.where(variance > 0, first, 0.0), np.where(variance > 0, total, 0.0)
+
+    first, total = estimate(np.arange(n))
+    resamples = np.random.default_rng(seed).integers(0, n, size=(bootstrap, n))
+    boot_first, boot_total = zip(*(estimate(index) for index in resamples))
+    return {
+        'S1': first,
+        'S1_conf': 1.96 * np.std(boot_first, axis=0),
+        'ST': total,
+        'ST_conf': 1.96 * np.std(boot_total, axis=0),
+    }
+
+
+# =============================================================================
+# הרצה
+# =============================================================================
+
+# תרחיש הבסיס ושמות הפרמטרים בכל תהליך worker (נשלחים פעם אחת ב-initializer)
+_worker_context: Optional[Tuple[ScenarioParams, List[str]]] = None
+
+
+def _init_worker(params: ScenarioParams, names: List[str]) -> None:
+    global _worker_context
+    _worker_context = (params, names)
+
+
+def _evaluate_chunk(samples: np.ndarray) -> np.ndarray:
+    params, names = _worker_context
+    return evaluate_samples(params, names, samples)
+
+
+def run_sobol(
+    params: ScenarioParams,
+    names: Sequence[str] = tuple(SOBOL_FACTORS),
+    num_samples: int = 1024,
+    width: float = 0.25,
+    seed: int = 0,
+    max_workers: Optional[int] = None,
+    chunk_size: int = 2048
+) -> SobolResult:
+    """
+    ניתוח Sobol מלא
+
+    Args:
+        params: תרחיש הבסיס
+        names: הפרמטרים לניתוח (מתוך SOBOL_FACTORS)
+        num_samples: N - מספר ההרצות הוא N × (k+2)
+        width: רוחב יחסי של הטווחים (0.25 = ±25%)
+        seed: קובע את הדגימה ואת ה-bootstrap - אותו seed, אותה תוצאה
+        max_workers: מספר תהליכים (ברירת מחדל: מספר הליבות). 1 = ללא מאגר
+        chunk_size: שורות בכל נתח (קריאת מנוע אחת)
+
+    Returns:
+        SobolResult עם שורה לכל (פרמטר, פלט)
+    """
+    started = time.perf_counter()
+    names = list(names)
+    samples = saltelli_matrix(num_samples, factor_bounds(params, names, width), seed)
+    chunks = [samples[i:i + chunk_size] for i in range(0, len(samples), chunk_size)]
+    workers = min(max_workers or os.cpu_count() or 1, len(chunks))
+    count('sobol.evaluations', len(samples))
+
+    with stage('sobol.evaluate'):
+        if workers == 1:
+            _init_worker(params, names)
+            outputs = [_evaluate_chunk(chunk) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(params, names)) as pool:
+                outputs = list(pool.map(_evaluate_chunk, chunks))
+    outputs = np.concatenate(outputs, axis=0)
+
+    rows = []
+    with stage('sobol.indices'):
+        for j, output in enumerate(OUTPUTS):
+            indices = sobol_indices(outputs[:, j], len(names), seed=seed)
+            for i, name in enumerate(names):
+                rows.append({
+                    'parameter': name,
+                    'label': SOBOL_FACTORS[name][0],
+                    'output': output,
+                    **{key: float(values[i]) for key, values in indices.items()},
+                })
+
+    return SobolResult(
+        indices=pd.DataFrame(rows),
+        samples=num_samples,
+        evaluations=len(samples),
+        seed=seed,
+        elapsed_seconds=time.perf_counter() - started
+    )
+
+
+# מטמון קטן - אלפי הרצות מודל לכל תוצאה
+sobol_cache = ProjectionCache(maxsize=8)
+
+
+def run_sobol_cached(params: ScenarioParams, num_samples: int = 1024, width: float = 0.25, seed: int = 0) -> SobolResult:
+    """run_sobol דרך המטמון, לפי hash התרחיש והגדרות הדגימה"""
+    def compute(p):
+        with stage('sobol'):
+            return run_sobol(p, num_samples=num_samples, width=width, seed=seed)
+    return sobol_cache.get_or_compute(params, compute, namespace=f'{num_samples}:{width}:{seed}:')
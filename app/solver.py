@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+solver.py - מחשבון איזון: חיפוש ערכי יעד שמשאירים את הקופה מעל רצפה
+
+שלוש שאלות:
+- מה דמי המנוי המשפחתי המינימליים (לכל השנים) כדי שהיתרה לא תרד מתחת לרצפה?
+- מה גובה ההלוואה המקסימלי לחדשות באותו תנאי?
+- מה יתרת הפתיחה המינימלית?
+
+יתרת הפתיחה רק מזיזה את היתרה המצטברת, ולכן היא נפתרת ישירות.
+דמי המנוי וגובה ההלוואה משפיעים רק על החדשות: תזרים הקיימים מחושב פעם אחת,
+ולכל מועמד מחושב רק החלק של החדשות - כמה מכפלות מטריצה-וקטור בבסיס
+הלינארי של התרחיש (superposition.py), במקום הרצת המודל. החיפוש מרחיב טווח
+פי 2 עד שנמצא מועמד תקין, ואז חוצה אותו עד לרזולוציה המבוקשת.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from .cache import ProjectionCache
+from .arrays import truncate
+from .core import ScenarioParams, existing_net_flows, new_net_flows, scenario_yearly_arrays
+from .instrument import count, stage
+from .superposition import linear_basis
+
+
+# עמודת הטבלה השנתית שכל יעד דורס (כמו with_overrides): יעד → (מפתח, שלם?)
+_YEARLY_TARGETS = {
+    'default_family_fee': ('family_fee', False),
+    'default_loan_amount': ('loan_amount', True),
+}
+
+# יעדים נתמכים: שם → (כיוון, רזולוציה, תקרת חיפוש)
+# כיוון 'min' = מחפשים את הערך הקטן ביותר שתקין, 'max' = הגדול ביותר
+SOLVER_TARGETS = {
+    'default_family_fee': ('min', 1, 100_000),
+    'default_loan_amount': ('max', 1_000, 100_000_000),
+    'initial_balance': ('min', 1, None),
+}
+
+
+@dataclass
+class SolverResult:
+    """תוצאת חיפוש ערך יעד"""
+    target: str
+    value: Optional[int]        # None אם אין ערך תקין בטווח החיפוש
+    floor: int
+    min_balance: Optional[int]  # היתרה המינימלית בערך שנמצא
+    evaluations: int
+    elapsed_seconds: float
+
+    @property
+    def feasible(self) -> bool:
+        return self.value is not None
+
+
+def _bisect(
+    is_ok: Callable[[int], bool],
+    direction: str,
+    step: int,
+    cap: int
+) -> Tuple[Optional[int], int]:
+    """
+    חיפוש הערך הקיצוני שעדיין תקין, על רשת של step
+
+    מניח מונוטוניות: ב-'min' ערך גדול יותר לא פוגע, ב-'max' ערך קטן יותר לא פוגע.
+
+    Returns:
+        tuple: (ערך או None, מספר הערכות)
+    """
+    evaluations = 0
+
+    def check(units: int) -> bool:
+        nonlocal evaluations
+        evaluations += 1
+        count('solver.evaluations')
+        return is_ok(units * step)
+
+    max_units = cap // step
+
+    if direction == 'min':
+        if check(0):
+            return 0, evaluations
+        # הרחבת טווח: good = ערך תקין ראשון, bad = האחרון שנכשל
+        bad, good = 0, 1
+        while not check(good):
+            bad = good
+            if good >= max_units:
+                return None, evaluations
+            good = min(good * 2, max_units)
+        while good - bad > 1:
+            mid = (good + bad) // 2
+            if check(mid):
+                good = mid
+            else:
+                bad = mid
+        return good * step, evaluations
+
+    # direction == 'max'
+    if not check(0):
+        return None, evaluations
+    good, bad = 0, 1
+    while check(bad):
+        good = bad
+        if bad >= max_units:
+            return bad * step, evaluations
+        bad = min(bad * 2, max_units)
+    while bad - good > 1:
+        mid = (good + bad) // 2
+        if check(mid):
+            good = mid
+        else:
+            bad = mid
+    return good * step, evaluations
+
+
+def solve(params: ScenarioParams, target: str, floor: int = 0) -> SolverResult:
+    """
+    חיפוש ערך יעד שמשאיר את יתרת הקופה ≥ floor בכל שנות התחזית
+
+    Args:
+        params: פרמטרי התרחיש הנוכחי (שאר הערכים נשארים כמו שהם)
+        target: אחד מ-SOLVER_TARGETS
+        floor: רצפת יתרה מינימלית (₪)
+
+    Returns:
+        SolverResult
+
+    Raises:
+        ValueError: אם היעד לא נתמך
+    """
+    if target not in SOLVER_TARGETS:
+        raise ValueError(f"יעד לא נתמך: {target}")
+
+    started = time.perf_counter()
+    direction, step, cap = SOLVER_TARGETS[target]
+    existing_net = existing_net_flows(params)
+
+    if target == 'initial_balance':
+        # היתרה = פתיחה + סכום מצטבר, ולכן הפתיחה הנדרשת ישירה
+        _, new_net = new_net_flows(params)
+        lowest = int(np.cumsum(existing_net + new_net).min())
+        value = max(0, floor - lowest)
+        return SolverResult(
+            target=target,
+            value=value,
+            floor=floor,
+            min_balance=value + lowest,
+            evaluations=1,
+            elapsed_seconds=time.perf_counter() - started
+        )
+
+    basis = linear_basis(params)
+    yearly = scenario_yearly_arrays(params)
+    key, integer = _YEARLY_TARGETS[target]
+
+    def min_balance(value: int) -> int:
+        inputs = {name: yearly[name] for name in ('joiners', 'loan_amount', 'loan_percentage', 'family_fee')}
+        inputs[key] = np.where(yearly['processed'], np.trunc(float(value)) if integer else float(value), 0.0)
+        flows = basis.flows(**inputs)
+        new_net = truncate(flows['repayments'] + flows['fees']) - truncate(flows['loans_amount'] + flows['refunds'])
+        return int((params.initial_balance + np.cumsum(existing_net + new_net)).min())
+
+    value, evaluations = _bisect(lambda v: min_balance(v) >= floor, direction, step, cap)
+
+    return SolverResult(
+        target=target,
+        value=value,
+        floor=floor,
+        min_balance=min_balance(value) if value is not None else None,
+        evaluations=evaluations,
+        elapsed_seconds=time.perf_counter() - started
+    )
+
+
+def solve_all(params: ScenarioParams, floor: int = 0) -> Dict[str, SolverResult]:
+    """כל ערכי היעד הנתמכים: שם → SolverResult"""
+    return {target: solve(params, target, floor) for target in SOLVER_TARGETS}
+
+
+# מטמון קטן - התוצאה תלויה גם ברצפה
+solver_cache = ProjectionCache(maxsize=16)
+
+
+def solve_all_cached(params: ScenarioParams, floor: int = 0) -> Dict[str, SolverResult]:
+    """solve_all דרך המטמון, לפי hash התרחיש והרצפה"""
+    def compute(p):
+        with stage('solver'):
+            return solve_all(p, floor)
+    return solver_cache.get_or_compute(params, compute, namespace=f'solve:{floor}:')
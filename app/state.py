@@ -3,115 +3,67 @@
 state.py - ניהול session_state וסיידבר
 """
 
-import streamlit as st
+from typing import Callable, Optional
+
 import pandas as pd
-from .existing import get_default_existing_loans
+import streamlit as st
+from .cache import projection_cache
+from .core import ScenarioParams, default_state, fit_yearly_params, run
+from .instrument import LOG_PATH, Recorder
+from .store import DB_PATH, default_store, save_with_results
+from .surrogate import surrogate_for
+
+
+# widgets שזוכרים ערך של פרמטר תרחיש - נמחקים בטעינת תרחיש שמור,
+# אחרת הערך הישן שלהם היה דורס את הערך הטעון
+SCENARIO_WIDGET_KEYS = [
+    'start_year_input', 'end_year_input',
+    'existing_loan_input', 'existing_months_input',
+    'new_loan_amount_input', 'new_repayment_input', 'new_loan_pct_input',
+    'new_family_fee_input', 'fee_refund_input',
+    'existing_dist_mode_select', 'new_dist_mode_select',
+    'existing_loans_editor', 'yearly_params_editor',
+    'existing_dist_editor', 'new_dist_editor',
+]
+
+# גבולות אופק התחזית בשנים (כולל שנת ההתחלה)
+MIN_HORIZON_YEARS = 10
+MAX_HORIZON_YEARS = 300
 
 
 def init_session_state():
     """
     אתחול כל המשתנים ב-session_state
-    מחולק ל-3 מקטעים: כללי, קיימים, חדשות
+    ערכי ברירת המחדל (כללי, קיימים, חדשות) מוגדרים ב-core.default_state
     """
-    
-    # =======================================================================
-    # פרמטרים גלובליים (כללי)
-    # =======================================================================
-    if 'initial_balance' not in st.session_state:
-        st.session_state.initial_balance = 0
-    
-    if 'display_years' not in st.session_state:
-        st.session_state.display_years = 30
-    
-    # =======================================================================
-    # פרמטרים לקיימים
-    # מודל פשוט: רשימת הלוואות לפי שנת הלוואה (2026-2046)
-    # כל ילד משלם דמי מנוי מ-2026 עד סוף ההחזר שלו
-    # =======================================================================
-    if 'existing_loan_amount' not in st.session_state:
-        st.session_state.existing_loan_amount = 100000  # גובה הלוואה אחיד לקיימים
-    
-    if 'existing_repayment_months' not in st.session_state:
-        st.session_state.existing_repayment_months = 80  # מספר תשלומים אחיד לקיימים
-    
-    # טבלת הלוואות קיימים (שנת הלוואה, מספר ילדים, דמי מנוי חודשי לילד)
-    if 'df_existing_loans' not in st.session_state:
-        st.session_state.df_existing_loans = get_default_existing_loans()
-    
-    # =======================================================================
-    # פרמטרים למשפחות חדשות
-    # =======================================================================
-    if 'wedding_age' not in st.session_state:
-        st.session_state.wedding_age = 20
-    
-    if 'avg_children_new_family' not in st.session_state:
-        st.session_state.avg_children_new_family = 8
-    
-    if 'months_between_children' not in st.session_state:
-        st.session_state.months_between_children = 34
-    
-    if 'default_loan_amount' not in st.session_state:
-        st.session_state.default_loan_amount = 100000
-    
-    if 'default_repayment_months' not in st.session_state:
-        st.session_state.default_repayment_months = 100
-    
-    if 'default_loan_percentage' not in st.session_state:
-        # מודל קוהורטות: 100% = כל המשפחות לוקחות הלוואה (ברירת מחדל)
-        # האחוז מכלל החברים משתנה אוטומטית לפי שנת ההצטרפות
-        st.session_state.default_loan_percentage = 100
-    
-    if 'default_family_fee' not in st.session_state:
-        st.session_state.default_family_fee = 375
-    
-    if 'fee_refund_percentage' not in st.session_state:
-        st.session_state.fee_refund_percentage = 90
-    
-    # =======================================================================
-    # פיזור גיל נישואין (פעמון) - למשפחות חדשות
-    # =======================================================================
-    if 'distribution_mode' not in st.session_state:
-        # "none" = גיל קבוע, "bell" = פעמון סטנדרטי, "custom" = מותאם אישית
-        st.session_state.distribution_mode = "none"
-    
-    if 'distribution_df' not in st.session_state:
-        # פיזור פעמון סטנדרטי: סטייה מגיל הבסיס → אחוז
-        # פרוס על 10 שנים (-2 עד +8) עם 5% לא מתחתנים
-        st.session_state.distribution_df = pd.DataFrame({
-            'סטייה_שנים': [-2, -1, 0, 1, 2, 3, 4, 5, 6, 7, 8],
-            'אחוז': [3, 8, 20, 20, 15, 12, 8, 5, 3, 1, 0]  # סה"כ 95%, 5% לא מתחתנים
-        })
-    
-    # =======================================================================
-    # פיזור גיל נישואין (פעמון) - לילדים קיימים
-    # =======================================================================
-    if 'existing_distribution_mode' not in st.session_state:
-        st.session_state.existing_distribution_mode = "custom"
-    
-    if 'existing_distribution_df' not in st.session_state:
-        st.session_state.existing_distribution_df = pd.DataFrame({
-            'סטייה_שנים': [-2, -1, 0, 1, 2, 3, 4, 5, 6, 7, 8],
-            'אחוז': [3, 8, 20, 20, 15, 12, 8, 5, 3, 1, 0]
-        })
-    
-    # טבלת פרמטרים שנתיים לחדשות (2026-2075)
-    if 'df_yearly_params' not in st.session_state:
-        years = list(range(2026, 2076))
-        growth_rate = 0.05
-        new_members_with_growth = [int(100 * ((1 + growth_rate) ** i)) for i in range(len(years))]
-        st.session_state.df_yearly_params = pd.DataFrame({
-            'שנה': years,
-            'מצטרפים_חדשים': new_members_with_growth,
-            'גובה_הלוואה': [st.session_state.default_loan_amount] * len(years),
-            'תשלומים_חודשים': [st.session_state.default_repayment_months] * len(years),
-            'אחוז_לוקחי_הלוואה': [st.session_state.default_loan_percentage] * len(years),
-            'דמי_מנוי_משפחתי': [st.session_state.default_family_fee] * len(years)
-        })
+    for key, value in default_state().items():
+        if key not in st.session_state:
+            st.session_state[key] = value
+
+
+def sync_widget(widget_key: str, state_key: str, yearly_column: Optional[str] = None) -> Callable[[], None]:
+    """
+    callback ל-on_change: העתקת ערך widget לפרמטר התרחיש ב-session_state
+
+    ה-callback רץ לפני ה-rerun, כך שהחישוב באותו rerun כבר רואה את הערך
+    החדש (במקום לזהות שינוי באמצע הרינדור ולקרוא ל-st.rerun שוב).
+
+    Args:
+        widget_key: ה-key של ה-widget
+        state_key: הפרמטר ב-session_state
+        yearly_column: עמודה בטבלה השנתית שמקבלת את אותו ערך לכל השנים
+    """
+    def callback():
+        value = st.session_state[widget_key]
+        st.session_state[state_key] = value
+        if yearly_column is not None:
+            st.session_state.df_yearly_params[yearly_column] = value
+    return callback
 
 
 def render_sidebar():
     """
-    רינדור הסיידבר עם 3 מקטעים: כללי, קיימים, חדשות
+    רינדור הסיידבר: כללי, קיימים, חדשות, כלים ותרחישים שמורים
     """
     with st.sidebar:
         _render_sidebar_global()
@@ -121,6 +73,8 @@ def render_sidebar():
         _render_sidebar_new()
         st.divider()
         _render_sidebar_tools()
+        st.divider()
+        _render_sidebar_scenarios()
 
 
 def _render_sidebar_global():
@@ -133,23 +87,71 @@ def _render_sidebar_global():
         max_value=50000000,
         value=st.session_state.initial_balance,
         step=50000,
-        help="כמה כסף יש בקופה בתחילת 2026"
+        help=f"כמה כסף יש בקופה בתחילת {st.session_state.start_year}"
     )
     
+    # אופק התחזית - הטבלה השנתית מותאמת אוטומטית (_sync_horizon)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.number_input(
+            "שנת התחלה",
+            min_value=2000,
+            max_value=2300,
+            value=st.session_state.start_year,
+            step=1,
+            key="start_year_input",
+            on_change=_sync_horizon
+        )
+    with col2:
+        st.number_input(
+            "שנת סיום",
+            min_value=st.session_state.start_year + MIN_HORIZON_YEARS - 1,
+            max_value=st.session_state.start_year + MAX_HORIZON_YEARS - 1,
+            value=st.session_state.end_year,
+            step=5,
+            key="end_year_input",
+            on_change=_sync_horizon,
+            help="שנים שנוספות לאופק מקבלות את ערכי השנה האחרונה בטבלה השנתית"
+        )
+    
+    horizon_years = st.session_state.end_year - st.session_state.start_year + 1
     st.session_state.display_years = st.slider(
         "📊 שנים להצגה בגרפים",
-        min_value=10,
-        max_value=70,
-        value=st.session_state.display_years,
+        min_value=MIN_HORIZON_YEARS,
+        max_value=horizon_years,
+        value=min(st.session_state.display_years, horizon_years),
         step=5,
-        help="כמה שנים להציג בגרפים (מ-2026)"
+        help=f"כמה שנים להציג בגרפים (מ-{st.session_state.start_year})"
     )
     
     # כפתור איפוס
-    if st.button("🔄 איפוס לברירת מחדל", use_container_width=True):
-        for key in list(st.session_state.keys()):
-            del st.session_state[key]
-        st.rerun()
+    st.button("🔄 איפוס לברירת מחדל", use_container_width=True, on_click=_reset_state)
+
+
+def _sync_horizon():
+    """
+    עדכון אופק התחזית מה-widgets (callback)
+
+    שנת ההתחלה נשמרת, ושנת הסיום נחתכת לטווח המותר לפיה. הטבלה השנתית
+    מוארכת או נחתכת לאופק החדש.
+    """
+    start_year = int(st.session_state.get('start_year_input', st.session_state.start_year))
+    requested = int(st.session_state.get('end_year_input', st.session_state.end_year))
+    end_year = min(max(requested, start_year + MIN_HORIZON_YEARS - 1), start_year + MAX_HORIZON_YEARS - 1)
+    if end_year != requested:
+        # ה-widget ייבנה מחדש מ-value עם הערך שנחתך
+        st.session_state.pop('end_year_input', None)
+    st.session_state.start_year = start_year
+    st.session_state.end_year = end_year
+    st.session_state.df_yearly_params = fit_yearly_params(st.session_state.df_yearly_params, start_year, end_year)
+    # העריכות השמורות של ה-editor מתייחסות לשורות של הטבלה הקודמת
+    st.session_state.pop('yearly_params_editor', None)
+
+
+def _reset_state():
+    """ניקוי כל ה-session_state (callback של כפתור האיפוס)"""
+    for key in list(st.session_state.keys()):
+        del st.session_state[key]
 
 
 def _render_sidebar_existing():
@@ -157,36 +159,32 @@ def _render_sidebar_existing():
     st.header("👶 ילדים קיימים")
     
     # גובה הלוואה אחיד לכל הקיימים
-    new_loan = st.number_input(
+    st.number_input(
         "גובה הלוואה (₪)",
         min_value=10000,
         max_value=500000,
         value=st.session_state.existing_loan_amount,
         step=5000,
         key="existing_loan_input",
+        on_change=sync_widget("existing_loan_input", "existing_loan_amount"),
         help="סכום הלוואה אחיד לכל הילדים הקיימים"
     )
-    if new_loan != st.session_state.existing_loan_amount:
-        st.session_state.existing_loan_amount = new_loan
-        st.rerun()
     
     # מספר תשלומים אחיד
-    new_months = st.number_input(
+    st.number_input(
         "מספר תשלומים (חודשים)",
         min_value=6,
         max_value=240,
         value=st.session_state.existing_repayment_months,
         step=6,
         key="existing_months_input",
+        on_change=sync_widget("existing_months_input", "existing_repayment_months"),
         help="מספר תשלומים אחיד לכל הילדים הקיימים"
     )
-    if new_months != st.session_state.existing_repayment_months:
-        st.session_state.existing_repayment_months = new_months
-        st.rerun()
     
     # עדכון מהיר של דמי מנוי לכולם
     with st.expander("⚡ עדכון דמי מנוי לכולם"):
-        new_fee = st.number_input(
+        st.number_input(
             "דמי מנוי חודשי לילד (₪)",
             min_value=0,
             max_value=500,
@@ -194,9 +192,12 @@ def _render_sidebar_existing():
             step=10,
             key="bulk_existing_fee"
         )
-        if st.button("החל על כל השנים", key="apply_bulk_fee"):
-            st.session_state.df_existing_loans['דמי_מנוי_חודשי'] = new_fee
-            st.rerun()
+        st.button("החל על כל השנים", key="apply_bulk_fee", on_click=_apply_bulk_existing_fee)
+
+
+def _apply_bulk_existing_fee():
+    """דמי המנוי מהקלט המהיר לכל שנות הקיימים (callback)"""
+    st.session_state.df_existing_loans['דמי_מנוי_חודשי'] = st.session_state.bulk_existing_fee
 
 
 def _render_sidebar_new():
@@ -227,62 +228,52 @@ def _render_sidebar_new():
         step=2
     )
     
+    _render_surrogate_preview()
+    
     # הלוואות לחדשות
     st.markdown("##### 🏦 הלוואות")
-    new_loan_amount = st.number_input(
+    st.number_input(
         "גובה הלוואה (₪)",
         min_value=10000,
         max_value=500000,
         value=st.session_state.default_loan_amount,
         step=5000,
-        key="new_loan_amount_input"
+        key="new_loan_amount_input",
+        on_change=sync_widget("new_loan_amount_input", "default_loan_amount", "גובה_הלוואה")
     )
-    if new_loan_amount != st.session_state.default_loan_amount:
-        st.session_state.default_loan_amount = new_loan_amount
-        st.session_state.df_yearly_params['גובה_הלוואה'] = new_loan_amount
-        st.rerun()
     
-    new_repayment_months = st.number_input(
+    st.number_input(
         "מספר תשלומים (חודשים)",
         min_value=6,
         max_value=240,
         value=st.session_state.default_repayment_months,
         step=6,
-        key="new_repayment_input"
+        key="new_repayment_input",
+        on_change=sync_widget("new_repayment_input", "default_repayment_months", "תשלומים_חודשים")
     )
-    if new_repayment_months != st.session_state.default_repayment_months:
-        st.session_state.default_repayment_months = new_repayment_months
-        st.session_state.df_yearly_params['תשלומים_חודשים'] = new_repayment_months
-        st.rerun()
     
-    new_loan_pct = st.number_input(
+    st.number_input(
         "אחוז משפחות לוקחות הלוואה (%)",
         min_value=0,
         max_value=100,
         value=st.session_state.default_loan_percentage,
         step=5,
         key="new_loan_pct_input",
+        on_change=sync_widget("new_loan_pct_input", "default_loan_percentage", "אחוז_לוקחי_הלוואה"),
         help="100% = כל המשפחות. האחוז האפקטיבי מכלל החברים מחושב אוטומטית לפי מודל הקוהורטות"
     )
-    if new_loan_pct != st.session_state.default_loan_percentage:
-        st.session_state.default_loan_percentage = new_loan_pct
-        st.session_state.df_yearly_params['אחוז_לוקחי_הלוואה'] = new_loan_pct
-        st.rerun()
     
     # דמי מנוי
     st.markdown("##### 💳 דמי מנוי")
-    new_family_fee = st.number_input(
+    st.number_input(
         "דמי מנוי משפחתי (₪/חודש)",
         min_value=100,
         max_value=5000,
         value=st.session_state.default_family_fee,
         step=25,
-        key="new_family_fee_input"
+        key="new_family_fee_input",
+        on_change=sync_widget("new_family_fee_input", "default_family_fee", "דמי_מנוי_משפחתי")
     )
-    if new_family_fee != st.session_state.default_family_fee:
-        st.session_state.default_family_fee = new_family_fee
-        st.session_state.df_yearly_params['דמי_מנוי_משפחתי'] = new_family_fee
-        st.rerun()
     
     # החזר דמי מנוי
     st.markdown("##### 💸 החזר דמי מנוי")
@@ -401,6 +392,34 @@ def _render_sidebar_new():
             """)
 
 
+def _render_surrogate_preview():
+    """
+    עקומת יתרה משוערת מהרשת (surrogate.py), לפני שהחישוב המדויק מסתיים
+
+    הסיידבר מרונדר לפני החישוב, ולכן הקירוב מופיע מיד. העקומה נשמרת
+    ב-session_state כדי שהטאב המאוחד יציג את הסטייה שלה מהתוצאה המדויקת.
+    כל עוד הרשת נבנית ברקע אין תצוגה מקדימה - ה-rerun לא מחכה לה.
+    """
+    params = ScenarioParams.from_state(st.session_state)
+    surrogate = surrogate_for(params)
+    if surrogate is None:
+        st.session_state.pop('_surrogate_preview', None)
+        return
+    
+    balance = surrogate.evaluate(
+        params.wedding_age, params.avg_children_new_family, params.months_between_children,
+        params.initial_balance
+    )
+    st.session_state._surrogate_preview = (surrogate.years, balance)
+    st.markdown("##### 👁️ תצוגה מקדימה (קירוב)")
+    st.line_chart(pd.DataFrame({'יתרה משוערת': balance}, index=surrogate.years), height=160)
+    st.caption(
+        f"יתרה מינימלית משוערת: ₪{balance.min():,.0f}. "
+        f"בבדיקה מול המנוע ({surrogate.validation_points} נקודות): סטייה עד ±₪{surrogate.max_abs_error:,.0f} "
+        f"({surrogate.relative_error:.1%}), ביתרה המינימלית עד ±₪{surrogate.max_min_balance_error:,.0f}"
+    )
+
+
 def _render_sidebar_tools():
     """כלי עזר בסיידבר"""
     st.header("📈 כלים")
@@ -420,12 +439,97 @@ def _render_sidebar_tools():
         key="growth_rate_input"
     )
     
-    if st.button("✅ החל צמיחה", use_container_width=True, key="apply_growth"):
-        df = st.session_state.df_yearly_params.copy()
-        base = df[growth_param].iloc[0]
-        for i in range(len(df)):
-            df.loc[i, growth_param] = int(base * (1 + growth_rate/100) ** i)
-        st.session_state.df_yearly_params = df
-        st.success(f"צמיחה של {growth_rate}% הוחלה על {growth_param}")
-        st.rerun()
+    st.button(
+        "✅ החל צמיחה",
+        use_container_width=True,
+        key="apply_growth",
+        on_click=_apply_growth,
+        args=(growth_param, growth_rate)
+    )
+
+
+def _apply_growth(growth_param: str, growth_rate: float):
+    """צמיחה שנתית קבועה לעמודה בטבלה השנתית, מערך השנה הראשונה (callback)"""
+    df = st.session_state.df_yearly_params.copy()
+    base = df[growth_param].iloc[0]
+    for i in range(len(df)):
+        df.loc[i, growth_param] = int(base * (1 + growth_rate/100) ** i)
+    st.session_state.df_yearly_params = df
+    st.toast(f"צמיחה של {growth_rate}% הוחלה על {growth_param}")
+
+
+def _render_sidebar_scenarios():
+    """שמירה וטעינה של תרחישים מהמאגר המקומי (store.py)"""
+    st.header("💾 תרחישים שמורים")
+    store = default_store()
+
+    name = st.text_input("שם לתרחיש הנוכחי", key="scenario_save_name", placeholder="למשל: תוכנית אוקטובר")
+    if st.button("💾 שמור", use_container_width=True, key="scenario_save"):
+        if not name.strip():
+            st.warning("יש להזין שם")
+        else:
+            params = ScenarioParams.from_state(st.session_state)
+            save_with_results(name, params, run, store)
+            st.success(f"התרחיש '{name.strip()}' נשמר")
+
+    saved = store.list_scenarios()
+    if saved.empty:
+        st.caption("אין עדיין תרחישים שמורים")
+        return
+
+    selected = st.selectbox(
+        "תרחיש שמור",
+        saved['name'].tolist(),
+        format_func=lambda n: f"{n} ({saved.loc[saved['name'] == n, 'saved_at'].iloc[0]:%d/%m/%Y %H:%M})",
+        key="scenario_load_select"
+    )
+    col1, col2 = st.columns(2)
+    with col1:
+        st.button("📂 טען", use_container_width=True, key="scenario_load", on_click=_load_scenario, args=(selected,))
+    with col2:
+        st.button("🗑️ מחק", use_container_width=True, key="scenario_delete", on_click=_delete_scenario, args=(selected,))
+    st.caption(f"מאגר: {DB_PATH}")
+
+
+def _load_scenario(name: str):
+    """טעינת תרחיש שמור ל-session_state (callback, לפני רינדור ה-widgets)"""
+    params = default_store().load_scenario(name)
+    for key in SCENARIO_WIDGET_KEYS:
+        st.session_state.pop(key, None)
+    for key, value in params.to_state().items():
+        st.session_state[key] = value
+
 
+def _delete_scenario(name: str):
+    """מחיקת שם תרחיש מהמאגר (callback)"""
+    default_store().delete_scenario(name)
+
+
+def render_debug_panel(recorder: Recorder):
+    """
+    פאנל ביצועים נסתר בסיידבר (מוצג רק עם ?debug=1 בכתובת)
+
+    Args:
+        recorder: המדידה של ה-rerun הנוכחי
+    """
+    data = recorder.as_dict()
+    with st.sidebar:
+        st.divider()
+        with st.expander("🐞 ביצועים", expanded=True):
+            st.caption(f"rerun: {data['total_ms']:.1f} ms")
+            if data['stages']:
+                stages = pd.DataFrame([
+                    {'שלב': name, 'ms': info['ms'], 'קריאות': info['calls']}
+                    for name, info in data['stages'].items()
+                ]).sort_values('ms', ascending=False)
+                st.dataframe(stages, hide_index=True, use_container_width=True)
+            if data['counters']:
+                counters = pd.DataFrame(
+                    list(data['counters'].items()), columns=['מונה', 'ערך']
+                )
+                st.dataframe(counters, hide_index=True, use_container_width=True)
+            st.caption(
+                f"מטמון תחזיות: {projection_cache.hits} פגיעות, "
+                f"{projection_cache.misses} החטאות"
+            )
+            st.caption(f"לוג: {LOG_PATH}")
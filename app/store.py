@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+store.py - שמירת תרחישים ותוצאות ב-SQLite מקומי
+
+תרחיש נשמר לפי hash התוכן שלו (cache.scenario_hash): שני שמות שמצביעים על
+אותו תרחיש חולקים רשומת פרמטרים אחת ואת אותן תוצאות. תוצאות נשמרות לפי
+(hash, סוג) - למשל 'projection' או הרצת מונטה קרלו עם הגדרות מסוימות - כך
+שתרחיש שנפתח מחדש מקבל את הטבלאות מהדיסק בלי להריץ את המנועים.
+
+טבלאות נשמרות כ-JSON של עמודות (עם ה-dtype של כל עמודה), דחוס ב-zlib.
+מיקום הקובץ: data/kehila.db, או KEHILA_DB.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+from .cache import scenario_hash
+from .core import ProjectionResult, ScenarioParams
+
+
+DB_PATH = Path(os.environ.get('KEHILA_DB', Path(__file__).resolve().parent.parent / 'data' / 'kehila.db'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS params (
+    hash TEXT PRIMARY KEY,
+    payload BLOB NOT NULL,
+    created_at REAL NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS scenarios (
+    name TEXT PRIMARY KEY,
+    hash TEXT NOT NULL REFERENCES params(hash),
+    saved_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS scenarios_by_hash ON scenarios(hash);
+
+CREATE TABLE IF NOT EXISTS results (
+    hash TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (hash, kind)
+) WITHOUT ROWID;
+"""
+
+
+# =============================================================================
+# קידוד
+# =============================================================================
+
+def _pack(data: Any) -> bytes:
+    return zlib.compress(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+
+def _unpack(payload: bytes) -> Any:
+    return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+
+def frame_to_dict(df: pd.DataFrame) -> Dict[str, Any]:
+    """טבלה למבנה JSON: שמות עמודות, dtype וערכים לפי עמודה"""
+    return {
+        'columns': [str(col) for col in df.columns],
+        'dtypes': [str(dtype) for dtype in df.dtypes],
+        'data': [df[col].tolist() for col in df.columns],
+    }
+
+
+def frame_from_dict(data: Dict[str, Any]) -> pd.DataFrame:
+    """הפעולה ההפוכה ל-frame_to_dict"""
+    return pd.DataFrame({
+        col: pd.Series(values, dtype=dtype)
+        for col, dtype, values in zip(data['columns'], data['dtypes'], data['data'])
+    })
+
+
+def canonical_params(params: ScenarioParams) -> ScenarioParams:
+    """
+    התרחיש כפי שייטען מהמאגר
+
+    השמירה עוברת דרך to_dict/from_dict, והטבלאות נבנות מחדש עם אינדקס רציף.
+    ה-hash נלקח מהצורה הזו, כך שתרחיש טעון מוצא את התוצאות של עצמו.
+    """
+    return ScenarioParams.from_dict(params.to_dict())
+
+
+# =============================================================================
+# מאגר
+# =============================================================================
+
+class ScenarioStore:
+    """
+    מאגר SQLite לתרחישים בעלי שם ולתוצאות מחושבות
+
+    חיבור אחד לתהליך, מוגן במנעול (Streamlit מריץ כל סשן ב-thread נפרד).
+    """
+
+    def __init__(self, path: Path = DB_PATH):
+        self.path = Path(path)
+        if str(path) != ':memory:':
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # --- פרמטרים ותרחישים ---
+
+    def put_params(self, params: ScenarioParams) -> str:
+        """
+        שמירת פרמטרים (פעם אחת לכל תוכן)
+
+        Returns:
+            ה-hash של התרחיש הקנוני
+        """
+        params = canonical_params(params)
+        key = scenario_hash(params)
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO params (hash, payload, created_at) VALUES (?, ?, ?)',
+                (key, _pack(params.to_dict()), time.time())
+            )
+        return key
+
+    def get_params(self, key: str) -> Optional[ScenarioParams]:
+        with self._lock:
+            row = self._conn.execute('SELECT payload FROM params WHERE hash = ?', (key,)).fetchone()
+        return ScenarioParams.from_dict(_unpack(row[0])) if row else None
+
+    def save_scenario(self, name: str, params: ScenarioParams) -> str:
+        """
+        שמירת תרחיש בשם (שם קיים מוחלף)
+
+        Returns:
+            ה-hash של התרחיש
+
+        Raises:
+            ValueError: אם השם ריק
+        """
+        name = name.strip()
+        if not name:
+            raise ValueError("שם תרחיש ריק")
+        key = self.put_params(params)
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO scenarios (name, hash, saved_at) VALUES (?, ?, ?)',
+                (name, key, time.time())
+            )
+        return key
+
+    def load_scenario(self, name: str) -> ScenarioParams:
+        """
+        Raises:
+            KeyError: אם אין תרחיש בשם הזה
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT hash FROM scenarios WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return self.get_params(row[0])
+
+    def delete_scenario(self, name: str) -> None:
+        """מחיקת השם בלבד - פרמטרים ותוצאות נשארים לשמות אחרים עם אותו תוכן"""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM scenarios WHERE name = ?', (name,))
+
+    def list_scenarios(self) -> pd.DataFrame:
+        """כל התרחישים השמורים, מהחדש לישן: name, hash, saved_at"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT name, hash, saved_at FROM scenarios ORDER BY saved_at DESC'
+            ).fetchall()
+        df = pd.DataFrame(rows, columns=['name', 'hash', 'saved_at'])
+        df['saved_at'] = pd.to_datetime(df['saved_at'], unit='s')
+        return df
+
+    # --- תוצאות ---
+
+    def put_result(self, key: str, kind: str, frames: Dict[str, pd.DataFrame], meta: Optional[Dict[str, Any]] = None) -> None:
+        """שמירת טבלאות תוצאה (וערכים נלווים) ל-(hash, סוג)"""
+        payload = _pack({
+            'frames': {name: frame_to_dict(df) for name, df in frames.items()},
+            'meta': meta or {},
+        })
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO results (hash, kind, payload, created_at) VALUES (?, ?, ?, ?)',
+                (key, kind, payload, time.time())
+            )
+
+    def get_result(self, key: str, kind: str) -> Optional[Tuple[Dict[str, pd.DataFrame], Dict[str, Any]]]:
+        """
+        Returns:
+            (טבלאות, ערכים נלווים), או None אם לא נשמר
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT payload FROM results WHERE hash = ? AND kind = ?', (key, kind)
+            ).fetchone()
+        if row is None:
+            return None
+        data = _unpack(row[0])
+        return {name: frame_from_dict(frame) for name, frame in data['frames'].items()}, data['meta']
+
+    def has_params(self, key: str) -> bool:
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM params WHERE hash = ?', (key,)).fetchone() is not None
+
+    def stats(self) -> Dict[str, int]:
+        """מספר רשומות בכל טבלה"""
+        with self._lock:
+            return {
+                table: self._conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('params', 'scenarios', 'results')
+            }
+
+
+_default_store: Optional[ScenarioStore] = None
+_default_lock = threading.Lock()
+
+
+def default_store() -> ScenarioStore:
+    """המאגר המשותף של התהליך (נפתח בשימוש הראשון)"""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = ScenarioStore(DB_PATH)
+        return _default_store
+
+
+# =============================================================================
+# תוצאות תחזית
+# =============================================================================
+
+PROJECTION_KIND = 'projection'
+
+
+def projection_frames(result: ProjectionResult) -> Dict[str, pd.DataFrame]:
+    return {'existing': result.df_existing, 'new': result.df_new, 'combined': result.df_combined}
+
+
+def projection_from_frames(frames: Dict[str, pd.DataFrame]) -> ProjectionResult:
+    return ProjectionResult(frames['existing'], frames['new'], frames['combined'])
+
+
+def stored(
+    kind: str,
+    compute: Callable[[ScenarioParams], Any],
+    encode: Callable[[Any], Tuple[Dict[str, pd.DataFrame], Dict[str, Any]]],
+    decode: Callable[[Dict[str, pd.DataFrame], Dict[str, Any]], Any],
+    saved_only: bool = True,
+    store: Optional[ScenarioStore] = None
+) -> Callable[[ScenarioParams], Any]:
+    """
+    עטיפה לפונקציית חישוב: קודם מחפשים במאגר, ורק אם אין - מחשבים
+
+    נועדה לשמש כ-compute של ProjectionCache, כך שהזיכרון נבדק ראשון,
+    אחריו הדיסק, ורק אז המנועים.
+
+    Args:
+        kind: סוג התוצאה (חלק מהמפתח)
+        compute: החישוב עצמו
+        encode: תוצאה → (טבלאות, ערכים נלווים)
+        decode: הפעולה ההפוכה
+        saved_only: לשמור תוצאה חדשה רק לתרחיש שהפרמטרים שלו כבר במאגר
+            (כדי שכל הזזת slider לא תכתוב לדיסק)
+        store: ברירת מחדל - default_store()
+    """
+    def wrapped(params: ScenarioParams):
+        db = store or default_store()
+        key = scenario_hash(params)
+        hit = db.get_result(key, kind)
+        if hit is not None:
+            return decode(*hit)
+        result = compute(params)
+        if not saved_only or db.has_params(key):
+            db.put_result(key, kind, *encode(result))
+        return result
+    return wrapped
+
+
+def stored_projection(
+    compute: Callable[[ScenarioParams], ProjectionResult],
+    store: Optional[ScenarioStore] = None
+) -> Callable[[ScenarioParams], ProjectionResult]:
+    """stored() לתוצאת תחזית (שלוש הטבלאות)"""
+    return stored(
+        PROJECTION_KIND,
+        compute,
+        encode=lambda result: (projection_frames(result), {}),
+        decode=lambda frames, meta: projection_from_frames(frames),
+        store=store
+    )
+
+
+def save_with_results(
+    name: str,
+    params: ScenarioParams,
+    compute: Callable[[ScenarioParams], ProjectionResult],
+    store: Optional[ScenarioStore] = None
+) -> str:
+    """
+    שמירת תרחיש בשם יחד עם תוצאת התחזית שלו
+
+    תוצאה שכבר שמורה לאותו תוכן (גם תחת שם אחר) לא מחושבת שוב.
+
+    Returns:
+        ה-hash של התרחיש
+    """
+    db = store or default_store()
+    key = db.save_scenario(name, params)
+    if db.get_result(key, PROJECTION_KIND) is None:
+        db.put_result(key, PROJECTION_KIND, projection_frames(compute(db.get_params(key))), {})
+    return key
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+superposition.py - תגובת יחידה של מודל החדשות, לשינויים בטבלה השנתית
+
+כשהמבנה קבוע (גיל נישואין, פיזור, מספר ילדים ומרווח ביניהם, חודשי ההחזר
+של כל שנה, האופק והשנים המעובדות), תזרים החדשות לינארי בקלטים השנתיים:
+- משלמי דמי מנוי = M @ מצטרפים, כש-M[t, k] הוא החלק מקוהורטת k שעדיין
+  חבר בשנה t
+- לווים = B @ מצטרפים (B תלוי רק בהפרש t-k - מטריצת טפליץ)
+- הלוואות = לווים × אחוז לוקחים × גובה הלוואה, והחזרים = R @ הלוואות
+  (R מפזר כל הלוואה על שנות ההחזר שלה)
+- החזרי דמי מנוי = Q @ (מצטרפים × דמי מנוי שנצברו), כש-Q בוחר את הקוהורטה
+  שמחתנת את הילד האחרון בכל שנה
+
+המטריצות נבנות פעם אחת לכל מבנה (LinearBasis), וכל שינוי במצטרפים, בגובה
+ההלוואה, באחוז הלוקחים או בדמי המנוי הוא כמה מכפלות מטריצה-וקטור במקום
+הרצת המודל מחדש. קלטים בצורה (..., Y) מחושבים יחד (ממדי אצווה מובילים).
+
+התוצאה זהה (עד עיגול) ל-new_cashflow_arrays על אותם קלטים.
+"""
+
+from typing import Dict, Tuple
+
+import numpy as np
+
+from .arrays import distribution_arrays, range_add, unique_offsets
+from .cache import ProjectionCache, content_hash
+from .core import ScenarioParams, scenario_yearly_arrays
+from .instrument import count, stage
+
+
+class LinearBasis:
+    """
+    מטריצות תגובת היחידה של מודל החדשות למבנה תרחיש אחד
+
+    Args:
+        params: תרחיש; רק השדות ב-structure_key משפיעים על המטריצות
+    """
+
+    def __init__(self, params: ScenarioParams):
+        self.key = self.structure_key(params)
+        yearly = scenario_yearly_arrays(params)
+        self.years = yearly['years']
+        self.processed = yearly['processed']
+        num_years = len(self.years)
+        t = np.arange(num_years)
+        lag = t[:, None] - t[None, :]                                          # (Y, Y): t - k
+        lower = lag >= 0
+        lag = np.where(lower, lag, 0)
+
+        mode = params.distribution_mode
+        offsets, pct = unique_offsets(*distribution_arrays(
+            mode, params.distribution_df if mode != "none" else None
+        ))
+        weights = pct / 100
+        sub_wedding_age = params.wedding_age + offsets
+        borrowing_years = max(20, params.avg_children_new_family * params.months_between_children / 12)
+        borrowing_end = sub_wedding_age + borrowing_years
+        self.loans_per_year_per_family = params.avg_children_new_family / borrowing_years
+        self.refund_rate = max(params.fee_refund_percentage, 0) / 100
+
+        # === חברות: 0 <= t-k < גיל סוף החברות (תלוי בחודשי ההחזר של שנה t) ===
+        repayment_years = yearly['repayment_months'] / 12
+        member_ages = np.maximum(np.ceil(borrowing_end[None, :] + repayment_years[:, None]), 0)  # (Y, D)
+        by_lag = range_add(np.broadcast_to(weights, member_ages.shape), 0, member_ages, num_years)
+        self.members = np.where(lower, np.take_along_axis(by_lag, lag, axis=1), 0.0)
+
+        # === לווים: גיל החתונה הראשונה <= t-k <= גיל החתונה האחרונה ===
+        first_age = np.maximum(sub_wedding_age, 0)
+        last_age = np.ceil(borrowing_end).astype(np.int64) - 1
+        self.borrowers = np.where(lower, range_add(weights, first_age, last_age + 1, num_years)[lag], 0.0)
+
+        # === החזרי דמי מנוי: t-k == גיל החתונה האחרונה ===
+        last_wedding_age = np.trunc(borrowing_end).astype(np.int64)
+        valid = (last_wedding_age >= 0) & (last_wedding_age < num_years)
+        refund_lag = np.bincount(last_wedding_age[valid], weights=weights[valid], minlength=num_years)
+        self.refund_lags = np.where(lower, refund_lag[lag], 0.0)
+
+        # === החזרים: ceil(R/12) תשלומים על פני השנים המעובדות, מהשנה של ההלוואה ===
+        steps = np.flatnonzero(self.processed)
+        step_years = repayment_years[steps]
+        per_payment = np.divide(1.0, step_years, out=np.zeros_like(step_years), where=step_years > 0)
+        step_index = np.arange(len(steps))
+        payments = np.maximum(np.ceil(step_years), 0).astype(np.int64)
+        schedule = range_add(
+            per_payment[:, None], step_index[:, None], (step_index + payments)[:, None], len(steps)
+        )                                                                      # (שנת מתן, שנת תשלום)
+        self.repayment = np.zeros((num_years, num_years))
+        self.repayment[np.ix_(steps, steps)] = schedule.T
+
+    @staticmethod
+    def structure_key(params: ScenarioParams) -> Tuple:
+        """כל מה שקובע את המטריצות - שינוי בו מחייב בסיס חדש"""
+        yearly = scenario_yearly_arrays(params)
+        mode = params.distribution_mode
+        return (
+            params.wedding_age, params.avg_children_new_family, params.months_between_children,
+            params.fee_refund_percentage, mode,
+            params.distribution_df.to_json() if mode != "none" else None,
+            params.start_year, params.end_year,
+            tuple(yearly['processed'].tolist()), tuple(yearly['repayment_months'].tolist()),
+        )
+
+    def flows(
+        self,
+        joiners: np.ndarray,
+        loan_amount: np.ndarray,
+        loan_percentage: np.ndarray,
+        family_fee: np.ndarray
+    ) -> Dict[str, np.ndarray]:
+        """
+        תזרים החדשות לקלטים השנתיים הלינאריים
+
+        Args:
+            joiners, loan_amount, loan_percentage, family_fee: מערכים (..., Y)
+                כמו ב-yearly_param_arrays (ממדי אצווה מובילים משודרים)
+
+        Returns:
+            dict כמו new_cashflow_arrays: fee_payers, fees, refunds,
+            loans_count, loans_amount, repayments, cumulative_families
+        """
+        processed = self.processed
+        joiners = np.asarray(joiners, dtype=float)
+        family_fee = np.asarray(family_fee, dtype=float)
+        cohort_sizes = np.where(processed & (joiners > 0), joiners, 0.0)
+
+        fee_payers = np.where(processed, cohort_sizes @ self.members.T, 0.0)
+        fees = fee_payers * family_fee * 12
+
+        loans_count = np.where(
+            processed,
+            (cohort_sizes @ self.borrowers.T) * self.loans_per_year_per_family * (np.asarray(loan_percentage) / 100),
+            0.0
+        )
+        loans_amount = loans_count * loan_amount
+        repayments = loans_amount @ self.repayment.T
+
+        refunds = np.zeros_like(fees)
+        if self.refund_rate > 0:
+            # דמי המנוי שקוהורטה k שילמה עד שנה t: F[t+1] - F[k]
+            paid = np.cumsum(np.where(processed, family_fee, 0.0), axis=-1)
+            paid_before = paid - np.where(processed, family_fee, 0.0)
+            refunds = np.where(
+                processed,
+                12 * self.refund_rate * (
+                    paid * (cohort_sizes @ self.refund_lags.T)
+                    - (cohort_sizes * paid_before) @ self.refund_lags.T
+                ),
+                0.0
+            )
+
+        return {
+            'fee_payers': fee_payers,
+            'fees': fees,
+            'refunds': refunds,
+            'loans_count': loans_count,
+            'loans_amount': loans_amount,
+            'repayments': repayments,
+            'cumulative_families': np.cumsum(cohort_sizes, axis=-1),
+        }
+
+    def scenario_flows(self, params: ScenarioParams) -> Dict[str, np.ndarray]:
+        """flows() לפי הטבלה השנתית של התרחיש (שצריך להתאים ל-structure_key)"""
+        yearly = scenario_yearly_arrays(params)
+        return self.flows(yearly['joiners'], yearly['loan_amount'], yearly['loan_percentage'], yearly['family_fee'])
+
+
+# בסיסים לפי מבנה - משותף לכל הסשנים (המטריצות לא משתנות אחרי הבנייה)
+basis_cache = ProjectionCache(maxsize=16)
+
+
+def linear_basis(params: ScenarioParams) -> LinearBasis:
+    """הבסיס למבנה של התרחיש, מהמטמון או בבנייה חדשה"""
+    def build() -> LinearBasis:
+        count('superposition.builds')
+        with stage('superposition.build'):
+            return LinearBasis(params)
+    return basis_cache.get_or_build(content_hash(*LinearBasis.structure_key(params)), build)
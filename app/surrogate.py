@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+surrogate.py - מודל קירוב לעקומת היתרה לפי הפרמטרים המבניים של החדשות
+
+גיל חתונה, מספר ילדים ממוצע ומרווח בין ילדים משנים את המודל בצורה לא
+לינארית (superposition.py לא עוזר להם), ולכן כל שינוי שלהם בסיידבר מחכה
+להרצה מלאה. כאן נבנית פעם אחת רשת של עקומות יתרה מדויקות על צמתי
+SURROGATE_AXES - בקריאת מנוע אחת באצווה - והעקומה לכל נקודה ביניהם היא
+אינטרפולציה מולטי-לינארית של 8 הצמתים הסמוכים.
+
+- הרשת תלויה בכל שאר הפרמטרים (התרחיש "הבסיסי"), חוץ מיתרת הפתיחה - היא
+  רק מזיזה את כל העקומות, ומתווספת ב-evaluate
+- הבנייה (עשרות עד מאות מילישניות, יותר מהרצה מדויקת אחת) רצה ברקע ולא
+  ב-rerun: surrogate_for מחזיר רשת רק אם היא כבר מוכנה. שינוי בפרמטר
+  מבני משתמש ברשת הקיימת, ורק שינוי בתרחיש הבסיסי מתחיל בנייה חדשה
+- רשת של תרחיש שמור (store.py) נשמרת גם במאגר, כך שפתיחה חוזרת שלו לא בונה
+  אותה שוב; רשתות של סתם הזזות slider נשארות רק בזיכרון
+- בבנייה הקירוב נבדק מול המנוע המדויק בנקודות אקראיות שאינן על הרשת, והסטייה
+  המקסימלית נשמרת ומוצגת יחד עם הקירוב
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .arrays import distribution_arrays, truncate, unique_offsets
+from .cache import ProjectionCache, scenario_hash
+from .core import ScenarioParams, existing_net_flows, scenario_yearly_arrays
+from .instrument import count, stage
+from .new import new_cashflow_arrays
+from .store import default_store
+
+
+# צמתי הרשת לכל פרמטר מבני (מכסים את הטווחים בסיידבר). היתרה כמעט לינארית
+# בגיל החתונה; במרווח בין ילדים יש קפיצות (ceil של שנות החברות) ולכן הוא צפוף
+SURROGATE_AXES = {
+    'wedding_age': (18, 20, 22),
+    'avg_children_new_family': tuple(range(1, 16)),
+    'months_between_children': tuple(range(12, 61, 4)),
+}
+
+# מספר הנקודות שאינן על הרשת לבדיקת הקירוב מול המנוע
+VALIDATION_POINTS = 48
+
+# גרסת הרשת במאגר - שינוי ב-SURROGATE_AXES או בבנייה צריך להעלות אותה
+SURROGATE_VERSION = 2
+SURROGATE_KIND = f'surrogate:v{SURROGATE_VERSION}'
+
+
+@dataclass
+class Surrogate:
+    """רשת עקומות יתרה ומדדי הבדיקה שלה"""
+    years: np.ndarray
+    balances: np.ndarray              # (n_wedding, n_children, n_months, Y), מיתרת פתיחה 0
+    max_abs_error: float              # סטייה מקסימלית בעקומה בנקודות הבדיקה
+    max_min_balance_error: float      # סטייה מקסימלית ביתרה המינימלית
+    validation_points: int
+    build_seconds: float
+
+    @property
+    def relative_error(self) -> float:
+        """הסטייה המקסימלית ביחס לערך המוחלט הגדול ברשת"""
+        scale = float(np.abs(self.balances).max()) if self.balances.size else 0.0
+        return self.max_abs_error / scale if scale > 0 else 0.0
+
+    def evaluate(self, wedding_age: float, avg_children: float, months_between_children: float,
+                 initial_balance: float = 0) -> np.ndarray:
+        """
+        עקומת יתרה משוערת (Y,) באינטרפולציה מולטי-לינארית
+
+        ערכים מחוץ לטווח הרשת נחתכים לקצה שלה.
+        """
+        result = np.full(len(self.years), float(initial_balance))
+        corners = []
+        for axis, value in zip(SURROGATE_AXES.values(), (wedding_age, avg_children, months_between_children)):
+            nodes = np.asarray(axis, dtype=float)
+            value = float(np.clip(value, nodes[0], nodes[-1]))
+            upper = int(np.clip(np.searchsorted(nodes, value, side='right'), 1, len(nodes) - 1))
+            share = (value - nodes[upper - 1]) / (nodes[upper] - nodes[upper - 1])
+            corners.append(((upper - 1, 1 - share), (upper, share)))
+        for (i, wi) in corners[0]:
+            for (j, wj) in corners[1]:
+                for (k, wk) in corners[2]:
+                    weight = wi * wj * wk
+                    if weight:
+                        result += weight * self.balances[i, j, k]
+        return result
+
+
+def surrogate_base(params: ScenarioParams) -> ScenarioParams:
+    """התרחיש בלי הפרמטרים המבניים ובלי יתרת הפתיחה - המפתח של הרשת"""
+    return replace(params, initial_balance=0, **{name: 0 for name in SURROGATE_AXES})
+
+
+def _balance_curves(params: ScenarioParams, structural: Dict[str, np.ndarray]) -> np.ndarray:
+    """עקומות יתרה מדויקות (n, Y) לכל שורת ערכים מבניים, בקריאת מנוע אחת"""
+    yearly = scenario_yearly_arrays(params)
+    new_mode = params.distribution_mode
+    offsets, pct = unique_offsets(*distribution_arrays(
+        new_mode, params.distribution_df if new_mode != "none" else None
+    ))
+    flows = new_cashflow_arrays(
+        joiners=yearly['joiners'],
+        loan_amount=yearly['loan_amount'],
+        repayment_months=yearly['repayment_months'],
+        loan_percentage=yearly['loan_percentage'],
+        family_fee=yearly['family_fee'],
+        processed=yearly['processed'],
+        offsets=offsets,
+        weights=pct / 100,
+        wedding_age=structural['wedding_age'].astype(np.int64),
+        avg_children=structural['avg_children_new_family'],
+        months_between_children=structural['months_between_children'],
+        fee_refund_percentage=params.fee_refund_percentage
+    )
+    new_net = truncate(flows['repayments'] + flows['fees']) - truncate(flows['loans_amount'] + flows['refunds'])
+    return params.initial_balance + np.cumsum(existing_net_flows(params) + new_net, axis=-1)
+
+
+def build_surrogate(params: ScenarioParams, seed: int = 0) -> Surrogate:
+    """
+    בניית הרשת ובדיקתה מול המנוע המדויק
+
+    Args:
+        params: התרחיש (הפרמטרים המבניים ויתרת הפתיחה שבו לא משמשים)
+        seed: להגרלת נקודות הבדיקה
+    """
+    started = time.perf_counter()
+    params = surrogate_base(params)
+    grid = np.meshgrid(*(np.asarray(axis, dtype=float) for axis in SURROGATE_AXES.values()), indexing='ij')
+    shape = grid[0].shape
+    curves = _balance_curves(params, {name: nodes.ravel() for name, nodes in zip(SURROGATE_AXES, grid)})
+    surrogate = Surrogate(
+        years=scenario_yearly_arrays(params)['years'],
+        balances=curves.reshape(shape + curves.shape[-1:]),
+        max_abs_error=0.0,
+        max_min_balance_error=0.0,
+        validation_points=VALIDATION_POINTS,
+        build_seconds=0.0
+    )
+
+    # === בדיקה: נקודות שלמות אקראיות בטווח הרשת מול המנוע ===
+    rng = np.random.default_rng(seed)
+    points = {
+        name: rng.integers(axis[0], axis[-1] + 1, size=VALIDATION_POINTS).astype(float)
+        for name, axis in SURROGATE_AXES.items()
+    }
+    exact = _balance_curves(params, points)
+    approx = np.stack([
+        surrogate.evaluate(*(points[name][i] for name in SURROGATE_AXES))
+        for i in range(VALIDATION_POINTS)
+    ])
+    surrogate.max_abs_error = float(np.abs(approx - exact).max())
+    surrogate.max_min_balance_error = float(np.abs(approx.min(axis=-1) - exact.min(axis=-1)).max())
+    surrogate.build_seconds = time.perf_counter() - started
+    count('surrogate.engine_rows', curves.shape[0] + VALIDATION_POINTS)
+    return surrogate
+
+
+# =============================================================================
+# שמירה במאגר
+# =============================================================================
+
+def _encode_surrogate(surrogate: Surrogate) -> Tuple[Dict[str, pd.DataFrame], Dict[str, Any]]:
+    """רשת → טבלה (שורה לכל צומת, עמודה לכל שנה) וערכי הבדיקה"""
+    balances = surrogate.balances.reshape(-1, len(surrogate.years))
+    return {'balances': pd.DataFrame(balances, columns=[str(year) for year in surrogate.years])}, {
+        'max_abs_error': surrogate.max_abs_error,
+        'max_min_balance_error': surrogate.max_min_balance_error,
+        'validation_points': surrogate.validation_points,
+        'build_seconds': surrogate.build_seconds,
+    }
+
+
+def _decode_surrogate(frames: Dict[str, pd.DataFrame], meta: Dict[str, Any]) -> Surrogate:
+    df = frames['balances']
+    shape = tuple(len(axis) for axis in SURROGATE_AXES.values())
+    return Surrogate(
+        years=df.columns.astype(np.int64).to_numpy(),
+        balances=df.to_numpy(dtype=float).reshape(shape + (df.shape[1],)),
+        **meta
+    )
+
+
+# =============================================================================
+# בנייה ברקע
+# =============================================================================
+
+# רשתות מוכנות בזיכרון - משותף לכל הסשנים
+surrogate_cache = ProjectionCache(maxsize=8)
+
+# בנייה אחת בכל פעם; רק הרשת שהתבקשה אחרונה נבנית (גרירת slider מבקשת
+# רשת לכל ערך בדרך)
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='surrogate')
+_pending: Dict[str, Future] = {}
+_pending_lock = threading.Lock()
+_latest: Optional[str] = None
+
+
+def _build(params: ScenarioParams, base: ScenarioParams) -> Optional[Surrogate]:
+    """
+    הרשת של base: מהמאגר, או בנייה - ושמירה במאגר אם התרחיש params שמור
+
+    Returns:
+        Surrogate, או None אם בינתיים התבקשה רשת אחרת
+    """
+    key = scenario_hash(base)
+    with _pending_lock:
+        if key != _latest:
+            return None
+    db = default_store()
+    hit = db.get_result(key, SURROGATE_KIND)
+    if hit is not None:
+        return _decode_surrogate(*hit)
+    with stage('surrogate.build'):
+        surrogate = build_surrogate(base)
+    if db.has_params(scenario_hash(params)):
+        db.put_result(key, SURROGATE_KIND, *_encode_surrogate(surrogate))
+    return surrogate
+
+
+def surrogate_for(params: ScenarioParams, wait: bool = False) -> Optional[Surrogate]:
+    """
+    הרשת לתרחיש אם היא מוכנה, אחרת התחלת בנייה ברקע
+
+    Args:
+        params: התרחיש הנוכחי (רק התרחיש הבסיסי שלו קובע את הרשת)
+        wait: לחכות לסיום הבנייה (למשל בסקריפטים) במקום להחזיר None
+
+    Returns:
+        Surrogate, או None אם הרשת עדיין לא מוכנה
+    """
+    global _latest
+    base = surrogate_base(params)
+    ready = surrogate_cache.lookup(base)
+    if ready is not None:
+        return ready
+
+    key = scenario_hash(base)
+    with _pending_lock:
+        _latest = key
+        future = _pending.get(key)
+        if future is None:
+            future = _pending[key] = _executor.submit(_build, params, base)
+    if not (wait or future.done()):
+        return None
+
+    try:
+        surrogate = future.result()
+    finally:
+        with _pending_lock:
+            if _pending.get(key) is future:
+                del _pending[key]
+    if surrogate is not None:
+        surrogate_cache.put(base, surrogate)
+    return surrogate
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+sweep.py - סריקת פרמטרים על רשת תרחישים במאגר תהליכים
+
+במקום לשנות את הסיידבר ידנית rerun אחרי rerun: מגדירים טווחים לכמה
+פרמטרים (למשל default_family_fee, default_loan_amount, initial_balance),
+והרשת הקרטזית מחולקת לנתחים ומורצת במקביל. לכל נקודה נשמרים מדדי סיכום:
+יתרה מינימלית, שנה שלילית ראשונה ויתרה סופית.
+
+דוגמה:
+    results = run_sweep(ScenarioParams(), {
+        'default_family_fee': range(300, 601, 25),
+        'initial_balance': [0, 1_000_000, 5_000_000],
+    })
+"""
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import fields
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .core import ScenarioParams, net_flows, summarize_balance
+
+
+# פרמטרים שאפשר לסרוק: כל שדה סקלרי של ScenarioParams
+SWEEPABLE_PARAMS = tuple(
+    f.name for f in fields(ScenarioParams) if not f.name.startswith('df_') and not f.name.endswith('_df')
+)
+
+# תרחיש הבסיס בכל תהליך worker (נשלח פעם אחת ב-initializer)
+_worker_base: Optional[ScenarioParams] = None
+
+
+def build_grid(ranges: Mapping[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+    """
+    בניית הרשת הקרטזית בסדר דטרמיניסטי (הפרמטר האחרון משתנה הכי מהר)
+
+    Raises:
+        ValueError: אם פרמטר אינו ניתן לסריקה
+    """
+    unknown = [name for name in ranges if name not in SWEEPABLE_PARAMS]
+    if unknown:
+        raise ValueError(f"פרמטרים לא מוכרים לסריקה: {unknown}")
+
+    names = list(ranges)
+    return [dict(zip(names, values)) for values in itertools.product(*(list(ranges[n]) for n in names))]
+
+
+def evaluate_point(base: ScenarioParams, overrides: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    חישוב מדדי סיכום לנקודה אחת ברשת
+
+    יתרת הפתיחה לא משפיעה על התזרים, ולכן היא רק מוזזת על האיזון המצטבר.
+    """
+    params = base.with_overrides(**overrides)
+    years, net = net_flows(params)
+    return summarize_balance(years, params.initial_balance + np.cumsum(net))
+
+
+def _init_worker(base: ScenarioParams) -> None:
+    global _worker_base
+    _worker_base = base
+
+
+def _evaluate_chunk(chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [evaluate_point(_worker_base, overrides) for overrides in chunk]
+
+
+def run_sweep(
+    base: ScenarioParams,
+    ranges: Mapping[str, Sequence[Any]],
+    max_workers: Optional[int] = None,
+    chunk_size: int = 64,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> pd.DataFrame:
+    """
+    הרצת סריקה על הרשת הקרטזית של ranges
+
+    Args:
+        base: תרחיש הבסיס - כל מה שלא נסרק נלקח ממנו
+        ranges: פרמטר → רשימת ערכים
+        max_workers: מספר תהליכים (ברירת מחדל: מספר הליבות). 1 = ללא מאגר
+        chunk_size: מספר נקודות בכל משימה שנשלחת ל-worker
+        progress: callback(נקודות_שהושלמו, סה"כ_נקודות) אחרי כל נתח
+
+    Returns:
+        DataFrame בסדר הרשת: עמודה לכל פרמטר + min_balance,
+        first_negative_year, final_balance
+    """
+    grid = build_grid(ranges)
+    chunks = [grid[i:i + chunk_size] for i in range(0, len(grid), chunk_size)]
+    results: List[Optional[List[Dict[str, Any]]]] = [None] * len(chunks)
+    workers = max_workers or os.cpu_count() or 1
+    done = 0
+
+    if workers == 1 or len(chunks) <= 1:
+        _init_worker(base)
+        for i, chunk in enumerate(chunks):
+            results[i] = _evaluate_chunk(chunk)
+            done += len(chunk)
+            if progress:
+                progress(done, len(grid))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(base,)) as pool:
+            futures = {pool.submit(_evaluate_chunk, chunk): i for i, chunk in enumerate(chunks)}
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i] = future.result()
+                done += len(chunks[i])
+                if progress:
+                    progress(done, len(grid))
+
+    metrics = pd.DataFrame([row for chunk_results in results for row in chunk_results],
+                           columns=['min_balance', 'first_negative_year', 'final_balance'])
+    metrics['first_negative_year'] = metrics['first_negative_year'].astype('Int64')
+    return pd.concat([pd.DataFrame(grid, columns=list(ranges)), metrics], axis=1)
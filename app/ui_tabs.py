@@ -9,16 +9,36 @@ ui_tabs.py - רינדור הטאבים
 """
 
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-from io import BytesIO
+from plotly.colors import qualitative
+from plotly.subplots import make_subplots
 from typing import Dict, Optional
 
+from . import charts
+from .compare import COMPARE_COLUMNS, MAX_SCENARIOS, compute_scenarios, delta_table
+from .core import DEFAULT_START_YEAR, ProjectionResult, ScenarioParams
+from .export import EXPORT_FILES, csv_bytes, excel_bytes, export_key, get_export
+from .microsim import MicrosimSettings, reconcile, run_microsim_cached
+from .monthly import compute_monthly_projection_cached, summarize_monthly
+from .roster import import_roster
+from .montecarlo import MonteCarloSettings, run_monte_carlo_cached
+from .sensitivity import run_sensitivity_cached
+from .sobol import run_sobol_cached
+from .solver import solve_all_cached
+from .state import sync_widget
+from .store import default_store
+
+
+# רצפת יתרה ברירת מחדל למחשבון האיזון (מרווח ביטחון)
+SOLVER_DEFAULT_FLOOR = 100000
+
 
 def _filter_by_display_years(df: pd.DataFrame) -> pd.DataFrame:
     """סינון DataFrame לפי מספר השנים להצגה"""
     display_years = st.session_state.get('display_years', 30)
-    max_year = 2026 + display_years - 1
+    max_year = st.session_state.get('start_year', DEFAULT_START_YEAR) + display_years - 1
     return df[df['שנה'] <= max_year].copy()
 
 
@@ -49,61 +69,22 @@ def render_existing_tab(df_existing: pd.DataFrame):
     
     st.markdown("---")
     
+    fig1, fig2, fig3, fig4 = charts.cached_figures('existing', _existing_figures, df_existing)
+    
     # === גרף 1: יתרה מצטברת ===
     st.subheader("📈 תזרים מצטבר לקיימים")
-    fig1 = go.Figure()
-    colors = ['#2E86AB' if y >= 0 else '#D00000' for y in df_existing['יתרה_מצטברת']]
-    fig1.add_trace(go.Scatter(
-        x=df_existing['שנה'], y=df_existing['יתרה_מצטברת'],
-        mode='lines+markers', name='יתרה מצטברת',
-        line=dict(color='#2E86AB', width=3),
-        marker=dict(size=6, color=colors),
-        fill='tozeroy', fillcolor='rgba(46, 134, 171, 0.1)',
-        hovertemplate='<b>שנה:</b> %{x}<br><b>יתרה:</b> ₪%{y:,.0f}<extra></extra>'
-    ))
-    fig1.add_hline(y=0, line_dash="dash", line_color="red")
-    fig1.update_layout(height=400, xaxis_title="שנה", yaxis_title="יתרה מצטברת (₪)")
     st.plotly_chart(fig1, use_container_width=True)
     
     # === גרף 2: כסף נכנס/יוצא ===
     st.subheader("💸 כסף נכנס מול כסף יוצא")
-    fig2 = go.Figure()
-    fig2.add_trace(go.Bar(
-        x=df_existing['שנה'], y=df_existing['כסף_נכנס'],
-        name='כסף נכנס', marker_color='#06A77D',
-        hovertemplate='<b>נכנס:</b> ₪%{y:,.0f}<extra></extra>'
-    ))
-    fig2.add_trace(go.Bar(
-        x=df_existing['שנה'], y=df_existing['כסף_יוצא'],
-        name='כסף יוצא', marker_color='#D00000',
-        hovertemplate='<b>יוצא:</b> ₪%{y:,.0f}<extra></extra>'
-    ))
-    fig2.update_layout(barmode='group', height=400, xaxis_title="שנה", yaxis_title="סכום (₪)",
-                       legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
     st.plotly_chart(fig2, use_container_width=True)
     
     # === גרף 3: הלוואות ===
     st.subheader("💰 הלוואות לקיימים")
-    fig3 = go.Figure()
-    fig3.add_trace(go.Bar(
-        x=df_existing['שנה'], y=df_existing['כסף_יוצא'],
-        name='הלוואות', marker_color='#8B5CF6',
-        hovertemplate='<b>שנה:</b> %{x}<br><b>הלוואות:</b> ₪%{y:,.0f}<extra></extra>'
-    ))
-    fig3.update_layout(height=350, xaxis_title="שנה", yaxis_title="סכום הלוואות (₪)")
     st.plotly_chart(fig3, use_container_width=True)
     
     # === גרף 4: דמי מנוי ===
     st.subheader("💳 דמי מנוי מקיימים")
-    fig4 = go.Figure()
-    fig4.add_trace(go.Scatter(
-        x=df_existing['שנה'], y=df_existing['דמי_מנוי'],
-        mode='lines+markers', name='דמי מנוי',
-        line=dict(color='#06A77D', width=3),
-        fill='tozeroy', fillcolor='rgba(6, 167, 125, 0.2)',
-        hovertemplate='<b>שנה:</b> %{x}<br><b>דמי מנוי:</b> ₪%{y:,.0f}<extra></extra>'
-    ))
-    fig4.update_layout(height=350, xaxis_title="שנה", yaxis_title="דמי מנוי (₪)")
     st.plotly_chart(fig4, use_container_width=True)
     
     # === טבלת נתונים קיימים (עריכה) ===
@@ -111,6 +92,23 @@ def render_existing_tab(df_existing: pd.DataFrame):
     st.subheader("📋 טבלת ילדים קיימים")
     st.info("💡 ניתן לערוך את מספר הילדים ודמי המנוי לכל שנת הלוואה")
     
+    st.file_uploader(
+        "ייבוא רשימת חברים (CSV / Excel)",
+        type=["csv", "xlsx"],
+        key="roster_upload",
+        on_change=_import_roster_upload,
+        help="שורה לכל ילד: תאריך לידה (או שנת לידה), דמי מנוי חודשי, ושנת הלוואה אם כבר נקבעה. "
+             "הרשימה מצטמצמת לשורה לכל שנת הלוואה ודמי מנוי."
+    )
+    imported = st.session_state.get('_roster_import')
+    if isinstance(imported, str):
+        st.error(imported)
+    elif imported is not None:
+        st.caption(
+            f"יובאו {imported.children:,} ילדים ל-{len(imported.df_loans)} שורות "
+            f"({imported.rows_skipped:,} שורות לא תקינות דולגו, {imported.elapsed_seconds:.2f} שנ')"
+        )
+    
     edited_df = st.data_editor(
         st.session_state.df_existing_loans,
         use_container_width=True,
@@ -130,10 +128,71 @@ def render_existing_tab(df_existing: pd.DataFrame):
     st.dataframe(df_existing, use_container_width=True, height=300)
 
 
+def _import_roster_upload():
+    """צמצום הקובץ שהועלה לטבלת הקיימים (callback - לפני חישוב התחזית)"""
+    upload = st.session_state.get('roster_upload')
+    if upload is None:
+        return
+    try:
+        result = import_roster(upload, upload.name)
+    except ValueError as error:
+        st.session_state._roster_import = f"הייבוא נכשל: {error}"
+        return
+    st.session_state._roster_import = result
+    st.session_state.df_existing_loans = result.df_loans.copy()
+    # העריכות השמורות של ה-editor מתייחסות לשורות של הטבלה הקודמת
+    st.session_state.pop('existing_loans_editor', None)
+
+
+def _existing_figures(df_existing: pd.DataFrame):
+    """גרפי טאב קיימים (נשמרים במטמון לפי תוכן הטבלה)"""
+    fig1 = go.Figure()
+    fig1.add_trace(charts.line(
+        df_existing['שנה'], df_existing['יתרה_מצטברת'], name='יתרה מצטברת', color='#2E86AB',
+        markers=True, sign_colors=('#2E86AB', '#D00000'),
+        fill='tozeroy', fillcolor='rgba(46, 134, 171, 0.1)',
+        hovertemplate='<b>שנה:</b> %{x}<br><b>יתרה:</b> ₪%{y:,.0f}<extra></extra>'
+    ))
+    fig1.add_hline(y=0, line_dash="dash", line_color="red")
+    fig1.update_layout(height=400, xaxis_title="שנה", yaxis_title="יתרה מצטברת (₪)")
+    
+    fig2 = go.Figure()
+    fig2.add_trace(charts.bars(
+        df_existing['שנה'], df_existing['כסף_נכנס'], name='כסף נכנס', color='#06A77D',
+        hovertemplate='<b>נכנס:</b> ₪%{y:,.0f}<extra></extra>'
+    ))
+    fig2.add_trace(charts.bars(
+        df_existing['שנה'], df_existing['כסף_יוצא'], name='כסף יוצא', color='#D00000',
+        hovertemplate='<b>יוצא:</b> ₪%{y:,.0f}<extra></extra>'
+    ))
+    fig2.update_layout(barmode='group', height=400, xaxis_title="שנה", yaxis_title="סכום (₪)",
+                       legend=charts.HORIZONTAL_LEGEND)
+    
+    fig3 = go.Figure()
+    fig3.add_trace(charts.bars(
+        df_existing['שנה'], df_existing['כסף_יוצא'], name='הלוואות', color='#8B5CF6',
+        hovertemplate='<b>שנה:</b> %{x}<br><b>הלוואות:</b> ₪%{y:,.0f}<extra></extra>'
+    ))
+    fig3.update_layout(height=350, xaxis_title="שנה", yaxis_title="סכום הלוואות (₪)")
+    
+    fig4 = go.Figure()
+    fig4.add_trace(charts.line(
+        df_existing['שנה'], df_existing['דמי_מנוי'], name='דמי מנוי', color='#06A77D', markers=True,
+        fill='tozeroy', fillcolor='rgba(6, 167, 125, 0.2)',
+        hovertemplate='<b>שנה:</b> %{x}<br><b>דמי מנוי:</b> ₪%{y:,.0f}<extra></extra>'
+    ))
+    fig4.update_layout(height=350, xaxis_title="שנה", yaxis_title="דמי מנוי (₪)")
+    
+    return fig1, fig2, fig3, fig4
+
+
 def render_new_tab(df_new: pd.DataFrame):
     """
-    טאב חדשות - משפחות שמצטרפות מ-2026 (מודל קוהורטות)
+    טאב חדשות - משפחות שמצטרפות משנת ההתחלה (מודל קוהורטות)
     """
+    # הטבלה המלאה - להשוואה מול המיקרו-סימולציה
+    df_cohort = df_new
+    
     # סינון לפי שנים להצגה
     df_new = _filter_by_display_years(df_new)
     
@@ -168,79 +227,27 @@ def render_new_tab(df_new: pd.DataFrame):
     
     st.markdown("---")
     
+    fig1, fig2, fig3, fig4, fig5 = charts.cached_figures('new', _new_figures, df_new)
+    
     # === גרף 1: יתרה מצטברת ===
     st.subheader("📈 תזרים מצטבר לחדשות")
-    fig1 = go.Figure()
-    colors = ['#F59E0B' if y >= 0 else '#D00000' for y in df_new['יתרה_מצטברת']]
-    fig1.add_trace(go.Scatter(
-        x=df_new['שנה'], y=df_new['יתרה_מצטברת'],
-        mode='lines+markers', name='יתרה מצטברת',
-        line=dict(color='#F59E0B', width=3),
-        marker=dict(size=6, color=colors),
-        fill='tozeroy', fillcolor='rgba(245, 158, 11, 0.1)',
-        hovertemplate='<b>שנה:</b> %{x}<br><b>יתרה:</b> ₪%{y:,.0f}<extra></extra>'
-    ))
-    fig1.add_hline(y=0, line_dash="dash", line_color="red")
-    fig1.update_layout(height=400, xaxis_title="שנה", yaxis_title="יתרה מצטברת (₪)")
     st.plotly_chart(fig1, use_container_width=True)
     
     # === גרף 2: כסף נכנס/יוצא ===
     st.subheader("💸 כסף נכנס מול כסף יוצא")
-    fig2 = go.Figure()
-    fig2.add_trace(go.Bar(
-        x=df_new['שנה'], y=df_new['כסף_נכנס'],
-        name='כסף נכנס', marker_color='#06A77D',
-        hovertemplate='<b>נכנס:</b> ₪%{y:,.0f}<extra></extra>'
-    ))
-    fig2.add_trace(go.Bar(
-        x=df_new['שנה'], y=df_new['כסף_יוצא'],
-        name='כסף יוצא', marker_color='#D00000',
-        hovertemplate='<b>יוצא:</b> ₪%{y:,.0f}<extra></extra>'
-    ))
-    fig2.update_layout(barmode='group', height=400, xaxis_title="שנה", yaxis_title="סכום (₪)",
-                       legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
     st.plotly_chart(fig2, use_container_width=True)
     
     # === גרף 3: אחוז לווים לאורך הזמן ===
     st.subheader("📊 אחוז לווים מכלל החברים (מודל קוהורטות)")
     st.caption("0% עד 2046, אח\"כ עלייה הדרגתית, מתייצב על ~11% אחרי 50 שנה")
-    fig3 = go.Figure()
-    fig3.add_trace(go.Scatter(
-        x=df_new['שנה'], y=df_new['אחוז_לווים'],
-        mode='lines+markers', name='אחוז לווים',
-        line=dict(color='#8B5CF6', width=3),
-        fill='tozeroy', fillcolor='rgba(139, 92, 246, 0.2)',
-        hovertemplate='<b>שנה:</b> %{x}<br><b>אחוז לווים:</b> %{y:.1f}%<extra></extra>'
-    ))
-    fig3.add_hline(y=11, line_dash="dash", line_color="green", 
-                   annotation_text="יעד: 11%", annotation_position="right")
-    fig3.update_layout(height=350, xaxis_title="שנה", yaxis_title="אחוז לווים (%)")
     st.plotly_chart(fig3, use_container_width=True)
     
     # === גרף 4: משפחות מצטברות ===
     st.subheader("👨‍👩‍👧‍👦 משפחות מצטברות")
-    fig4 = go.Figure()
-    fig4.add_trace(go.Scatter(
-        x=df_new['שנה'], y=df_new['משפחות_מצטברות'],
-        mode='lines+markers', name='משפחות מצטברות',
-        line=dict(color='#10B981', width=3),
-        fill='tozeroy', fillcolor='rgba(16, 185, 129, 0.2)',
-        hovertemplate='<b>שנה:</b> %{x}<br><b>משפחות:</b> %{y:,.0f}<extra></extra>'
-    ))
-    fig4.update_layout(height=350, xaxis_title="שנה", yaxis_title="משפחות מצטברות")
     st.plotly_chart(fig4, use_container_width=True)
     
     # === גרף 5: דמי מנוי ===
     st.subheader("💳 דמי מנוי ממשפחות חדשות")
-    fig5 = go.Figure()
-    fig5.add_trace(go.Scatter(
-        x=df_new['שנה'], y=df_new['דמי_מנוי'],
-        mode='lines+markers', name='דמי מנוי',
-        line=dict(color='#EF4444', width=3),
-        fill='tozeroy', fillcolor='rgba(239, 68, 68, 0.2)',
-        hovertemplate='<b>שנה:</b> %{x}<br><b>דמי מנוי:</b> ₪%{y:,.0f}<extra></extra>'
-    ))
-    fig5.update_layout(height=350, xaxis_title="שנה", yaxis_title="דמי מנוי (₪)")
     st.plotly_chart(fig5, use_container_width=True)
     
     # === טבלת פרמטרים שנתיים (עריכה) ===
@@ -267,6 +274,134 @@ def render_new_tab(df_new: pd.DataFrame):
     # === טבלת תוצאות ===
     st.subheader("📊 טבלת תזרים שנתי")
     st.dataframe(df_new, use_container_width=True, height=300)
+    
+    _render_microsim_section(df_cohort)
+
+
+@st.fragment
+def _render_microsim_section(df_cohort: pd.DataFrame):
+    """
+    מיקרו-סימולציה - רשומה לכל משפחה ולכל ילד, לשאלות ברמת משק בית
+    """
+    st.markdown("---")
+    st.subheader("🏠 מיקרו-סימולציה (משפחה-משפחה)")
+    
+    enabled = st.toggle(
+        "הפעל מיקרו-סימולציה",
+        key="microsim_enabled",
+        help="כל משפחה וכל ילד כרשומה: חתונות, הלוואות והחזר דמי מנוי לכל משפחה"
+    )
+    if not enabled:
+        return
+    
+    seed = st.number_input("Seed", min_value=0, max_value=1000000, value=0, step=1, key="microsim_seed")
+    with st.spinner("מריץ מיקרו-סימולציה..."):
+        result = run_microsim_cached(ScenarioParams.from_state(st.session_state), MicrosimSettings(seed=int(seed)))
+    df_families = result.df_families
+    df_yearly = _filter_by_display_years(result.df_yearly)
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("משפחות", f"{len(df_families):,}")
+    with col2:
+        two_loans = int((df_families['מקסימום_הלוואות_פעילות'] >= 2).sum())
+        st.metric("משפחות שהחזיקו 2+ הלוואות במקביל", f"{two_loans:,}")
+    with col3:
+        st.metric("זמן חישוב", f"{result.elapsed_seconds:.2f} שנ'")
+    
+    # === משפחות עם הלוואות פעילות ===
+    fig = go.Figure()
+    fig.add_trace(charts.line(
+        df_yearly['שנה'], df_yearly['משפחות_עם_הלוואה_פעילה'], name='הלוואה פעילה אחת לפחות', color='#2E86AB',
+        hovertemplate='<b>שנה:</b> %{x}<br><b>משפחות:</b> %{y:,.0f}<extra></extra>'
+    ))
+    fig.add_trace(charts.line(
+        df_yearly['שנה'], df_yearly['משפחות_עם_2_הלוואות_ומעלה'], name='2 הלוואות פעילות ומעלה', color='#D00000',
+        hovertemplate='<b>שנה:</b> %{x}<br><b>משפחות:</b> %{y:,.0f}<extra></extra>'
+    ))
+    fig.update_layout(height=350, xaxis_title="שנה", yaxis_title="משפחות", legend=charts.HORIZONTAL_LEGEND)
+    st.plotly_chart(fig, use_container_width=True)
+    
+    with st.expander("🔎 התאמה מול מודל הקוהורטות"):
+        st.caption("ההפרשים נובעים מעיגול המשפחות לכל סטייה ומהגרלת הלווים")
+        st.dataframe(
+            reconcile(result, df_cohort),
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "קוהורטות": st.column_config.NumberColumn(format="%.0f"),
+                "מיקרו": st.column_config.NumberColumn(format="%.0f"),
+                "סטייה_בסכום": st.column_config.NumberColumn(format="percent"),
+                "סטייה_שנתית_מקסימלית": st.column_config.NumberColumn(format="percent"),
+            }
+        )
+    
+    # === משפחה בודדת ===
+    if len(df_families):
+        family_id = st.number_input(
+            "מזהה משפחה",
+            min_value=0,
+            max_value=len(df_families) - 1,
+            value=0,
+            step=1,
+            key="microsim_family"
+        )
+        st.dataframe(df_families.iloc[[int(family_id)]], use_container_width=True, hide_index=True)
+        children = result.df_children[result.df_children['מזהה_משפחה'] == int(family_id)]
+        st.dataframe(children, use_container_width=True, hide_index=True)
+
+
+def _new_figures(df_new: pd.DataFrame):
+    """גרפי טאב חדשות (נשמרים במטמון לפי תוכן הטבלה)"""
+    fig1 = go.Figure()
+    fig1.add_trace(charts.line(
+        df_new['שנה'], df_new['יתרה_מצטברת'], name='יתרה מצטברת', color='#F59E0B',
+        markers=True, sign_colors=('#F59E0B', '#D00000'),
+        fill='tozeroy', fillcolor='rgba(245, 158, 11, 0.1)',
+        hovertemplate='<b>שנה:</b> %{x}<br><b>יתרה:</b> ₪%{y:,.0f}<extra></extra>'
+    ))
+    fig1.add_hline(y=0, line_dash="dash", line_color="red")
+    fig1.update_layout(height=400, xaxis_title="שנה", yaxis_title="יתרה מצטברת (₪)")
+    
+    fig2 = go.Figure()
+    fig2.add_trace(charts.bars(
+        df_new['שנה'], df_new['כסף_נכנס'], name='כסף נכנס', color='#06A77D',
+        hovertemplate='<b>נכנס:</b> ₪%{y:,.0f}<extra></extra>'
+    ))
+    fig2.add_trace(charts.bars(
+        df_new['שנה'], df_new['כסף_יוצא'], name='כסף יוצא', color='#D00000',
+        hovertemplate='<b>יוצא:</b> ₪%{y:,.0f}<extra></extra>'
+    ))
+    fig2.update_layout(barmode='group', height=400, xaxis_title="שנה", yaxis_title="סכום (₪)",
+                       legend=charts.HORIZONTAL_LEGEND)
+    
+    fig3 = go.Figure()
+    fig3.add_trace(charts.line(
+        df_new['שנה'], df_new['אחוז_לווים'], name='אחוז לווים', color='#8B5CF6', markers=True, decimals=1,
+        fill='tozeroy', fillcolor='rgba(139, 92, 246, 0.2)',
+        hovertemplate='<b>שנה:</b> %{x}<br><b>אחוז לווים:</b> %{y:.1f}%<extra></extra>'
+    ))
+    fig3.add_hline(y=11, line_dash="dash", line_color="green", 
+                   annotation_text="יעד: 11%", annotation_position="right")
+    fig3.update_layout(height=350, xaxis_title="שנה", yaxis_title="אחוז לווים (%)")
+    
+    fig4 = go.Figure()
+    fig4.add_trace(charts.line(
+        df_new['שנה'], df_new['משפחות_מצטברות'], name='משפחות מצטברות', color='#10B981', markers=True,
+        fill='tozeroy', fillcolor='rgba(16, 185, 129, 0.2)',
+        hovertemplate='<b>שנה:</b> %{x}<br><b>משפחות:</b> %{y:,.0f}<extra></extra>'
+    ))
+    fig4.update_layout(height=350, xaxis_title="שנה", yaxis_title="משפחות מצטברות")
+    
+    fig5 = go.Figure()
+    fig5.add_trace(charts.line(
+        df_new['שנה'], df_new['דמי_מנוי'], name='דמי מנוי', color='#EF4444', markers=True,
+        fill='tozeroy', fillcolor='rgba(239, 68, 68, 0.2)',
+        hovertemplate='<b>שנה:</b> %{x}<br><b>דמי מנוי:</b> ₪%{y:,.0f}<extra></extra>'
+    ))
+    fig5.update_layout(height=350, xaxis_title="שנה", yaxis_title="דמי מנוי (₪)")
+    
+    return fig1, fig2, fig3, fig4, fig5
 
 
 def render_combined_tab(df_combined: pd.DataFrame, df_existing: pd.DataFrame, df_new: pd.DataFrame):
@@ -287,7 +422,7 @@ def render_combined_tab(df_combined: pd.DataFrame, df_existing: pd.DataFrame, df
     with col2:
         final_balance = df_combined['יתרת_קופה'].iloc[-1]
         change = final_balance - st.session_state.initial_balance
-        st.metric("יתרה סופית (2075)", f"₪{final_balance:,.0f}", f"{change:+,.0f} ₪")
+        st.metric(f"יתרה סופית ({df_combined['שנה'].iloc[-1]})", f"₪{final_balance:,.0f}", f"{change:+,.0f} ₪")
     with col3:
         total_out = df_combined['כסף_יוצא'].sum()
         st.metric("סה\"כ הלוואות", f"₪{total_out/1e6:.1f}M")
@@ -305,172 +440,362 @@ def render_combined_tab(df_combined: pd.DataFrame, df_existing: pd.DataFrame, df
     else:
         st.success("✅ הקופה נשארת חיובית לאורך כל התקופה!")
     
+    fig1, fig2, fig3, fig4, fig5 = charts.cached_figures('combined', _combined_figures, df_combined)
+    
     # === גרף 1: יתרת קופה מצטברת ===
     st.subheader("📈 יתרת קופה לאורך זמן")
+    st.plotly_chart(fig1, use_container_width=True)
+    _render_surrogate_check(df_combined)
+    
+    # === גרף 2: כסף נכנס/יוצא מאוחד ===
+    st.subheader("💸 כסף נכנס מול כסף יוצא (כולל)")
+    st.plotly_chart(fig2, use_container_width=True)
+    
+    # === גרף 3: השוואת הלוואות קיימים/חדשות ===
+    st.subheader("💰 השוואת הלוואות - קיימים מול חדשות")
+    st.plotly_chart(fig3, use_container_width=True)
+    
+    # === גרף 4: השוואת דמי מנוי ===
+    st.subheader("💳 השוואת דמי מנוי - קיימים מול חדשות")
+    st.plotly_chart(fig4, use_container_width=True)
+    
+    # === גרף 5: איזון שנתי ===
+    st.subheader("📊 איזון שנתי (הכנסות - הוצאות)")
+    st.plotly_chart(fig5, use_container_width=True)
+    
+    # === ניתוח יציבות ===
+    st.markdown("---")
+    st.subheader("🔍 ניתוח יציבות")
+    
+    if (df_combined['יתרת_קופה'] < 0).any():
+        first_negative = df_combined[df_combined['יתרת_קופה'] < 0]['שנה'].iloc[0]
+        min_balance = df_combined['יתרת_קופה'].min()
+        floor = int(st.session_state.get('solver_floor', SOLVER_DEFAULT_FLOOR))
+        solved = solve_all_cached(ScenarioParams.from_state(st.session_state), floor)
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("#### 💡 המלצות לייצוב")
+            st.info(f"צריך יתרה התחלתית של לפחות **₪{solved['initial_balance'].value:,.0f}**")
+            if solved['default_family_fee'].feasible:
+                st.info(f"או דמי מנוי משפחתי של לפחות **₪{solved['default_family_fee'].value:,.0f}**")
+            st.caption(f"לרצפת יתרה של ₪{floor:,.0f} - פרטים בטאב ⚖️ מחשבון איזון")
+        with col2:
+            st.markdown("#### 📉 פרטים")
+            st.warning(f"שנה ראשונה שלילית: **{first_negative}**")
+            st.warning(f"יתרה מינימלית: **₪{min_balance:,.0f}**")
+    
+    # === רזולוציה חודשית ===
+    _render_monthly_section(df_combined)
+    
+    # === מונטה קרלו ===
+    _render_monte_carlo_section(df_combined)
+    
+    # === ייצוא ===
+    st.markdown("---")
+    st.subheader("💾 ייצוא נתונים")
+    
+    _render_export_section(df_existing, df_new, df_combined)
+    
+    # === טבלת נתונים מלאה ===
+    st.subheader("📋 טבלת נתונים מלאה")
+    st.dataframe(df_combined, use_container_width=True, height=400)
+
+
+def _render_surrogate_check(df_combined: pd.DataFrame):
+    """הסטייה של התצוגה המקדימה בסיידבר (קירוב) מהיתרה המדויקת שחושבה"""
+    preview = st.session_state.get('_surrogate_preview')
+    if preview is None:
+        return
+    years, balance = preview
+    approx = pd.Series(balance, index=years).reindex(df_combined['שנה']).to_numpy()
+    error = np.abs(approx - df_combined['יתרת_קופה'].to_numpy())
+    if np.isnan(error).all():
+        return
+    st.caption(
+        f"🔍 התצוגה המקדימה בסיידבר סטתה מהחישוב המדויק ב-₪{np.nanmax(error):,.0f} לכל היותר "
+        f"(ביתרה המינימלית: ₪{abs(np.nanmin(approx) - df_combined['יתרת_קופה'].min()):,.0f})"
+    )
+
+
+def _combined_figures(df_combined: pd.DataFrame):
+    """גרפי טאב מאוחד (נשמרים במטמון לפי תוכן הטבלה)"""
     fig1 = go.Figure()
-    colors = ['#2E86AB' if y >= 0 else '#D00000' for y in df_combined['יתרת_קופה']]
-    fig1.add_trace(go.Scatter(
-        x=df_combined['שנה'], y=df_combined['יתרת_קופה'],
-        mode='lines+markers', name='יתרת קופה',
-        line=dict(color='#2E86AB', width=3),
-        marker=dict(size=6, color=colors),
+    fig1.add_trace(charts.line(
+        df_combined['שנה'], df_combined['יתרת_קופה'], name='יתרת קופה', color='#2E86AB',
+        markers=True, sign_colors=('#2E86AB', '#D00000'),
         fill='tozeroy', fillcolor='rgba(46, 134, 171, 0.1)',
         hovertemplate='<b>שנה:</b> %{x}<br><b>יתרה:</b> ₪%{y:,.0f}<extra></extra>'
     ))
     fig1.add_hline(y=0, line_dash="dash", line_color="red")
     fig1.update_layout(height=500, xaxis_title="שנה", yaxis_title="יתרת קופה (₪)")
-    st.plotly_chart(fig1, use_container_width=True)
     
-    # === גרף 2: כסף נכנס/יוצא מאוחד ===
-    st.subheader("💸 כסף נכנס מול כסף יוצא (כולל)")
     fig2 = go.Figure()
-    fig2.add_trace(go.Bar(
-        x=df_combined['שנה'], y=df_combined['כסף_נכנס'],
-        name='כסף נכנס', marker_color='#06A77D',
+    fig2.add_trace(charts.bars(
+        df_combined['שנה'], df_combined['כסף_נכנס'], name='כסף נכנס', color='#06A77D',
         hovertemplate='<b>נכנס:</b> ₪%{y:,.0f}<extra></extra>'
     ))
-    fig2.add_trace(go.Bar(
-        x=df_combined['שנה'], y=df_combined['כסף_יוצא'],
-        name='כסף יוצא', marker_color='#D00000',
+    fig2.add_trace(charts.bars(
+        df_combined['שנה'], df_combined['כסף_יוצא'], name='כסף יוצא', color='#D00000',
         hovertemplate='<b>יוצא:</b> ₪%{y:,.0f}<extra></extra>'
     ))
     fig2.update_layout(barmode='group', height=400, xaxis_title="שנה", yaxis_title="סכום (₪)",
-                       legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
-    st.plotly_chart(fig2, use_container_width=True)
+                       legend=charts.HORIZONTAL_LEGEND)
     
-    # === גרף 3: השוואת הלוואות קיימים/חדשות ===
-    st.subheader("💰 השוואת הלוואות - קיימים מול חדשות")
     fig3 = go.Figure()
-    fig3.add_trace(go.Bar(
-        x=df_combined['שנה'], y=df_combined['כסף_יוצא_קיימות'],
-        name='קיימים', marker_color='#8B5CF6',
+    fig3.add_trace(charts.bars(
+        df_combined['שנה'], df_combined['כסף_יוצא_קיימות'], name='קיימים', color='#8B5CF6',
         hovertemplate='<b>קיימים:</b> ₪%{y:,.0f}<extra></extra>'
     ))
-    fig3.add_trace(go.Bar(
-        x=df_combined['שנה'], y=df_combined['כסף_יוצא_חדשות'],
-        name='חדשות', marker_color='#F59E0B',
+    fig3.add_trace(charts.bars(
+        df_combined['שנה'], df_combined['כסף_יוצא_חדשות'], name='חדשות', color='#F59E0B',
         hovertemplate='<b>חדשות:</b> ₪%{y:,.0f}<extra></extra>'
     ))
     fig3.update_layout(barmode='stack', height=400, xaxis_title="שנה", yaxis_title="סכום הלוואות (₪)",
-                       legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
-    st.plotly_chart(fig3, use_container_width=True)
+                       legend=charts.HORIZONTAL_LEGEND)
     
-    # === גרף 4: השוואת דמי מנוי ===
-    st.subheader("💳 השוואת דמי מנוי - קיימים מול חדשות")
     fig4 = go.Figure()
-    fig4.add_trace(go.Scatter(
-        x=df_combined['שנה'], y=df_combined['דמי_מנוי_קיימות'],
-        mode='lines', name='קיימים',
-        line=dict(color='#8B5CF6', width=2),
+    fig4.add_trace(charts.line(
+        df_combined['שנה'], df_combined['דמי_מנוי_קיימות'], name='קיימים', color='#8B5CF6', width=2,
         stackgroup='one', fillcolor='rgba(139, 92, 246, 0.5)',
         hovertemplate='<b>קיימים:</b> ₪%{y:,.0f}<extra></extra>'
     ))
-    fig4.add_trace(go.Scatter(
-        x=df_combined['שנה'], y=df_combined['דמי_מנוי_חדשות'],
-        mode='lines', name='חדשות',
-        line=dict(color='#F59E0B', width=2),
+    fig4.add_trace(charts.line(
+        df_combined['שנה'], df_combined['דמי_מנוי_חדשות'], name='חדשות', color='#F59E0B', width=2,
         stackgroup='one', fillcolor='rgba(245, 158, 11, 0.5)',
         hovertemplate='<b>חדשות:</b> ₪%{y:,.0f}<extra></extra>'
     ))
     fig4.update_layout(height=400, xaxis_title="שנה", yaxis_title="דמי מנוי (₪)",
-                       legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
-    st.plotly_chart(fig4, use_container_width=True)
+                       legend=charts.HORIZONTAL_LEGEND)
     
-    # === גרף 5: איזון שנתי ===
-    st.subheader("📊 איזון שנתי (הכנסות - הוצאות)")
-    colors = ['#06A77D' if x >= 0 else '#D00000' for x in df_combined['איזון']]
     fig5 = go.Figure()
-    fig5.add_trace(go.Bar(
-        x=df_combined['שנה'], y=df_combined['איזון'],
-        marker_color=colors,
+    fig5.add_trace(charts.bars(
+        df_combined['שנה'], df_combined['איזון'], sign_colors=('#06A77D', '#D00000'),
         hovertemplate='<b>שנה:</b> %{x}<br><b>איזון:</b> ₪%{y:,.0f}<extra></extra>'
     ))
     fig5.add_hline(y=0, line_dash="dash", line_color="black")
     fig5.update_layout(height=400, xaxis_title="שנה", yaxis_title="איזון (₪)", showlegend=False)
-    st.plotly_chart(fig5, use_container_width=True)
     
-    # === ניתוח יציבות ===
-    st.markdown("---")
-    st.subheader("🔍 ניתוח יציבות")
+    return fig1, fig2, fig3, fig4, fig5
+
+
+@st.fragment
+def _render_export_section(df_existing: pd.DataFrame, df_new: pd.DataFrame, df_combined: pd.DataFrame):
+    """
+    כפתורי הורדה - הקבצים נבנים רק אחרי לחיצה על "הכן קבצים", ונשמרים במטמון
+    """
+    params = ScenarioParams.from_state(st.session_state)
+    display_years = st.session_state.get('display_years', 30)
+    key = export_key(params, display_years)
     
-    if (df_combined['יתרת_קופה'] < 0).any():
-        first_negative = df_combined[df_combined['יתרת_קופה'] < 0]['שנה'].iloc[0]
-        min_balance = df_combined['יתרת_קופה'].min()
-        needed_balance = st.session_state.initial_balance - min_balance + 100000
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            st.markdown("#### 💡 המלצות לייצוב")
-            st.info(f"צריך יתרה התחלתית של לפחות **₪{needed_balance:,.0f}**")
-        with col2:
-            st.markdown("#### 📉 פרטים")
-            st.warning(f"שנה ראשונה שלילית: **{first_negative}**")
-            st.warning(f"יתרה מינימלית: **₪{min_balance:,.0f}**")
+    # בקשה קודמת תקפה רק לאותו תרחיש ואותן שנים
+    if st.session_state.get('export_requested') != key:
+        if st.button("📦 הכן קבצים להורדה", use_container_width=True, key="export_prepare"):
+            st.session_state.export_requested = key
+        else:
+            st.caption("הקבצים נבנים רק לפי דרישה")
+            return
     
-    # === ייצוא ===
+    builders = {
+        'existing_csv': lambda: csv_bytes(df_existing),
+        'new_csv': lambda: csv_bytes(df_new),
+        'combined_csv': lambda: csv_bytes(df_combined),
+        'report_xlsx': lambda: excel_bytes({
+            'ילדים קיימים': st.session_state.df_existing_loans,
+            'פרמטרים חדשות': st.session_state.df_yearly_params,
+            'תזרים קיימים': df_existing,
+            'תזרים חדשות': df_new,
+            'מאוחד': df_combined,
+        }),
+    }
+    labels = {
+        'existing_csv': "⬇️ קיימים CSV",
+        'new_csv': "⬇️ חדשות CSV",
+        'combined_csv': "⬇️ מאוחד CSV",
+        'report_xlsx': "⬇️ הורד דוח Excel מלא",
+    }
+    
+    with st.spinner("מכין קבצים..."):
+        files = {kind: get_export(params, kind, display_years, build) for kind, build in builders.items()}
+    
+    columns = st.columns(3)
+    for column, kind in zip(columns, ['existing_csv', 'new_csv', 'combined_csv']):
+        with column:
+            file_name, mime = EXPORT_FILES[kind]
+            st.download_button(labels[kind], files[kind], file_name, mime, use_container_width=True)
+    
+    file_name, mime = EXPORT_FILES['report_xlsx']
+    st.download_button(labels['report_xlsx'], files['report_xlsx'], file_name, mime, use_container_width=True)
+
+
+@st.fragment
+def _render_monthly_section(df_combined: pd.DataFrame):
+    """
+    תזרים חודשי - החזרים מדויקים לפי חודשים ויתרה מינימלית בתוך כל שנה
+    """
     st.markdown("---")
-    st.subheader("💾 ייצוא נתונים")
+    st.subheader("📅 רזולוציה חודשית")
+    
+    enabled = st.toggle(
+        "הצג תזרים חודשי",
+        key="monthly_enabled",
+        help="הלוואות ודמי מנוי מתפזרים על חודשי השנה, וכל הלוואה מוחזרת בדיוק במספר התשלומים החודשיים שלה"
+    )
+    if not enabled:
+        return
+    
+    df_monthly = _filter_by_display_years(
+        compute_monthly_projection_cached(ScenarioParams.from_state(st.session_state))
+    )
+    df_summary = summarize_monthly(df_monthly)
+    lowest = df_monthly.loc[df_monthly['יתרת_קופה'].idxmin()]
     
     col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("יתרה חודשית מינימלית", f"₪{lowest['יתרת_קופה']:,.0f}")
+    with col2:
+        st.metric("מועד המינימום", f"{int(lowest['חודש']):02d}/{int(lowest['שנה'])}")
+    with col3:
+        st.metric("מינימום שנתי (סוף שנה)", f"₪{_filter_by_display_years(df_combined)['יתרת_קופה'].min():,.0f}")
+    
+    fig = go.Figure()
+    fig.add_trace(charts.line(
+        df_monthly['שנה'] + (df_monthly['חודש'] - 1) / 12, df_monthly['יתרת_קופה'],
+        name='יתרה חודשית', color='#2E86AB', width=2,
+        hovertemplate='<b>יתרה:</b> ₪%{y:,.0f}<extra></extra>'
+    ))
+    fig.add_trace(charts.points(
+        df_summary['שנה'] + (df_summary['חודש_מינימום'] - 1) / 12, df_summary['יתרה_מינימלית_חודשית'],
+        name='מינימום בשנה', color='#D00000',
+        hovertemplate='<b>מינימום:</b> ₪%{y:,.0f}<extra></extra>'
+    ))
+    fig.add_hline(y=0, line_dash="dash", line_color="red")
+    fig.update_layout(height=400, xaxis_title="שנה", yaxis_title="יתרת קופה (₪)",
+                      legend=charts.HORIZONTAL_LEGEND)
+    st.plotly_chart(fig, use_container_width=True)
+    
+    with st.expander("📋 סיכום שנתי - יתרה מינימלית בתוך השנה"):
+        st.dataframe(df_summary, use_container_width=True, hide_index=True)
+
+
+@st.fragment
+def _render_monte_carlo_section(df_combined: pd.DataFrame):
+    """
+    מצב סטוכסטי - רצועות P5/P50/P95 ליתרת הקופה והסתברות לגירעון
+    """
+    st.markdown("---")
+    st.subheader("🎲 תחזית סטוכסטית (מונטה קרלו)")
     
+    enabled = st.toggle(
+        "הפעל סימולציה",
+        key="mc_enabled",
+        help="הגרלת אלפי מסלולים סביב הפרמטרים: מצטרפים, אחוז לוקחי הלוואה וגיל נישואין"
+    )
+    if not enabled:
+        return
+    
+    col1, col2, col3, col4 = st.columns(4)
     with col1:
-        csv_existing = df_existing.to_csv(index=False).encode('utf-8-sig')
-        st.download_button(
-            "⬇️ קיימים CSV",
-            csv_existing,
-            "קיימים.csv",
-            "text/csv",
-            use_container_width=True
+        paths = st.select_slider(
+            "מספר מסלולים",
+            options=[1000, 5000, 10000, 50000, 100000],
+            value=10000,
+            key="mc_paths"
         )
-    
     with col2:
-        csv_new = df_new.to_csv(index=False).encode('utf-8-sig')
-        st.download_button(
-            "⬇️ חדשות CSV",
-            csv_new,
-            "חדשות.csv",
-            "text/csv",
-            use_container_width=True
+        uptake_sd = st.number_input(
+            "סטיית תקן - לוקחי הלוואה (נק' אחוז)",
+            min_value=0.0,
+            max_value=50.0,
+            value=10.0,
+            step=1.0,
+            key="mc_uptake_sd"
         )
-    
     with col3:
-        csv_combined = df_combined.to_csv(index=False).encode('utf-8-sig')
-        st.download_button(
-            "⬇️ מאוחד CSV",
-            csv_combined,
-            "מאוחד.csv",
-            "text/csv",
-            use_container_width=True
+        wedding_sd = st.number_input(
+            "סטיית תקן - גיל חתונה (שנים)",
+            min_value=0.0,
+            max_value=5.0,
+            value=1.0,
+            step=0.5,
+            key="mc_wedding_sd",
+            help="הזזת גיל החתונה בכל מסלול, כשאין טבלת פיזור. עם טבלת פיזור - רעש על אחוזי הטבלה"
         )
+    with col4:
+        seed = st.number_input("Seed", min_value=0, max_value=1000000, value=0, step=1, key="mc_seed")
     
-    # Excel מלא
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        st.session_state.df_existing_loans.to_excel(writer, index=False, sheet_name='ילדים קיימים')
-        st.session_state.df_yearly_params.to_excel(writer, index=False, sheet_name='פרמטרים חדשות')
-        df_existing.to_excel(writer, index=False, sheet_name='תזרים קיימים')
-        df_new.to_excel(writer, index=False, sheet_name='תזרים חדשות')
-        df_combined.to_excel(writer, index=False, sheet_name='מאוחד')
-    
-    st.download_button(
-        "⬇️ הורד דוח Excel מלא",
-        output.getvalue(),
-        "דוח_קהילה.xlsx",
-        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        use_container_width=True
+    settings = MonteCarloSettings(
+        paths=int(paths), seed=int(seed), loan_uptake_sd=float(uptake_sd), wedding_age_sd=float(wedding_sd)
     )
+    with st.spinner("מריץ סימולציה..."):
+        result = run_monte_carlo_cached(ScenarioParams.from_state(st.session_state), settings)
+    df_bands = _filter_by_display_years(result.df_bands)
     
-    # === טבלת נתונים מלאה ===
-    st.subheader("📋 טבלת נתונים מלאה")
-    st.dataframe(df_combined, use_container_width=True, height=400)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("הסתברות ליתרה שלילית בשנה כלשהי", f"{result.probability_ever_negative:.1%}")
+    with col2:
+        st.metric("זמן חישוב", f"{result.elapsed_seconds:.2f} שנ'")
+    
+    # === גרף מניפה ===
+    fig = go.Figure()
+    fig.add_trace(charts.line(
+        df_bands['שנה'], df_bands['יתרת_קופה_P95'], name='P95', color='rgba(46, 134, 171, 0.4)', width=1,
+        hovertemplate='<b>P95:</b> ₪%{y:,.0f}<extra></extra>'
+    ))
+    fig.add_trace(charts.line(
+        df_bands['שנה'], df_bands['יתרת_קופה_P5'], name='P5', color='rgba(46, 134, 171, 0.4)', width=1,
+        fill='tonexty', fillcolor='rgba(46, 134, 171, 0.2)',
+        hovertemplate='<b>P5:</b> ₪%{y:,.0f}<extra></extra>'
+    ))
+    fig.add_trace(charts.line(
+        df_bands['שנה'], df_bands['יתרת_קופה_P50'], name='חציון', color='#2E86AB', width=3,
+        hovertemplate='<b>חציון:</b> ₪%{y:,.0f}<extra></extra>'
+    ))
+    fig.add_trace(charts.line(
+        df_combined['שנה'], df_combined['יתרת_קופה'], name='דטרמיניסטי', color='#F59E0B', width=2, dash='dot',
+        hovertemplate='<b>דטרמיניסטי:</b> ₪%{y:,.0f}<extra></extra>'
+    ))
+    fig.add_hline(y=0, line_dash="dash", line_color="red")
+    fig.update_layout(height=450, xaxis_title="שנה", yaxis_title="יתרת קופה (₪)",
+                      legend=charts.HORIZONTAL_LEGEND)
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(
+        "גיל החתונה מוגרל כהזזה שלמה לכל מסלול כשאין טבלת פיזור, "
+        "וכשיש טבלה - כרעש דיריכלה על אחוזי הטבלה"
+    )
+    
+    # === הסתברות לגירעון לפי שנה ===
+    fig2 = go.Figure()
+    fig2.add_trace(charts.bars(
+        df_bands['שנה'], df_bands['הסתברות_יתרה_שלילית'] * 100, color='#D00000', decimals=1,
+        hovertemplate='<b>שנה:</b> %{x}<br><b>הסתברות:</b> %{y:.1f}%<extra></extra>'
+    ))
+    fig2.update_layout(height=300, xaxis_title="שנה", yaxis_title="הסתברות ליתרה שלילית (%)", showlegend=False)
+    st.plotly_chart(fig2, use_container_width=True)
+
+
+def _distribution_figure(df_dist: pd.DataFrame, title: str, scale: str, height: int):
+    """גרף עמודות של טבלת פיזור גיל חתונה (נשמר במטמון לפי תוכן הטבלה)"""
+    import plotly.express as px
+    
+    fig = px.bar(
+        df_dist,
+        x='גיל_חתונה',
+        y='אחוז',
+        title=title,
+        labels={'גיל_חתונה': 'גיל חתונה', 'אחוז': 'אחוז ילדים (%)'},
+        color='אחוז',
+        color_continuous_scale=scale
+    )
+    fig.update_layout(height=height, showlegend=False, coloraxis_showscale=False)
+    return fig
 
 
 def render_distribution_tab():
     """
     טאב פיזור גיל נישואין - 2 פעמונים: קיימות וחדשות
     """
-    import plotly.express as px
-    
     st.header("🔔 פיזור גיל נישואין")
     st.markdown("""
 **פיזור ריאליסטי של גילאי החתונה** – במקום להניח שכולם מתחתנים באותו גיל בדיוק,
@@ -506,12 +831,9 @@ def render_distribution_tab():
                 "custom": "✏️ מותאם אישית"
             }[x],
             index=["none", "bell", "custom"].index(st.session_state.existing_distribution_mode),
-            key="existing_dist_mode_select"
+            key="existing_dist_mode_select",
+            on_change=sync_widget("existing_dist_mode_select", "existing_distribution_mode")
         )
-        
-        if existing_dist_mode != st.session_state.existing_distribution_mode:
-            st.session_state.existing_distribution_mode = existing_dist_mode
-            st.rerun()
     
     with col2:
         if existing_dist_mode == "none":
@@ -523,16 +845,7 @@ def render_distribution_tab():
             df_dist = st.session_state.existing_distribution_df.copy()
             df_dist['גיל_חתונה'] = 21 + df_dist['סטייה_שנים']
             
-            fig = px.bar(
-                df_dist,
-                x='גיל_חתונה',
-                y='אחוז',
-                title="פיזור גיל חתונה - קיימות",
-                labels={'גיל_חתונה': 'גיל חתונה', 'אחוז': 'אחוז ילדים (%)'},
-                color='אחוז',
-                color_continuous_scale='Purples'
-            )
-            fig.update_layout(height=300, showlegend=False, coloraxis_showscale=False)
+            fig = charts.cached_figures('distribution', _distribution_figure, df_dist, "פיזור גיל חתונה - קיימות", 'Purples', 300)
             st.plotly_chart(fig, use_container_width=True)
             
             total_pct = df_dist['אחוז'].sum()
@@ -566,15 +879,7 @@ def render_distribution_tab():
             df_dist = edited_existing_dist.copy()
             df_dist['גיל_חתונה'] = 21 + df_dist['סטייה_שנים']
             
-            fig = px.bar(
-                df_dist,
-                x='גיל_חתונה',
-                y='אחוז',
-                title="פיזור גיל חתונה - קיימות (מותאם)",
-                color='אחוז',
-                color_continuous_scale='Purples'
-            )
-            fig.update_layout(height=250, showlegend=False, coloraxis_showscale=False)
+            fig = charts.cached_figures('distribution', _distribution_figure, df_dist, "פיזור גיל חתונה - קיימות (מותאם)", 'Purples', 250)
             st.plotly_chart(fig, use_container_width=True)
     
     # =====================================================
@@ -582,7 +887,7 @@ def render_distribution_tab():
     # =====================================================
     st.markdown("---")
     st.subheader("👨‍👩‍👧‍👦 פיזור למשפחות חדשות")
-    st.caption(f"משפחות שמצטרפות מ-2026 - פיזור גיל חתונה סביב גיל {st.session_state.wedding_age}")
+    st.caption(f"משפחות שמצטרפות מ-{st.session_state.start_year} - פיזור גיל חתונה סביב גיל {st.session_state.wedding_age}")
     
     col1, col2 = st.columns([1, 2])
     
@@ -596,12 +901,9 @@ def render_distribution_tab():
                 "custom": "✏️ מותאם אישית"
             }[x],
             index=["none", "bell", "custom"].index(st.session_state.distribution_mode),
-            key="new_dist_mode_select"
+            key="new_dist_mode_select",
+            on_change=sync_widget("new_dist_mode_select", "distribution_mode")
         )
-        
-        if new_dist_mode != st.session_state.distribution_mode:
-            st.session_state.distribution_mode = new_dist_mode
-            st.rerun()
     
     with col2:
         if new_dist_mode == "none":
@@ -613,16 +915,7 @@ def render_distribution_tab():
             df_dist = st.session_state.distribution_df.copy()
             df_dist['גיל_חתונה'] = st.session_state.wedding_age + df_dist['סטייה_שנים']
             
-            fig = px.bar(
-                df_dist,
-                x='גיל_חתונה',
-                y='אחוז',
-                title=f"פיזור גיל חתונה - חדשות (סביב גיל {st.session_state.wedding_age})",
-                labels={'גיל_חתונה': 'גיל חתונה', 'אחוז': 'אחוז ילדים (%)'},
-                color='אחוז',
-                color_continuous_scale='Oranges'
-            )
-            fig.update_layout(height=300, showlegend=False, coloraxis_showscale=False)
+            fig = charts.cached_figures('distribution', _distribution_figure, df_dist, f"פיזור גיל חתונה - חדשות (סביב גיל {st.session_state.wedding_age})", 'Oranges', 300)
             st.plotly_chart(fig, use_container_width=True)
             
             total_pct = df_dist['אחוז'].sum()
@@ -656,15 +949,7 @@ def render_distribution_tab():
             df_dist = edited_new_dist.copy()
             df_dist['גיל_חתונה'] = st.session_state.wedding_age + df_dist['סטייה_שנים']
             
-            fig = px.bar(
-                df_dist,
-                x='גיל_חתונה',
-                y='אחוז',
-                title="פיזור גיל חתונה - חדשות (מותאם)",
-                color='אחוז',
-                color_continuous_scale='Oranges'
-            )
-            fig.update_layout(height=250, showlegend=False, coloraxis_showscale=False)
+            fig = charts.cached_figures('distribution', _distribution_figure, df_dist, "פיזור גיל חתונה - חדשות (מותאם)", 'Oranges', 250)
             st.plotly_chart(fig, use_container_width=True)
     
     # =====================================================
@@ -723,3 +1008,228 @@ def render_distribution_tab():
 </div>
         """, unsafe_allow_html=True)
 
+
+@st.fragment
+def render_balance_calculator_tab():
+    """
+    טאב מחשבון איזון - ערכי יעד שמשאירים את יתרת הקופה מעל רצפה
+    """
+    st.header("⚖️ מחשבון איזון")
+    st.markdown("""
+**מה צריך לשנות כדי שהקופה לא תרד מתחת לרצפה?** כל ערך מחושב בנפרד,
+כשכל שאר הפרמטרים נשארים כמו בסיידבר.
+""")
+    
+    floor = st.number_input(
+        "רצפת יתרה מינימלית (₪)",
+        min_value=0,
+        value=SOLVER_DEFAULT_FLOOR,
+        step=50000,
+        key="solver_floor",
+        help="יתרת הקופה צריכה להישאר מעל הסכום הזה בכל שנות התחזית"
+    )
+    
+    params = ScenarioParams.from_state(st.session_state)
+    solved = solve_all_cached(params, int(floor))
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        result = solved['initial_balance']
+        st.metric(
+            "יתרת פתיחה מינימלית",
+            f"₪{result.value:,.0f}",
+            delta=f"₪{result.value - params.initial_balance:,.0f}",
+            delta_color="inverse"
+        )
+        st.caption(f"נוכחי: ₪{params.initial_balance:,.0f}")
+    
+    with col2:
+        result = solved['default_family_fee']
+        if result.feasible:
+            st.metric(
+                "דמי מנוי משפחתי מינימליים",
+                f"₪{result.value:,.0f}",
+                delta=f"₪{result.value - params.default_family_fee:,.0f}",
+                delta_color="inverse"
+            )
+        else:
+            st.metric("דמי מנוי משפחתי מינימליים", "—")
+            st.warning("גם דמי מנוי גבוהים מאוד לא מספיקים - הגירעון נובע מהקיימים")
+        st.caption(f"נוכחי: ₪{params.default_family_fee:,.0f} (לכל השנים)")
+    
+    with col3:
+        result = solved['default_loan_amount']
+        if result.feasible:
+            st.metric(
+                "גובה הלוואה מקסימלי לחדשות",
+                f"₪{result.value:,.0f}",
+                delta=f"₪{result.value - params.default_loan_amount:,.0f}"
+            )
+        else:
+            st.metric("גובה הלוואה מקסימלי לחדשות", "—")
+            st.warning("גם בלי הלוואות לחדשות היתרה יורדת מתחת לרצפה")
+        st.caption(f"נוכחי: ₪{params.default_loan_amount:,.0f} (לכל השנים)")
+    
+    evaluations = sum(r.evaluations for r in solved.values())
+    elapsed = sum(r.elapsed_seconds for r in solved.values())
+    st.caption(f"חושב ב-{evaluations} הרצות מנוע ({elapsed * 1000:.0f}ms)")
+    
+    st.markdown("---")
+    _render_sensitivity_section(params)
+
+
+def _render_sensitivity_section(params: ScenarioParams):
+    """ניתוח רגישות - גרף טורנדו של השפעת כל פרמטר"""
+    st.subheader("🌪️ ניתוח רגישות")
+    st.markdown("איזה פרמטר משפיע הכי הרבה? כל פרמטר מוזז בנפרד למטה ולמעלה, והשאר נשארים כמו בסיידבר.")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        pct = st.slider("גודל ההזזה (%)", min_value=5, max_value=50, value=10, step=5, key="sensitivity_pct")
+    with col2:
+        metric = st.radio(
+            "מדד",
+            ["min_balance", "final_balance"],
+            format_func=lambda m: {"min_balance": "יתרה מינימלית", "final_balance": "יתרה סופית"}[m],
+            horizontal=True,
+            key="sensitivity_metric"
+        )
+    
+    result = run_sensitivity_cached(params, float(pct))
+    base = result.base_min_balance if metric == "min_balance" else result.base_final_balance
+    table = result.table.sort_values(f'{metric}_swing', ascending=True)   # הגדול למעלה
+    
+    def value_text(value):
+        return f"{value:,.0f}" if float(value).is_integer() else f"{value:,.1f}"
+    
+    fig = go.Figure()
+    for side, name, color in (("low", "הזזה למטה", "#D00000"), ("high", "הזזה למעלה", "#2E86AB")):
+        fig.add_trace(go.Bar(
+            y=table['label'],
+            x=table[f'{metric}_{side}'] - base,
+            base=base,
+            orientation='h',
+            name=name,
+            marker_color=color,
+            customdata=[value_text(v) for v in table[f'{side}_value']],
+            hovertemplate='<b>%{y}</b> = %{customdata}<br>₪%{x:,.0f}<extra></extra>'
+        ))
+    fig.add_vline(x=base, line_dash="dash", line_color="gray")
+    fig.update_layout(
+        barmode='overlay', height=420,
+        xaxis_title="יתרה מינימלית (₪)" if metric == "min_balance" else "יתרה סופית (₪)"
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"{len(table) * 2} הרצות מוזזות בקריאת מנוע אחת ({result.elapsed_seconds * 1000:.0f}ms)")
+    
+    _render_sobol_section(params, metric)
+
+
+def _render_sobol_section(params: ScenarioParams, metric: str):
+    """מדדי Sobol - רגישות גלובלית כולל אינטראקציות (לפי דרישה, כי זה אלפי הרצות)"""
+    enabled = st.toggle(
+        "🎲 רגישות גלובלית (Sobol)",
+        value=False,
+        key="sobol_enabled",
+        help="כל הפרמטרים מוגרלים יחד; ST גדול מ-S1 מעיד על אינטראקציות בין פרמטרים"
+    )
+    if not enabled:
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        num_samples = st.select_slider("N (דגימות בסיס)", options=[256, 512, 1024, 2048, 4096], value=1024, key="sobol_samples")
+    with col2:
+        width = st.slider("רוחב טווח (±%)", min_value=5, max_value=50, value=25, step=5, key="sobol_width")
+    with col3:
+        seed = st.number_input("Seed", min_value=0, max_value=1000000, value=0, step=1, key="sobol_seed")
+    
+    with st.spinner("מריץ דגימת Saltelli..."):
+        result = run_sobol_cached(params, int(num_samples), width / 100, int(seed))
+    
+    df = result.indices[result.indices['output'] == metric].sort_values('ST', ascending=True)
+    fig = go.Figure()
+    for key, name, color in (("S1", "סדר ראשון (S1)", "#2E86AB"), ("ST", "כולל (ST)", "#F18F01")):
+        fig.add_trace(go.Bar(
+            y=df['label'], x=df[key], orientation='h', name=name, marker_color=color,
+            error_x=dict(type='data', array=df[f'{key}_conf']),
+            hovertemplate='<b>%{y}</b><br>%{x:.3f}<extra></extra>'
+        ))
+    fig.update_layout(barmode='group', height=520, xaxis_title="חלק מהשונות")
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"{result.evaluations:,} הרצות מודל ({result.elapsed_seconds:.1f} שניות), seed={result.seed}")
+
+
+# שם התרחיש שבסיידבר כרגע (לא שמור) בבחירת תרחישים להשוואה
+CURRENT_SCENARIO = "📍 נוכחי (לא שמור)"
+
+
+@st.fragment
+def render_compare_tab():
+    """
+    טאב השוואת תרחישים - עד 8 תרחישים שמורים בגרף אחד וטבלת הפרשים
+    """
+    st.header("🆚 השוואת תרחישים")
+    store = default_store()
+    options = [CURRENT_SCENARIO] + store.list_scenarios()['name'].tolist()
+    
+    if len(options) < 2:
+        st.info("💾 שמור לפחות תרחיש אחד בסיידבר (תרחישים שמורים) כדי להשוות אותו לתרחיש הנוכחי")
+        return
+    
+    selected = st.multiselect(
+        "תרחישים להשוואה",
+        options,
+        default=options[:2],
+        max_selections=MAX_SCENARIOS,
+        key="compare_selected",
+        help=f"2 עד {MAX_SCENARIOS} תרחישים"
+    )
+    if len(selected) < 2:
+        st.warning("יש לבחור לפחות 2 תרחישים")
+        return
+    
+    baseline = st.selectbox("תרחיש בסיס להפרשים", selected, key="compare_baseline")
+    
+    scenarios = {
+        name: ScenarioParams.from_state(st.session_state) if name == CURRENT_SCENARIO else store.load_scenario(name)
+        for name in selected
+    }
+    with st.spinner("מחשב תרחישים..."):
+        results = compute_scenarios(scenarios)
+    shown = {
+        name: ProjectionResult(r.df_existing, r.df_new, _filter_by_display_years(r.df_combined))
+        for name, r in results.items()
+    }
+    
+    # === גרף משותף: עמודה לכל שורה, צבע לכל תרחיש ===
+    fig = make_subplots(
+        rows=len(COMPARE_COLUMNS), cols=1, shared_xaxes=True, vertical_spacing=0.06,
+        subplot_titles=[col.replace('_', ' ') for col in COMPARE_COLUMNS]
+    )
+    for i, (name, result) in enumerate(shown.items()):
+        color = qualitative.Plotly[i % len(qualitative.Plotly)]
+        df = result.df_combined
+        for row, col in enumerate(COMPARE_COLUMNS, start=1):
+            fig.add_trace(charts.line(
+                df['שנה'], df[col], name=name, color=color, width=3 if name == baseline else 2,
+                legendgroup=name, showlegend=row == 1,
+                hovertemplate=f'<b>{name}</b><br>שנה: %{{x}}<br>₪%{{y:,.0f}}<extra></extra>'
+            ), row=row, col=1)
+    fig.add_hline(y=0, line_dash="dash", line_color="red", row=1, col=1)
+    fig.update_layout(height=900, hovermode='x unified')
+    fig.update_xaxes(title_text="שנה", row=len(COMPARE_COLUMNS), col=1)
+    st.plotly_chart(fig, use_container_width=True)
+    
+    # === טבלת הפרשים מול הבסיס ===
+    st.subheader(f"📋 הפרשים מול: {baseline}")
+    table = delta_table(shown, baseline)
+    money_columns = [c for c in table.columns if c not in ('תרחיש', 'שנה_שלילית_ראשונה')]
+    st.dataframe(
+        table,
+        column_config={c: st.column_config.NumberColumn(c.replace('_', ' '), format="₪%d") for c in money_columns},
+        hide_index=True,
+        use_container_width=True
+    )
+
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks - מדידת זמן וזיכרון של מנועי החישוב
+
+    python -m benchmarks.run                  # מדידה והשוואה להרצה הקודמת
+    python -m benchmarks.run --threshold 0.3  # כישלון אם האטה מעל 30%
+    python -m benchmarks.run --reference      # כולל מנועי הלולאה המקוריים
+"""
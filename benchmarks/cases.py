@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+cases.py - מטריצת המקרים למדידה
+
+כל מקרה הוא שם יציב (מפתח בהיסטוריה) ופונקציה בלי ארגומנטים שמריצה
+את החישוב. הקלטים נבנים מראש, כך שהמדידה כוללת רק את המנוע עצמו.
+"""
+
+import itertools
+from typing import Callable, Dict
+
+import numpy as np
+import pandas as pd
+
+from app.core import ScenarioParams, _merge_projections, default_yearly_params
+from app.existing import compute_existing_projection, compute_existing_projection_vectorized
+from app.microsim import run_microsim
+from app.new import compute_new_projection, compute_new_projection_vectorized
+
+
+START_YEAR = 2026
+
+# ממדי המטריצה
+HORIZONS = (50, 100, 200)
+DISTRIBUTION_ROWS = (1, 11, 40)
+JOINER_SCALES = (1, 100)
+ROSTER_ROWS = (21, 1000, 20000)
+MICROSIM_SCALES = (1, 5)          # ~21 אלף / ~105 אלף משפחות ב-50 שנה
+
+
+def distribution_table(rows: int) -> pd.DataFrame:
+    """טבלת פיזור עם rows סטיות (מ-2-), סה"כ 95%"""
+    shape = np.hanning(rows + 2)[1:-1] if rows > 1 else np.ones(1)
+    return pd.DataFrame({
+        'סטייה_שנים': np.arange(rows) - 2,
+        'אחוז': 95 * shape / shape.sum(),
+    })
+
+
+def yearly_table(horizon: int, joiner_scale: float) -> pd.DataFrame:
+    """טבלה שנתית ל-horizon שנים; המצטרפים מוכפלים ב-joiner_scale"""
+    df = default_yearly_params(start_year=START_YEAR, end_year=START_YEAR + horizon - 1)
+    df['מצטרפים_חדשים'] = (df['מצטרפים_חדשים'] * joiner_scale).astype(np.int64)
+    return df
+
+
+def roster_table(rows: int, seed: int = 0) -> pd.DataFrame:
+    """טבלת קיימים סינתטית עם rows שורות (שנות הלוואה 2026-2046)"""
+    rng = np.random.default_rng(seed)
+    loan_years = rng.integers(2026, 2047, size=rows)
+    return pd.DataFrame({
+        'שנת_לידה': loan_years - 21,
+        'שנת_הלוואה': loan_years,
+        'מספר_ילדים': rng.integers(1, 200, size=rows),
+        'דמי_מנוי_חודשי': rng.integers(0, 20, size=rows) * 5,
+    })
+
+
+def new_engine_cases(engine: Callable = compute_new_projection_vectorized, prefix: str = 'new') -> Dict[str, Callable]:
+    cases = {}
+    for horizon, dist_rows, scale in itertools.product(HORIZONS, DISTRIBUTION_ROWS, JOINER_SCALES):
+        df_yearly = yearly_table(horizon, scale)
+        df_dist = distribution_table(dist_rows)
+        cases[f'{prefix}/h{horizon}/d{dist_rows}/j{scale}'] = (
+            lambda df_yearly=df_yearly, df_dist=df_dist, horizon=horizon: engine(
+                df_yearly, wedding_age=20, avg_children=8, months_between_children=34,
+                fee_refund_percentage=90, start_year=START_YEAR, end_year=START_YEAR + horizon - 1,
+                distribution_mode="custom", distribution_df=df_dist
+            )
+        )
+    return cases
+
+
+def existing_engine_cases(engine: Callable = compute_existing_projection_vectorized, prefix: str = 'existing') -> Dict[str, Callable]:
+    cases = {}
+    for horizon, dist_rows, rows in itertools.product(HORIZONS, DISTRIBUTION_ROWS, ROSTER_ROWS):
+        df_roster = roster_table(rows)
+        df_dist = distribution_table(dist_rows)
+        cases[f'{prefix}/h{horizon}/d{dist_rows}/r{rows}'] = (
+            lambda df_roster=df_roster, df_dist=df_dist, horizon=horizon: engine(
+                df_roster, loan_amount=100000, repayment_months=80,
+                start_year=START_YEAR, end_year=START_YEAR + horizon - 1,
+                distribution_mode="custom", distribution_df=df_dist
+            )
+        )
+    return cases
+
+
+def merge_cases() -> Dict[str, Callable]:
+    cases = {}
+    for horizon in HORIZONS:
+        end_year = START_YEAR + horizon - 1
+        df_existing = compute_existing_projection_vectorized(
+            roster_table(21), 100000, 80, start_year=START_YEAR, end_year=end_year
+        )
+        df_new = compute_new_projection_vectorized(
+            yearly_table(horizon, 1), start_year=START_YEAR, end_year=end_year
+        )
+        cases[f'merge/h{horizon}'] = (
+            lambda df_existing=df_existing, df_new=df_new: _merge_projections(df_existing, df_new, 0)
+        )
+    return cases
+
+
+def microsim_cases() -> Dict[str, Callable]:
+    cases = {}
+    for horizon, scale in itertools.product(HORIZONS[:2], MICROSIM_SCALES):
+        params = ScenarioParams(
+            end_year=START_YEAR + horizon - 1,
+            df_yearly_params=yearly_table(horizon, scale),
+            distribution_mode="custom",
+            distribution_df=distribution_table(11)
+        )
+        cases[f'microsim/h{horizon}/j{scale}'] = lambda params=params: run_microsim(params)
+    return cases
+
+
+def reference_cases() -> Dict[str, Callable]:
+    """מנועי הלולאה המקוריים - רק האופק הקצר, הם איטיים בסדרי גודל"""
+    cases = {}
+    cases.update({
+        name: fn for name, fn in new_engine_cases(compute_new_projection, 'new-loop').items()
+        if name.startswith('new-loop/h50/') and '/d40/' not in name
+    })
+    cases.update({
+        name: fn for name, fn in existing_engine_cases(compute_existing_projection, 'existing-loop').items()
+        if name.startswith('existing-loop/h50/') and '/r20000' not in name and '/d40/' not in name
+    })
+    return cases
+
+
+def all_cases(reference: bool = False) -> Dict[str, Callable]:
+    cases = {}
+    cases.update(new_engine_cases())
+    cases.update(existing_engine_cases())
+    cases.update(merge_cases())
+    cases.update(microsim_cases())
+    if reference:
+        cases.update(reference_cases())
+    return cases
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+run.py - הרצת הבנצ'מרקים, שמירה להיסטוריה ושער האטה
+
+זמן וזיכרון נמדדים בהרצות נפרדות: tracemalloc מאט את הקוד, ולכן הזמן
+נמדד בלעדיו (חציון של כמה חזרות), והשיא נמדד בהרצה אחת נוספת איתו.
+
+כל הרצה נוספת לקובץ היסטוריה מקומי (JSON, לא נשמר ב-git). ההשוואה היא
+מול בסיס: החציון של baseline-runs המדידות האחרונות של אותו מקרה, או
+ההרצה של commit מסוים (--baseline). מקרה שהחציון שלו גדל ביותר
+מ-threshold (וגם ביותר מ-min-delta-ms) נחשב האטה, והיציאה היא עם קוד 1.
+
+הרצה עם האטה לא נשמרת בהיסטוריה (אלא עם --accept), כך שהרצה חוזרת לא
+"מקבלת" אותה. הבסיס מכמה הרצות מונע גם זחילה הדרגתית מתחת לסף.
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .cases import all_cases
+
+
+DEFAULT_HISTORY = Path(__file__).with_name('history.json')
+
+
+def time_case(fn: Callable, min_time: float = 0.2, max_repeats: int = 50) -> Dict[str, float]:
+    """
+    חציון זמן ריצה: חימום אחד ואז חזרות עד min_time שניות (לפחות 3)
+    """
+    fn()
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < 3 or (time.perf_counter() - started < min_time and len(samples) < max_repeats):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return {'median_ms': statistics.median(samples) * 1000, 'repeats': len(samples)}
+
+
+def peak_memory(fn: Callable) -> float:
+    """שיא הקצאות (KB) בהרצה אחת תחת tracemalloc"""
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, cwd=Path(__file__).parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path: Path) -> List[Dict[str, Any]]:
+    if not path.exists():
+        return []
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_history(path: Path, history: List[Dict[str, Any]]) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, ensure_ascii=False, indent=1)
+
+
+def baseline_results(
+    history: List[Dict[str, Any]],
+    runs: int = 5,
+    commit: Optional[str] = None
+) -> Dict[str, Dict[str, Any]]:
+    """
+    בסיס ההשוואה לכל מקרה בהיסטוריה (הרצות עם --filter מכסות רק חלק)
+
+    Args:
+        history: רשומות ההיסטוריה לפי סדר
+        runs: מספר המדידות האחרונות של כל מקרה שהחציון שלהן הוא הבסיס
+        commit: במקום זאת - המדידה האחרונה מהרצות של commit זה
+
+    Raises:
+        ValueError: אם אין בהיסטוריה הרצה של commit
+    """
+    if commit is not None:
+        records = [record for record in history if record.get('commit') == commit]
+        if not records:
+            raise ValueError(f"אין בהיסטוריה הרצה של commit {commit}")
+        pinned = {}
+        for record in records:
+            pinned.update(record['results'])
+        return pinned
+
+    samples: Dict[str, List[Dict[str, float]]] = {}
+    for record in history:
+        for name, result in record['results'].items():
+            samples.setdefault(name, []).append(result)
+    return {
+        name: {
+            'median_ms': statistics.median(r['median_ms'] for r in results[-runs:]),
+            'peak_kb': statistics.median(r['peak_kb'] for r in results[-runs:]),
+        }
+        for name, results in samples.items()
+    }
+
+
+def run_cases(cases: Dict[str, Callable], min_time: float) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name, fn in cases.items():
+        timing = time_case(fn, min_time=min_time)
+        results[name] = {**timing, 'peak_kb': peak_memory(fn)}
+        print(f"  {name:<34} {timing['median_ms']:>10.2f} ms  {results[name]['peak_kb']:>10.0f} KB", flush=True)
+    return results
+
+
+def compare(
+    current: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    threshold: float,
+    min_delta_ms: float,
+    memory_threshold: Optional[float] = None
+) -> pd.DataFrame:
+    """
+    השוואה מול הרצת בסיס
+
+    Returns:
+        טבלה לכל מקרה משותף: זמנים, זיכרון, יחס ודגל האטה
+    """
+    rows = []
+    for name in sorted(set(current) & set(baseline)):
+        now, before = current[name], baseline[name]
+        ratio = now['median_ms'] / before['median_ms'] if before['median_ms'] > 0 else np.inf
+        slower = ratio > 1 + threshold and now['median_ms'] - before['median_ms'] > min_delta_ms
+        memory_ratio = now['peak_kb'] / before['peak_kb'] if before['peak_kb'] > 0 else np.inf
+        if memory_threshold is not None and memory_ratio > 1 + memory_threshold:
+            slower = True
+        rows.append({
+            'case': name,
+            'before_ms': round(before['median_ms'], 2),
+            'now_ms': round(now['median_ms'], 2),
+            'time_ratio': round(ratio, 2),
+            'before_kb': round(before['peak_kb']),
+            'now_kb': round(now['peak_kb']),
+            'memory_ratio': round(memory_ratio, 2),
+            'regression': slower,
+        })
+    return pd.DataFrame(rows)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description="בנצ'מרק למנועי החישוב")
+    parser.add_argument('--history', type=Path, default=DEFAULT_HISTORY, help='קובץ היסטוריה (JSON)')
+    parser.add_argument('--threshold', type=float, default=0.25, help='האטה יחסית מותרת (0.25 = 25%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=0.5, help='האטה מוחלטת מינימלית שנחשבת (ms)')
+    parser.add_argument('--memory-threshold', type=float, default=None, help='גידול יחסי מותר בשיא הזיכרון (ברירת מחדל: ללא שער)')
+    parser.add_argument('--min-time', type=float, default=0.2, help='זמן מדידה מינימלי לכל מקרה (שניות)')
+    parser.add_argument('--filter', default='', help='רק מקרים ששמם מכיל את המחרוזת')
+    parser.add_argument('--reference', action='store_true', help='כולל מנועי הלולאה המקוריים')
+    parser.add_argument('--baseline', default=None, metavar='COMMIT', help='השוואה מול ההרצה של commit זה')
+    parser.add_argument('--baseline-runs', type=int, default=5, help='בסיס: חציון N המדידות האחרונות של כל מקרה')
+    parser.add_argument('--no-save', action='store_true', help='לא לשמור את ההרצה בהיסטוריה')
+    parser.add_argument('--accept', action='store_true', help='לשמור בהיסטוריה גם הרצה עם האטה')
+    args = parser.parse_args(argv)
+
+    cases = {name: fn for name, fn in all_cases(args.reference).items() if args.filter in name}
+    print(f"{len(cases)} מקרים")
+    results = run_cases(cases, args.min_time)
+
+    history = load_history(args.history)
+    exit_code = 0
+    try:
+        baseline = baseline_results(history, max(args.baseline_runs, 1), args.baseline)
+    except ValueError as error:
+        print(f"❌ {error}", file=sys.stderr)
+        return 2
+    report = compare(results, baseline, args.threshold, args.min_delta_ms, args.memory_threshold)
+    if len(report):
+        if args.baseline:
+            print(f"\nהשוואה מול commit {args.baseline}:")
+        else:
+            print(f"\nהשוואה מול חציון {args.baseline_runs} המדידות האחרונות של כל מקרה:")
+        with pd.option_context('display.max_rows', None, 'display.width', 200):
+            print(report.to_string(index=False))
+        regressions = report[report['regression']]
+        if len(regressions):
+            print(f"\n❌ {len(regressions)} מקרים חורגים מהסף", file=sys.stderr)
+            exit_code = 1
+
+    if exit_code != 0 and not args.accept:
+        print("ההרצה לא נשמרה בהיסטוריה (--accept כדי לשמור בכל זאת)", file=sys.stderr)
+    elif not args.no_save:
+        history.append({
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'results': results,
+        })
+        save_history(args.history, history)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
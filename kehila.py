@@ -8,7 +8,9 @@
 - טאב 1: קיימים (ילדים 2005-2025)
 - טאב 2: חדשות (משפחות מ-2026)
 - טאב 3: מאוחד (כולל ניתוח וייצוא)
-- טאב 4: מחשבון איזון (ערכי יעד)
+- טאב 4: פיזור גיל נישואין
+- טאב 5: מחשבון איזון (ערכי יעד)
+- טאב 6: השוואת תרחישים שמורים
 """
 
 import streamlit as st
@@ -600,9 +602,13 @@ st.markdown("""
 # =============================================================================
 # Import modules
 # =============================================================================
-from app.state import init_session_state, render_sidebar
+from app.state import init_session_state, render_sidebar, render_debug_panel
 from app.projection import compute_projections
-from app.ui_tabs import render_existing_tab, render_new_tab, render_combined_tab, render_distribution_tab
+from app.instrument import begin_recording, end_recording, stage
+from app.ui_tabs import (
+    render_existing_tab, render_new_tab, render_combined_tab,
+    render_distribution_tab, render_balance_calculator_tab, render_compare_tab
+)
 
 # =============================================================================
 # עמוד פתיחה עם סיסמא
@@ -753,10 +759,14 @@ if not st.session_state.authenticated:
 # =============================================================================
 init_session_state()
 
+# מדידת ביצועים - רק כשהכתובת כוללת ?debug=1
+debug_recorder = begin_recording('rerun', enabled=st.query_params.get('debug') == '1')
+
 # =============================================================================
 # סיידבר
 # =============================================================================
-render_sidebar()
+with stage('sidebar'):
+    render_sidebar()
 
 # =============================================================================
 # תוכן ראשי
@@ -769,25 +779,37 @@ with st.spinner("מחשב תחזיות..."):
     df_existing, df_new, df_combined = compute_projections()
 
 # יצירת טאבים
-tab1, tab2, tab3, tab4 = st.tabs([
+tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
     "קיימים",
     "חדשות",
     "📊 מאוחד",
-    "🔔 פיזור גיל נישואין"
+    "🔔 פיזור גיל נישואין",
+    "⚖️ מחשבון איזון",
+    "🆚 השוואת תרחישים"
 ])
 
-with tab1:
+with tab1, stage('tab.existing'):
     render_existing_tab(df_existing)
 
-with tab2:
+with tab2, stage('tab.new'):
     render_new_tab(df_new)
 
-with tab3:
+with tab3, stage('tab.combined'):
     render_combined_tab(df_combined, df_existing, df_new)
 
-with tab4:
+with tab4, stage('tab.distribution'):
     render_distribution_tab()
 
+with tab5, stage('tab.balance'):
+    render_balance_calculator_tab()
+
+with tab6, stage('tab.compare'):
+    render_compare_tab()
+
+if debug_recorder is not None:
+    end_recording(debug_recorder)
+    render_debug_panel(debug_recorder)
+
 # =============================================================================
 # Footer
 # =============================================================================